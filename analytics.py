@@ -0,0 +1,326 @@
+"""
+SLA and workload rollups for the analytics page (SQLite).
+
+Two small tables summarize the whole ticket history:
+
+    sla_rollup         histogram of time-to-start / time-to-resolve per
+                       dimension value (ticket type, category, vehicle,
+                       priority, assignee and 'all'), with the sum of the
+                       durations for the mean
+    ticket_daily_flow  per day: tickets created, tickets resolved, and how
+                       many of the tickets created that day are still open
+
+Like the full-text index they are kept up to date by SQLite triggers on
+`tickets`: every write (ticket detail, bulk actions, manual SQL) removes the
+old row's contribution and adds the new one in the same transaction, so the
+rollups always equal a full rebuild. The analytics page reads only these
+tables; percentiles are estimated from the histogram buckets.
+
+Tickets moved to the archive keep counting: the archive job adds their
+contribution back (`add_tickets`) after deleting them from `tickets`, and
+rebuilds read from every table listed in `sources`.
+"""
+
+import re
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import sqlalchemy as sa
+
+SLA_TABLE = 'sla_rollup'
+FLOW_TABLE = 'ticket_daily_flow'
+
+METRICS = ('start', 'resolve')
+DIMENSIONS = ('ticket_type', 'anomaly_category', 'vehicle_type', 'priority', 'assignee')
+
+# Upper bounds (seconds) of the duration buckets; the last bucket is open-ended
+SLA_BUCKETS = (
+    5 * 60, 15 * 60, 30 * 60, 3600, 2 * 3600, 4 * 3600, 8 * 3600,
+    86400, 2 * 86400, 3 * 86400, 5 * 86400, 7 * 86400, 14 * 86400, 30 * 86400, 60 * 86400, 90 * 86400,
+)
+# Upper bounds (days) of the open-ticket aging buckets; the last bucket is open-ended
+AGING_BUCKETS = (1, 3, 7, 14, 30)
+
+_CREATE_TABLES = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {SLA_TABLE} (
+        metric TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        tickets INTEGER NOT NULL DEFAULT 0,
+        total_seconds REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (metric, dimension, value, bucket)
+    ) WITHOUT ROWID
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {FLOW_TABLE} (
+        day TEXT PRIMARY KEY,
+        created INTEGER NOT NULL DEFAULT 0,
+        resolved INTEGER NOT NULL DEFAULT 0,
+        open_tickets INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """,
+]
+
+_DIMENSION_VALUES = {
+    'all': "''",
+    'ticket_type': '{row}.ticket_type',
+    'anomaly_category': '{row}.anomaly_category',
+    'vehicle_type': '{row}.vehicle_type',
+    'priority': '{row}.priority',
+    # '' = unassigned
+    'assignee': "coalesce(CAST({row}.assigned_to_id AS TEXT), '')",
+}
+
+
+def _seconds_between(row, start, end):
+    return f'(julianday({row}.{end}) - julianday({row}.{start})) * 86400.0'
+
+
+def _bucket_case(expression):
+    whens = ' '.join(f'WHEN {expression} < {bound} THEN {index}' for index, bound in enumerate(SLA_BUCKETS))
+    return f'CASE {whens} ELSE {len(SLA_BUCKETS)} END'
+
+
+def _sla_upsert(row, sign, source=None):
+    """INSERT adding `sign` times the durations of `row` (new/old in triggers, every row of `source` otherwise)"""
+    metrics = ' UNION ALL '.join(f"SELECT '{metric}' AS metric" for metric in METRICS)
+    dimensions = ' UNION ALL '.join(f"SELECT '{name}' AS dimension" for name in _DIMENSION_VALUES)
+    value = 'CASE d.dimension ' + ' '.join(
+        f"WHEN '{name}' THEN {expression.format(row=row)}" for name, expression in _DIMENSION_VALUES.items()
+    ) + ' END'
+    seconds = (f"max(0, CASE m.metric WHEN 'start' THEN {_seconds_between(row, 'created_at', 'started_at')} "
+               f"ELSE {_seconds_between(row, 'created_at', 'closed_at')} END)")
+    has_duration = (f"CASE m.metric WHEN 'start' THEN {row}.started_at IS NOT NULL "
+                    f"ELSE {row}.status = 'RISOLTO' AND {row}.closed_at IS NOT NULL END")
+    tickets = f'{source} {row}, ' if source else ''
+    return f"""
+        INSERT INTO {SLA_TABLE} (metric, dimension, value, bucket, tickets, total_seconds)
+        SELECT metric, dimension, value, {_bucket_case('seconds')} AS bucket, {sign} * count(*), {sign} * sum(seconds)
+        FROM (
+            SELECT m.metric, d.dimension, {value} AS value, {seconds} AS seconds
+            FROM {tickets}({metrics}) m, ({dimensions}) d
+            WHERE {has_duration}
+        )
+        WHERE value IS NOT NULL
+        GROUP BY metric, dimension, value, bucket
+        ON CONFLICT (metric, dimension, value, bucket) DO UPDATE SET
+            tickets = tickets + excluded.tickets,
+            total_seconds = total_seconds + excluded.total_seconds
+    """
+
+
+def _flow_upsert(row, sign, source=None):
+    """INSERT adding `sign` times the daily inflow/outflow contribution of `row`"""
+    tickets = f'FROM {source} {row}' if source else ''
+    return f"""
+        INSERT INTO {FLOW_TABLE} (day, created, resolved, open_tickets)
+        SELECT day, {sign} * sum(created), {sign} * sum(resolved), {sign} * sum(open_tickets)
+        FROM (
+            SELECT date({row}.created_at) AS day, 1 AS created, 0 AS resolved,
+                   {row}.status != 'RISOLTO' AS open_tickets
+            {tickets}
+            UNION ALL
+            SELECT date({row}.closed_at), 0, 1, 0
+            {tickets}
+            WHERE {row}.status = 'RISOLTO' AND {row}.closed_at IS NOT NULL
+        )
+        WHERE true
+        GROUP BY day
+        ON CONFLICT (day) DO UPDATE SET
+            created = created + excluded.created,
+            resolved = resolved + excluded.resolved,
+            open_tickets = open_tickets + excluded.open_tickets
+    """
+
+
+_TRACKED_COLUMNS = ('status', 'created_at', 'started_at', 'closed_at', 'ticket_type',
+                    'anomaly_category', 'vehicle_type', 'priority', 'assigned_to_id')
+
+_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tickets_analytics_ai AFTER INSERT ON tickets BEGIN
+        {_sla_upsert('new', 1)};
+        {_flow_upsert('new', 1)};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tickets_analytics_au
+    AFTER UPDATE OF {', '.join(_TRACKED_COLUMNS)} ON tickets
+    WHEN {' OR '.join(f'old.{column} IS NOT new.{column}' for column in _TRACKED_COLUMNS)} BEGIN
+        {_sla_upsert('old', -1)};
+        {_flow_upsert('old', -1)};
+        {_sla_upsert('new', 1)};
+        {_flow_upsert('new', 1)};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tickets_analytics_ad AFTER DELETE ON tickets BEGIN
+        {_sla_upsert('old', -1)};
+        {_flow_upsert('old', -1)};
+    END
+    """,
+]
+
+# Part of the app's schema fingerprint: a change here makes the next boot run migrate_db
+SCHEMA_DDL = _CREATE_TABLES + _TRIGGERS
+
+_TRIGGER_NAMES = [re.search(r'CREATE TRIGGER IF NOT EXISTS (\w+)', ddl).group(1) for ddl in _TRIGGERS]
+
+
+def _table_exists(conn, name):
+    return conn.execute(
+        sa.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': name}
+    ).first() is not None
+
+
+def ensure_rollups(engine):
+    """Create the rollup tables and their triggers if missing, backfilling existing tickets.
+
+    Returns False on non-SQLite databases, where the analytics page is not available.
+    """
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.begin() as conn:
+        created = not _table_exists(conn, SLA_TABLE)
+        for ddl in _CREATE_TABLES + _TRIGGERS:
+            conn.execute(sa.text(ddl))
+        if created:
+            _refill(conn)
+    return True
+
+
+def _ticket_source(table, ids=None):
+    """Subquery of the tracked columns of `table`, optionally only the tickets `ids`"""
+    where = f" WHERE id IN ({', '.join(str(int(ticket_id)) for ticket_id in ids)})" if ids is not None else ''
+    return f"(SELECT {', '.join(_TRACKED_COLUMNS)} FROM {table}{where})"
+
+
+def add_tickets(conn, table, ids, sign=1):
+    """Add (sign=1) or remove (sign=-1) the contribution of the tickets `ids` stored in `table`.
+
+    Used when tickets move between `tickets` and an archive table, whose
+    rows the triggers do not see.
+    """
+    if not ids:
+        return
+    source = _ticket_source(table, ids)
+    conn.execute(sa.text(_sla_upsert('t', sign, source)))
+    conn.execute(sa.text(_flow_upsert('t', sign, source)))
+
+
+def _refill(conn, sources=('tickets',)):
+    conn.execute(sa.text(f'DELETE FROM {SLA_TABLE}'))
+    conn.execute(sa.text(f'DELETE FROM {FLOW_TABLE}'))
+    for table in sources:
+        conn.execute(sa.text(_sla_upsert('t', 1, _ticket_source(table))))
+        conn.execute(sa.text(_flow_upsert('t', 1, _ticket_source(table))))
+
+
+def rebuild_rollups(engine, sources=('tickets',)):
+    """Recompute both rollup tables from the ticket tables `sources` in one transaction"""
+    with engine.begin() as conn:
+        _refill(conn, sources)
+
+
+@contextmanager
+def suspended_rollups(engine, sources=('tickets',)):
+    """Drop the rollup triggers during a bulk load, then recreate them and rebuild once"""
+    if not ensure_rollups(engine):
+        yield
+        return
+    with engine.begin() as conn:
+        for name in _TRIGGER_NAMES:
+            conn.execute(sa.text(f'DROP TRIGGER IF EXISTS {name}'))
+    try:
+        yield
+    finally:
+        ensure_rollups(engine)
+        rebuild_rollups(engine, sources)
+
+
+# ---- Reading -------------------------------------------------------------
+
+def _percentile(counts, total, fraction):
+    """Estimate a percentile from bucket counts, interpolating inside the bucket"""
+    target = fraction * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if count and cumulative + count >= target:
+            lower = SLA_BUCKETS[index - 1] if index else 0
+            if index == len(SLA_BUCKETS):
+                return lower  # open-ended bucket: report its lower bound
+            return lower + (SLA_BUCKETS[index] - lower) * (target - cumulative) / count
+        cumulative += count
+    return None
+
+
+def _summary(counts, total_seconds):
+    tickets = sum(counts)
+    return {
+        'tickets': tickets,
+        'mean': total_seconds / tickets,
+        'p50': _percentile(counts, tickets, 0.50),
+        'p90': _percentile(counts, tickets, 0.90),
+        'p95': _percentile(counts, tickets, 0.95),
+    }
+
+
+def sla_stats(conn, dimension):
+    """{metric: {'all': summary, 'values': [(value, summary), ...]}} for one dimension.
+
+    Each summary has the number of tickets, the mean and the estimated
+    50th/90th/95th percentiles in seconds; values are sorted by ticket count.
+    """
+    rows = conn.execute(
+        sa.text(f"""
+            SELECT metric, dimension, value, bucket, tickets, total_seconds FROM {SLA_TABLE}
+            WHERE dimension IN ('all', :dimension) AND tickets > 0
+        """),
+        {'dimension': dimension}
+    )
+    histograms = {}
+    for metric, row_dimension, value, bucket, tickets, total_seconds in rows:
+        key = (metric, None if row_dimension == 'all' else value)
+        counts, seconds = histograms.get(key, ([0] * (len(SLA_BUCKETS) + 1), 0.0))
+        counts[bucket] += tickets
+        histograms[key] = (counts, seconds + total_seconds)
+
+    stats = {metric: {'all': None, 'values': []} for metric in METRICS}
+    for (metric, value), (counts, seconds) in histograms.items():
+        summary = _summary(counts, seconds)
+        if value is None:
+            stats[metric]['all'] = summary
+        else:
+            stats[metric]['values'].append((value, summary))
+    for metric in METRICS:
+        stats[metric]['values'].sort(key=lambda item: (-item[1]['tickets'], item[0]))
+    return stats
+
+
+def open_ticket_aging(conn, today):
+    """Number of open tickets per age bucket (see AGING_BUCKETS), by creation day"""
+    counts = [0] * (len(AGING_BUCKETS) + 1)
+    rows = conn.execute(sa.text(f'SELECT day, open_tickets FROM {FLOW_TABLE} WHERE open_tickets > 0'))
+    for day, open_tickets in rows:
+        age = (today - _parse_day(day)).days
+        index = next((i for i, bound in enumerate(AGING_BUCKETS) if age < bound), len(AGING_BUCKETS))
+        counts[index] += open_tickets
+    return counts
+
+
+def daily_flow(conn, today, days=30):
+    """[(date, created, resolved), ...] for the last `days` days, oldest first, zero-filled"""
+    first = today - timedelta(days=days - 1)
+    rows = conn.execute(
+        sa.text(f'SELECT day, created, resolved FROM {FLOW_TABLE} WHERE day >= :first'),
+        {'first': first.isoformat()}
+    )
+    by_day = {_parse_day(day): (created, resolved) for day, created, resolved in rows}
+    return [(first + timedelta(days=offset),) + by_day.get(first + timedelta(days=offset), (0, 0))
+            for offset in range(days)]
+
+
+def _parse_day(day):
+    return date.fromisoformat(day)
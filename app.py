@@ -1,27 +1,91 @@
+import hashlib
+import json
+import mimetypes
 import os
+import posixpath
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+import click
+from flask import (Flask, render_template, request, redirect, url_for, flash, session, g, has_request_context,
+                   jsonify, send_file, abort, before_render_template, template_rendered, stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
-from flask_mail import Mail, Message
 from flask_wtf.csrf import CSRFProtect
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from werkzeug.security import safe_join
+from collections import namedtuple
 from functools import wraps
 from dotenv import load_dotenv
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+import analytics
+import backup_manager
+import cache
+import export
+import group_commit
+import images
+import live
+import metrics
+import paging
+import passwords
+import ratelimit_storage  # registers the sqlite:/// rate limit storage with `limits`
+import search
+import uploads
 
 # Load environment variables
 load_dotenv()
 
 # Initialize Flask app
 app = Flask(__name__)
+app.request_class = uploads.UploadRequest  # validates and hashes uploads while they stream in
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-CHANGE-IN-PRODUCTION')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///tickets.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///tickets.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
+
+# SQLite production profile (applied on every new connection, see DATABASE ENGINE below)
+app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', 10000))  # ms a writer waits for the lock
+app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # bytes
+app.config['SQLITE_CACHE_SIZE'] = int(os.getenv('SQLITE_CACHE_SIZE', -32000))  # negative = KiB per connection
+# One connection per request thread; gthread workers need pool size >= --threads
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 5)),
+    'pool_timeout': 30,
+}
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite') and ':memory:' in app.config['SQLALCHEMY_DATABASE_URI']:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+# Outside static/: photos are only reachable through the login-protected `media` view
+app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', os.path.join(app.instance_path, 'uploads'))
+# Default upload folder of older versions, emptied by `flask move-uploads` and never served
+LEGACY_UPLOAD_FOLDER = os.path.join(app.static_folder, 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg'}
+# Uploaded images are served by the `media` view. With MEDIA_ACCEL_REDIRECT (nginx internal
+# location prefix, e.g. /protected-uploads/) or USE_X_SENDFILE the web server sends the bytes.
+app.config['MEDIA_ACCEL_REDIRECT'] = os.getenv('MEDIA_ACCEL_REDIRECT', '')
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', 'False').lower() in ('true', '1', 'yes')
+app.config['MEDIA_MAX_AGE'] = int(os.getenv('MEDIA_MAX_AGE', 365 * 24 * 3600))  # seconds for fingerprinted URLs
+# Per-type size limits checked while the upload is streamed (the type comes from the file signature)
+app.config['UPLOAD_SIZE_LIMITS'] = {
+    'jpeg': int(os.getenv('UPLOAD_MAX_JPEG_MB', 12)) * 1024 * 1024,
+    'png': int(os.getenv('UPLOAD_MAX_PNG_MB', 8)) * 1024 * 1024,
+}
+app.config['IMAGE_MAX_SIZE'] = int(os.getenv('IMAGE_MAX_SIZE', 2048))  # px, longest side of the stored original
+app.config['IMAGE_WORKERS'] = int(os.getenv('IMAGE_WORKERS', 1))  # background threads resizing uploads
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'mail.dk.dfds.root')
 app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 25))
 app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'False').lower() in ('true', '1', 'yes')
@@ -29,6 +93,95 @@ app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', 'FIXIT@dfds
 app.config['MAIL_TIMEOUT'] = int(os.getenv('MAIL_TIMEOUT', 5))  # seconds – avoid long hangs on DNS failures
 app.config['TICKET_NOTIFICATION_EMAIL'] = os.getenv('TICKET_NOTIFICATION_EMAIL', 'denitro@dfds.com')
 
+# Notification outbox (emails are queued in the DB and delivered by a background worker)
+app.config['NOTIFICATION_WORKER_ENABLED'] = os.getenv('NOTIFICATION_WORKER_ENABLED', 'True').lower() in ('true', '1', 'yes')
+app.config['NOTIFICATION_BATCH_SIZE'] = int(os.getenv('NOTIFICATION_BATCH_SIZE', 20))
+app.config['NOTIFICATION_MAX_ATTEMPTS'] = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', 6))
+app.config['NOTIFICATION_RETRY_BASE'] = int(os.getenv('NOTIFICATION_RETRY_BASE', 30))  # seconds, doubled on every failure
+app.config['NOTIFICATION_POLL_INTERVAL'] = int(os.getenv('NOTIFICATION_POLL_INTERVAL', 15))  # seconds
+app.config['NOTIFICATION_SMTP_KEEPALIVE'] = int(os.getenv('NOTIFICATION_SMTP_KEEPALIVE', 60))  # seconds an idle SMTP connection is kept open
+
+# Full-text search (SQLite FTS5); leave unset to auto-detect the index
+_fts_enabled = os.getenv('SEARCH_FTS_ENABLED')
+app.config['SEARCH_FTS_ENABLED'] = None if _fts_enabled is None else _fts_enabled.lower() in ('true', '1', 'yes')
+
+# Server-side cache for admin list, counts and rendered fragments:
+# memory:// (per worker) or sqlite:///path/cache.db (shared by all workers on the host)
+app.config['CACHE_URL'] = os.getenv('CACHE_URL', 'memory://')
+app.config['CACHE_DEFAULT_TTL'] = int(os.getenv('CACHE_DEFAULT_TTL', 600))  # seconds
+
+# Compiled templates (Jinja bytecode) kept on disk, so a new worker loads them instead of
+# compiling every template again; `flask --app app precompile-templates` fills it ahead of time.
+# Empty = compile in memory on every boot.
+app.config['TEMPLATE_CACHE_DIR'] = os.getenv('TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+
+# Group commit: with threaded workers (gunicorn gthread) the new tickets, comments, status
+# changes and assignments arriving in the same worker within WRITE_BATCH_WINDOW_MS are stored
+# in one transaction (at most WRITE_BATCH_MAX_SIZE writes); each request still answers only
+# after its own write is committed.
+app.config['WRITE_BATCHING'] = os.getenv('WRITE_BATCHING', 'False').lower() in ('true', '1', 'yes')
+app.config['WRITE_BATCH_WINDOW_MS'] = float(os.getenv('WRITE_BATCH_WINDOW_MS', 2))
+app.config['WRITE_BATCH_MAX_SIZE'] = int(os.getenv('WRITE_BATCH_MAX_SIZE', 64))
+
+# Dashboard paging: 'offset' (numbered pages) or 'cursor' (keyset, constant cost on deep pages)
+app.config['DASHBOARD_PAGINATION'] = os.getenv('DASHBOARD_PAGINATION', 'offset')
+
+# Archive tier: tickets resolved more than ARCHIVE_AFTER_DAYS days ago are moved, with their
+# comments, to a second SQLite file (attached to every connection as `archive`) by the
+# `flask archive-tickets` job, and their photos to ARCHIVE_UPLOAD_FOLDER (cold storage).
+app.config['ARCHIVE_ENABLED'] = (
+    os.getenv('ARCHIVE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+    and app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')  # ATTACH DATABASE is SQLite-only
+)
+app.config['ARCHIVE_DATABASE'] = os.getenv('ARCHIVE_DATABASE', os.path.join(app.instance_path, 'archive.db'))
+app.config['ARCHIVE_UPLOAD_FOLDER'] = os.getenv('ARCHIVE_UPLOAD_FOLDER', os.path.join(app.instance_path, 'archive_uploads'))
+app.config['ARCHIVE_AFTER_DAYS'] = int(os.getenv('ARCHIVE_AFTER_DAYS', 180))
+app.config['ARCHIVE_BATCH_SIZE'] = int(os.getenv('ARCHIVE_BATCH_SIZE', 500))  # tickets moved per transaction
+
+# Online backups (`flask backup`): consistent copies of the SQLite databases made while the app
+# keeps writing, plus the photos stored once by content hash. Keep BACKUP_DIR on another disk.
+app.config['BACKUP_DIR'] = os.getenv('BACKUP_DIR', os.path.join(app.instance_path, 'backups'))
+app.config['BACKUP_METHOD'] = os.getenv('BACKUP_METHOD', 'backup')  # 'backup' (online backup API) or 'vacuum' (VACUUM INTO)
+app.config['BACKUP_STEP_PAGES'] = int(os.getenv('BACKUP_STEP_PAGES', 1024))  # database pages copied per step
+app.config['BACKUP_KEEP'] = int(os.getenv('BACKUP_KEEP', 7))  # newest snapshots never pruned
+app.config['BACKUP_RETENTION_DAYS'] = int(os.getenv('BACKUP_RETENTION_DAYS', 30))
+
+# Live dashboard updates from the ticket change log: browsers poll every LIVE_POLL_INTERVAL
+# seconds, or keep a Server-Sent Events stream open when LIVE_UPDATES_STREAM is enabled
+# (only with threaded/async workers: a stream occupies a worker thread while open).
+app.config['LIVE_UPDATES_ENABLED'] = (
+    os.getenv('LIVE_UPDATES_ENABLED', 'True').lower() in ('true', '1', 'yes')
+    and app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')  # the change log uses SQLite triggers
+)
+app.config['LIVE_UPDATES_STREAM'] = os.getenv('LIVE_UPDATES_STREAM', 'False').lower() in ('true', '1', 'yes')
+app.config['LIVE_POLL_INTERVAL'] = int(os.getenv('LIVE_POLL_INTERVAL', 5))  # seconds
+app.config['LIVE_STREAM_TIMEOUT'] = int(os.getenv('LIVE_STREAM_TIMEOUT', 300))  # seconds before the browser reconnects
+
+# Performance metrics (Prometheus text on /admin/metrics). Each worker writes its
+# snapshot to METRICS_DIR every METRICS_FLUSH_INTERVAL seconds; the export sums them.
+app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'True').lower() in ('true', '1', 'yes')
+app.config['METRICS_DIR'] = os.getenv('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+app.config['METRICS_FLUSH_INTERVAL'] = int(os.getenv('METRICS_FLUSH_INTERVAL', 5))  # seconds
+app.config['METRICS_SERVER_TIMING'] = os.getenv('METRICS_SERVER_TIMING', 'False').lower() in ('true', '1', 'yes')
+
+# Password hashing (any Werkzeug method, e.g. scrypt:16384:8:1 or pbkdf2:sha256:600000).
+# Changing it upgrades each user's hash at their next login.
+app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', passwords.DEFAULT_METHOD)
+app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 2))  # concurrent hashes per process
+app.config['PASSWORD_HASH_QUEUE'] = int(os.getenv('PASSWORD_HASH_QUEUE', 32))  # waiting logins before answering 503
+# Login attempts: per client IP (shared by the yard tablets behind one NAT) and per username
+app.config['LOGIN_RATE_LIMIT'] = os.getenv('LOGIN_RATE_LIMIT', '30 per minute')
+app.config['LOGIN_USER_RATE_LIMIT'] = os.getenv('LOGIN_USER_RATE_LIMIT', '10 per minute')
+# New tickets per client IP. The yard devices all share one NAT IP and a shift start
+# brings hundreds of reports a minute, so the limit only stops floods (e.g. a looping script)
+app.config['TICKET_FORM_RATE_LIMIT'] = os.getenv('TICKET_FORM_RATE_LIMIT', '600 per minute')
+
+# Rate limit counters: sqlite:///path (shared by all workers on the host), memory:// or redis://
+app.config['RATELIMIT_STORAGE_URI'] = os.getenv(
+    'RATELIMIT_STORAGE_URI', 'sqlite:///' + os.path.join(app.instance_path, 'ratelimit.db')
+)
+app.config['RATELIMIT_STRATEGY'] = os.getenv('RATELIMIT_STRATEGY', 'sliding-window-counter')
+
 # Session security settings
 _secure_cookie = os.getenv('SESSION_COOKIE_SECURE', 'False').lower() in ('true', '1', 'yes')
 app.config['SESSION_COOKIE_SECURE'] = _secure_cookie
@@ -38,21 +191,57 @@ app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=8)
 
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+if app.config['ARCHIVE_ENABLED']:
+    os.makedirs(os.path.dirname(os.path.abspath(app.config['ARCHIVE_DATABASE'])), exist_ok=True)
 
 # Initialize database
 db = SQLAlchemy(app)
-mail = Mail(app)
 
 # CSRF protection
 csrf = CSRFProtect(app)
 
-# Rate limiting (in-memory storage; for multi-worker/production deployments
-# set RATELIMIT_STORAGE_URI=redis://... in environment and update storage_uri)
+_mail = None
+
+
+def get_mail():
+    """Flask-Mail extension, imported and set up on first use (emails are sent by the background worker)"""
+    global _mail
+    if _mail is None:
+        from flask_mail import Mail
+        _mail = Mail(app)
+    return _mail
+
+
+# Versioned cache (see CHANGE TRACKING)
+data_cache = cache.make_cache(app.config['CACHE_URL'], app.config['CACHE_DEFAULT_TTL'])
+
+# Template bytecode on disk (see precompile_templates); Jinja checks each entry against the source
+if app.config['TEMPLATE_CACHE_DIR']:
+    os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+
+# Background resizing/recompression of uploaded photos
+image_processor = images.ImageProcessor(max_workers=app.config['IMAGE_WORKERS'])
+
+# Bounded pool for password hashing, so a burst of logins cannot starve the worker
+password_hasher = passwords.PasswordHasher(
+    method=app.config['PASSWORD_HASH_METHOD'],
+    max_workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_queue=app.config['PASSWORD_HASH_QUEUE'],
+)
+
+# One change-log poller per worker process for all open event streams
+live_broadcaster = live.EventBroadcaster()
+
+# Rate limiting; the default SQLite storage (ratelimit_storage.py) keeps one set of
+# counters for all gunicorn workers. If it fails the limiter falls back to memory.
 limiter = Limiter(
     key_func=get_remote_address,
     app=app,
     default_limits=[],
-    storage_uri=os.getenv('RATELIMIT_STORAGE_URI', 'memory://'),
+    storage_uri=app.config['RATELIMIT_STORAGE_URI'],
+    strategy=app.config['RATELIMIT_STRATEGY'],
+    in_memory_fallback_enabled=True,
 )
 
 
@@ -75,6 +264,290 @@ def set_security_headers(response):
     )
     return response
 
+
+# ==================== DATABASE ENGINE ====================
+
+ARCHIVE_SCHEMA = 'archive'  # name of the attached archive database
+_SQLITE_JOURNAL_MODES = {'WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY'}
+_SQLITE_SYNCHRONOUS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+_write_intent = threading.local()
+
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """Apply the SQLite pragmas of the production profile to a new connection"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    # Let SQLAlchemy emit BEGIN itself (see begin_sqlite_transaction)
+    dbapi_connection.isolation_level = None
+    journal_mode = app.config['SQLITE_JOURNAL_MODE'].upper()
+    synchronous = app.config['SQLITE_SYNCHRONOUS'].upper()
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT'])}")
+    schemas = ['main']
+    if app.config['ARCHIVE_ENABLED']:
+        cursor.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (app.config['ARCHIVE_DATABASE'],))
+        schemas.append(ARCHIVE_SCHEMA)
+    for schema in schemas:
+        if journal_mode in _SQLITE_JOURNAL_MODES:
+            cursor.execute(f'PRAGMA {schema}.journal_mode = {journal_mode}')
+        if synchronous in _SQLITE_SYNCHRONOUS:
+            cursor.execute(f'PRAGMA {schema}.synchronous = {synchronous}')
+    cursor.execute(f"PRAGMA mmap_size = {int(app.config['SQLITE_MMAP_SIZE'])}")
+    cursor.execute(f"PRAGMA cache_size = {int(app.config['SQLITE_CACHE_SIZE'])}")
+    cursor.execute('PRAGMA temp_store = MEMORY')
+    cursor.close()
+
+
+@contextmanager
+def write_transaction():
+    """Open transactions started in this block with BEGIN IMMEDIATE (for background jobs)"""
+    previous = getattr(_write_intent, 'active', False)
+    _write_intent.active = True
+    try:
+        yield
+    finally:
+        _write_intent.active = previous
+
+
+def read_only_view(f):
+    """Mark a POST view that never writes, so it does not take the SQLite write lock"""
+    f.read_only = True
+    return f
+
+
+def group_committed_view(f):
+    """Mark a POST view that writes only through commit_write: with WRITE_BATCHING
+    its own transaction only reads, the write lock is taken by the group commit"""
+    f.group_committed = True
+    return f
+
+
+def wants_write_lock():
+    """True if the transaction about to start is expected to write"""
+    if getattr(_write_intent, 'active', False):
+        return True
+    if has_request_context() and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        view = app.view_functions.get(request.endpoint)
+        if app.config['WRITE_BATCHING'] and getattr(view, 'group_committed', False):
+            return False
+        return not getattr(view, 'read_only', False)
+    return False
+
+
+@event.listens_for(Engine, 'begin')
+def begin_sqlite_transaction(conn):
+    """Start SQLite transactions explicitly.
+
+    Write requests use BEGIN IMMEDIATE: they queue on busy_timeout for the
+    write lock up front instead of failing with "database is locked" when a
+    deferred read transaction tries to upgrade after another worker wrote.
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+    # Issued on the DBAPI connection so it is not counted as a query
+    conn.connection.dbapi_connection.execute('BEGIN IMMEDIATE' if wants_write_lock() else 'BEGIN')
+
+
+# ==================== GROUP COMMIT ====================
+
+def run_write_batch(writes):
+    """Run a batch of group-committed writes in one BEGIN IMMEDIATE transaction.
+
+    Called by the leader request (see group_commit.py) with a session of its
+    own. If a write fails, the batch is rolled back and every write is run
+    again in a transaction of its own. The statements are not charged to
+    the leader's query budget: they belong to the other requests.
+    """
+    counted = g.get('sql_query_count', 0) if has_request_context() else None
+    session = Session(db.engine)
+    try:
+        with write_transaction():
+            results = [write.function(session) for write in writes]
+            session.commit()
+        for write, result in zip(writes, results):
+            write.result = result
+    except Exception:
+        session.rollback()
+        if len(writes) == 1:
+            raise
+        for write in writes:
+            try:
+                run_write_batch([write])
+            except Exception as e:
+                write.error = e
+    finally:
+        session.close()
+        if counted is not None:
+            g.sql_query_count = counted
+
+
+write_batcher = group_commit.GroupCommitter(
+    run_write_batch,
+    window=app.config['WRITE_BATCH_WINDOW_MS'] / 1000,
+    max_batch=app.config['WRITE_BATCH_MAX_SIZE'],
+)
+
+
+def commit_write(function):
+    """Run `function(session)`, commit, and return its result.
+
+    With WRITE_BATCHING the write joins the next group commit of this
+    worker; otherwise it runs on db.session and is committed on its own.
+    The result must not be an ORM object (the batch session is closed).
+    """
+    if app.config['WRITE_BATCHING']:
+        # End the request's read transaction first: outside WAL mode its shared
+        # lock would keep the batch from committing
+        db.session.rollback()
+        return write_batcher.submit(function)
+    result = function(db.session)
+    db.session.commit()
+    return result
+
+
+# ==================== QUERY COUNTER ====================
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised (in debug/testing) when a view issues more SQL statements than its budget"""
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_sql_statement(conn, cursor, statement, parameters, context, executemany):
+    """Count the SQL statements executed while handling the current request"""
+    if has_request_context():
+        g.sql_query_count = g.get('sql_query_count', 0) + 1
+        conn.info['query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def time_sql_statement(conn, cursor, statement, parameters, context, executemany):
+    """Add the statement's duration to the request's DB time"""
+    started = conn.info.pop('query_started', None)
+    if started is not None and has_request_context():
+        g.sql_time = g.get('sql_time', 0.0) + time.perf_counter() - started
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of SQL statements a view may issue per request"""
+    def decorator(f):
+        f.query_budget = max_queries
+        return f
+    return decorator
+
+
+@app.after_request
+def check_query_budget(response):
+    """Expose the per-request SQL count in debug/testing and enforce view budgets"""
+    count = g.get('sql_query_count', 0)
+    if app.debug or app.testing:
+        response.headers['X-SQL-Queries'] = str(count)
+    view = app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    if budget is not None and count > budget:
+        message = f'{request.endpoint} ha eseguito {count} query SQL (limite {budget})'
+        if app.debug or app.testing:
+            raise QueryBudgetExceeded(message)
+        app.logger.warning(message)
+    return response
+
+
+# ==================== METRICS ====================
+
+metrics_registry = metrics.MetricsRegistry(enabled=app.config['METRICS_ENABLED'])
+metrics_registry.histogram('fixit_http_request_duration_seconds', 'Request latency by endpoint')
+metrics_registry.counter('fixit_http_requests_total', 'Requests by endpoint, method and status code')
+metrics_registry.counter('fixit_sql_queries_total', 'SQL statements executed, by endpoint')
+metrics_registry.histogram('fixit_sql_queries_per_request', 'SQL statements per request', buckets=metrics.COUNT_BUCKETS)
+metrics_registry.histogram('fixit_db_duration_seconds', 'Cumulative SQL time per request')
+metrics_registry.histogram('fixit_template_render_seconds', 'Template render time')
+metrics_registry.histogram('fixit_smtp_send_seconds', 'Time to send one email')
+metrics_registry.counter('fixit_smtp_errors_total', 'Failed email sends')
+metrics_registry.counter('fixit_upload_bytes_total', 'Bytes of accepted image uploads')
+metrics_registry.histogram('fixit_upload_size_bytes', 'Size of accepted image uploads', buckets=metrics.SIZE_BUCKETS)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    g.setdefault('template_timers', []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def record_template_time(sender, template, context, **extra):
+    timers = g.get('template_timers')
+    if timers:
+        elapsed = time.perf_counter() - timers.pop()
+        g.template_time = g.get('template_time', 0.0) + elapsed
+        metrics_registry.observe('fixit_template_render_seconds', elapsed, template=template.name)
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Record latency, SQL count/time per endpoint and optionally add a Server-Timing header"""
+    started = g.get('request_started')
+    if started is None or not metrics_registry.enabled:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'none'
+    queries = g.get('sql_query_count', 0)
+    sql_time = g.get('sql_time', 0.0)
+    metrics_registry.observe('fixit_http_request_duration_seconds', elapsed, endpoint=endpoint)
+    metrics_registry.inc('fixit_http_requests_total', endpoint=endpoint, method=request.method,
+                         status=str(response.status_code))
+    metrics_registry.inc('fixit_sql_queries_total', queries, endpoint=endpoint)
+    metrics_registry.observe('fixit_sql_queries_per_request', queries, endpoint=endpoint)
+    metrics_registry.observe('fixit_db_duration_seconds', sql_time, endpoint=endpoint)
+    if app.config['METRICS_SERVER_TIMING']:
+        response.headers['Server-Timing'] = (
+            f'db;dur={sql_time * 1000:.1f};desc="{queries} query", '
+            f'tpl;dur={g.get("template_time", 0.0) * 1000:.1f}, '
+            f'app;dur={elapsed * 1000:.1f}'
+        )
+    try:
+        metrics_registry.flush(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+    except OSError as e:
+        app.logger.warning('Scrittura metriche fallita: %s', e)
+    return response
+
+
+def wants_json():
+    """True for API calls and requests sent or answered as JSON (no flash/redirect for them)"""
+    return (request.path.startswith('/api/') or request.is_json
+            or request.accept_mimetypes.best == 'application/json')
+
+
+def upload_error(error, message):
+    """JSON error for API/background requests, flash and back to the form otherwise"""
+    if wants_json():
+        response = jsonify({'error': message})
+        response.status_code = error.code
+        return response
+    flash(message, 'danger')
+    return redirect(request.url)
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def handle_upload_too_large(error):
+    """Upload rejected while streaming (or over MAX_CONTENT_LENGTH)"""
+    return upload_error(error, 'Immagine troppo grande: riduci la foto e riprova.')
+
+
+@app.errorhandler(UnsupportedMediaType)
+def handle_unsupported_upload(error):
+    """Uploaded file is not a real JPG/PNG image"""
+    return upload_error(error, 'Formato immagine non valido: sono accettate solo foto JPG o PNG.')
+
+
+@app.before_request
+def start_background_workers():
+    """Start the per-process background workers (after gunicorn has forked)"""
+    notification_worker.ensure_started()
+
 # ==================== MODELS ====================
 
 class User(db.Model):
@@ -90,10 +563,10 @@ class User(db.Model):
     assigned_tickets = db.relationship('Ticket', backref='assigned_to', lazy=True, foreign_keys='Ticket.assigned_to_id')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -111,6 +584,8 @@ class Ticket(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     started_at = db.Column(db.DateTime, nullable=True)
     closed_at = db.Column(db.DateTime, nullable=True)
+    # Last change of the ticket or its comments (cache keys, conditional requests)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
     
     # Common fields
     requester_name = db.Column(db.String(100), nullable=False)
@@ -130,6 +605,15 @@ class Ticket(db.Model):
 
     # Comments relationship
     comments = db.relationship('Comment', backref='ticket', lazy=True, cascade='all, delete-orphan')
+
+    # Access paths used by the dashboard (filters + ORDER BY created_at DESC)
+    __table_args__ = (
+        db.Index('ix_tickets_created_at', 'created_at'),
+        db.Index('ix_tickets_status_created_at', 'status', 'created_at'),
+        db.Index('ix_tickets_assigned_created_at', 'assigned_to_id', 'created_at'),
+        db.Index('ix_tickets_status_assigned_created_at', 'status', 'assigned_to_id', 'created_at'),
+        db.Index('ix_tickets_updated_at', 'updated_at'),  # API `updated_since` polling
+    )
     
     def __repr__(self):
         return f'<Ticket {self.id} - {self.ticket_type}>'
@@ -145,10 +629,159 @@ class Comment(db.Model):
     body = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_comments_ticket_created_at', 'ticket_id', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<Comment {self.id} on Ticket {self.ticket_id}>'
 
 
+def _archive_referred_schema(table, to_schema, constraint, referred_schema):
+    """Archived comments point at archived tickets, archived tickets at the live users"""
+    return to_schema if constraint.referred_table.name == 'tickets' else referred_schema
+
+
+class ArchivedTicket(db.Model):
+    """Resolved ticket moved to the archive database (same columns as Ticket, read-only)"""
+    __table__ = Ticket.__table__.to_metadata(db.metadata, schema=ARCHIVE_SCHEMA,
+                                             referred_schema_fn=_archive_referred_schema)
+
+    assigned_to = db.relationship('User', viewonly=True)
+
+    def __repr__(self):
+        return f'<ArchivedTicket {self.id} - {self.ticket_type}>'
+
+
+class ArchivedComment(db.Model):
+    """Comment of an archived ticket (ids are the archive's own, see archive_tickets)"""
+    __table__ = Comment.__table__.to_metadata(db.metadata, schema=ARCHIVE_SCHEMA,
+                                              referred_schema_fn=_archive_referred_schema)
+
+    def __repr__(self):
+        return f'<ArchivedComment {self.id} on Ticket {self.ticket_id}>'
+
+
+class NotificationOutbox(db.Model):
+    """Email notifications waiting to be delivered by the background worker"""
+    __tablename__ = 'notification_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    ticket_id = db.Column(db.Integer, nullable=True)  # no FK: the row must survive ticket deletion
+    recipient = db.Column(db.String(200), nullable=False)
+    subject = db.Column(db.String(300), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='PENDING', nullable=False)  # 'PENDING', 'SENT', 'FAILED'
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    # Earliest time of the next delivery attempt; also used as lease while a worker holds the row
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    claim_token = db.Column(db.String(36), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<NotificationOutbox {self.id} {self.status}>'
+
+
+class ApiToken(db.Model):
+    """Bearer token of a machine client of the JSON API, acting as `user`"""
+    __tablename__ = 'api_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)  # sha256 hex, the token itself is never stored
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=True)
+
+    user = db.relationship('User', backref=db.backref('api_tokens', lazy=True, cascade='all, delete-orphan'))
+
+    @staticmethod
+    def hash_token(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def __repr__(self):
+        return f'<ApiToken {self.id} {self.name}>'
+
+
+class AppCounter(db.Model):
+    """Monotonic counters bumped in the same transaction as the data they track"""
+    __tablename__ = 'app_counters'
+
+    name = db.Column(db.String(50), primary_key=True)  # 'tickets', 'users'
+    value = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=True)  # time of the last bump (API Last-Modified)
+
+    def __repr__(self):
+        return f'<AppCounter {self.name}={self.value}>'
+
+
+# ==================== CHANGE TRACKING ====================
+
+_BUMP_COUNTER_SQL = db.text(
+    'INSERT INTO app_counters (name, value, updated_at) VALUES (:name, 1, :now) '
+    'ON CONFLICT (name) DO UPDATE SET value = value + 1, updated_at = excluded.updated_at'
+).bindparams(db.bindparam('now', type_=db.DateTime))
+
+
+# Tables whose changes invalidate the cache entries of a counter
+_TRACKED_TABLES = {'tickets': 'tickets', 'comments': 'tickets', 'users': 'users', 'api_tokens': 'users'}
+
+
+def bump_counter(name, connection=None):
+    """Increment a version counter inside the current transaction"""
+    (connection or db.session).execute(_BUMP_COUNTER_SQL, {'name': name, 'now': datetime.utcnow()})
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def track_bulk_changes(orm_execute_state):
+    """Bulk insert/update/delete statements bypass the flush hook below"""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        name = _TRACKED_TABLES.get(orm_execute_state.statement.table.name)
+        if name:
+            bump_counter(name, orm_execute_state.session.connection())
+
+
+@event.listens_for(Session, 'before_flush')
+def track_changes(session, flush_context, instances):
+    """Bump the 'tickets'/'users' versions and tickets' updated_at on every ORM write"""
+    changed = [obj for obj in session.new | session.deleted]
+    changed += [obj for obj in session.dirty if session.is_modified(obj)]
+    if not changed:
+        return
+    connection = session.connection()
+    if any(isinstance(obj, (Ticket, Comment)) for obj in changed):
+        bump_counter('tickets', connection)
+        commented = {obj.ticket_id for obj in changed if isinstance(obj, Comment) and obj.ticket_id}
+        if commented:
+            connection.execute(
+                db.update(Ticket.__table__).where(Ticket.__table__.c.id.in_(commented)).values(updated_at=datetime.utcnow())
+            )
+    if any(isinstance(obj, (User, ApiToken)) for obj in changed):
+        bump_counter('users', connection)
+
+
+def cache_versions():
+    """Current values of all version counters (read once per request)"""
+    if has_request_context() and 'cache_versions' in g:
+        return g.cache_versions
+    rows = db.session.execute(db.select(AppCounter.name, AppCounter.value, AppCounter.updated_at)).all()
+    versions = {name: value for name, value, _ in rows}
+    if has_request_context():
+        g.cache_versions = versions
+        g.cache_updated_at = {name: updated_at for name, _, updated_at in rows}
+    return versions
+
+
+def cache_last_modified(*names):
+    """Time of the most recent bump of the given counters (None if unknown)"""
+    cache_versions()
+    stamps = [g.cache_updated_at.get(name) for name in names]
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return max(stamps) if stamps else None
+
+
 # ==================== HELPER FUNCTIONS ====================
 
 def allowed_file(filename):
@@ -156,11 +789,145 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
 
-def send_new_ticket_notification(ticket):
-    """Send email notification when a new ticket is created"""
+def save_uploaded_image(file):
+    """Store an uploaded photo and schedule its background processing.
+
+    The upload has already been type-checked, size-checked and hashed while
+    streaming (see uploads.py); here it is moved to its content-addressed
+    path. Returns the stored filename, or None if there is no valid image.
+    """
+    if not (file and file.filename and allowed_file(file.filename)):
+        return None
+    filename, created = uploads.store_upload(file, app.config['UPLOAD_FOLDER'])
+    if filename:
+        metrics_registry.inc('fixit_upload_bytes_total', file.stream.size, type=file.stream.image_type)
+        metrics_registry.observe('fixit_upload_size_bytes', file.stream.size, type=file.stream.image_type)
+    if created:
+        image_processor.submit(app.config['UPLOAD_FOLDER'], filename, app.config['IMAGE_MAX_SIZE'],
+                               on_done=touch_tickets_with_image)
+    return filename
+
+
+def touch_tickets_with_image(filename):
+    """Mark tickets using `filename` as changed once its thumbnails exist (runs in the image thread)"""
+    with app.app_context(), write_transaction():
+        db.session.execute(
+            db.update(Ticket).where(Ticket.image_filename == filename).values(updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+
+def archived_image_filenames(filenames):
+    """The given photos that archived tickets still use"""
+    if not app.config['ARCHIVE_ENABLED']:
+        return set()
+    return set(db.session.execute(
+        db.select(ArchivedTicket.image_filename).where(ArchivedTicket.image_filename.in_(filenames))
+    ).scalars())
+
+
+def release_images(filenames):
+    """Dispose of photos no live ticket uses any more: those of archived
+    tickets go to cold storage, the others are deleted"""
+    archived = archived_image_filenames(filenames)
+    for filename in filenames:
+        if filename in archived:
+            images.move_image(app.config['UPLOAD_FOLDER'], app.config['ARCHIVE_UPLOAD_FOLDER'], filename)
+        else:
+            images.remove_image(app.config['UPLOAD_FOLDER'], filename)
+
+
+def remove_ticket_image(filename):
+    """Delete the photo of a deleted ticket unless another ticket uses the same (deduplicated) file"""
+    if filename and db.session.execute(db.select(Ticket.id).where(Ticket.image_filename == filename).limit(1)).first() is None:
+        release_images({filename})
+
+
+def sweep_orphan_images(filenames):
+    """Delete the given photos unless a ticket still uses them (runs in the image thread)"""
+    with app.app_context():
+        in_use = set(db.session.execute(
+            db.select(Ticket.image_filename).where(Ticket.image_filename.in_(filenames))
+        ).scalars())
+        release_images(set(filenames) - in_use)
+
+
+def media_path(relpath):
+    """Path of an uploaded file or derivative, in the upload folder or else in
+    the archive cold storage (None if it is in neither)"""
+    folders = [app.config['UPLOAD_FOLDER']]
+    if app.config['ARCHIVE_ENABLED']:
+        folders.append(app.config['ARCHIVE_UPLOAD_FOLDER'])
+    for folder in folders:
+        path = safe_join(folder, relpath)
+        if path is not None and os.path.isfile(path):
+            return path
+    return None
+
+
+def media_fingerprint(path):
+    """Short fingerprint of a stored file; changes whenever the file is rewritten.
+
+    Used both as the `v` URL parameter and as the strong ETag of the file.
+    """
+    st = os.stat(path)
+    key = f'{st.st_ino}-{st.st_mtime_ns}-{st.st_size}'.encode()
+    return hashlib.blake2b(key, digest_size=8).hexdigest()
+
+
+@app.template_global()
+def image_url(filename, variant=None):
+    """Fingerprinted URL of an uploaded image: the requested derivative
+    ('thumb', 'detail') if it has been generated, otherwise the original"""
+    if variant:
+        derived = images.derived_relpath(filename, variant)
+        try:
+            return url_for('media', filename=derived, v=media_fingerprint(media_path(derived)))
+        except (FileNotFoundError, TypeError):
+            pass
+    try:
+        fingerprint = media_fingerprint(media_path(filename))
+    except (FileNotFoundError, TypeError):  # missing (None path) or moved meanwhile by the archive job
+        fingerprint = None
+    return url_for('media', filename=filename, v=fingerprint)
+
+
+@app.template_filter('duration')
+def format_duration(seconds):
+    """Compact Italian duration for the analytics tables, e.g. 90061 -> '1g 1h'"""
+    if seconds is None:
+        return '-'
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f'{minutes}m'
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f'{hours}h {minutes}m' if minutes else f'{hours}h'
+    days, hours = divmod(hours, 24)
+    return f'{days}g {hours}h' if hours else f'{days}g'
+
+
+def set_ticket_status(ticket, new_status):
+    """Change the status and record when work started / the ticket was closed"""
+    old_status = ticket.status
+    ticket.status = new_status
+    if new_status == 'IN_LAVORAZIONE' and old_status == 'NUOVO':
+        ticket.started_at = datetime.utcnow()
+    elif new_status == 'RISOLTO' and old_status != 'RISOLTO':
+        ticket.closed_at = datetime.utcnow()
+
+
+def queue_new_ticket_notification(ticket, session=None):
+    """Queue the email notification for a new ticket in the outbox.
+
+    Must be called after the ticket has been flushed (so it has an id) and
+    before the commit, so the ticket and its notification are stored in the
+    same transaction (`session`, default db.session). Delivery happens in
+    the background worker.
+    """
     recipient = app.config.get('TICKET_NOTIFICATION_EMAIL')
     if not recipient:
-        return False
+        return None
 
     ticket_url = url_for('ticket_detail', ticket_id=ticket.id, _external=True)
     subject = f"[FIXIT] Nuovo ticket #{ticket.id} - {ticket.ticket_type}"
@@ -201,14 +968,366 @@ def send_new_ticket_notification(ticket):
     </html>
     """
 
-    try:
-        msg = Message(subject=subject, recipients=[recipient], html=html)
-        with mail.connect() as conn:
-            conn.send(msg)
-        return True
-    except Exception as e:
-        app.logger.warning('Email non inviata per ticket #%s: %s', ticket.id, e)
+    notification = NotificationOutbox(
+        ticket_id=ticket.id,
+        recipient=recipient,
+        subject=subject,
+        html=html
+    )
+    (session or db.session).add(notification)
+    return notification
+
+
+class SMTPConnectionPool:
+    """Keeps a single SMTP connection open between deliveries.
+
+    The connection is reopened after it has been idle longer than
+    NOTIFICATION_SMTP_KEEPALIVE seconds or after a send error.
+    Only used from the notification worker thread.
+    """
+
+    def __init__(self, mail_ext):
+        self.mail = mail_ext
+        self.conn = None
+        self.last_used = 0.0
+
+    def get(self):
+        keepalive = app.config['NOTIFICATION_SMTP_KEEPALIVE']
+        if self.conn is not None and time.monotonic() - self.last_used > keepalive:
+            self.close()
+        if self.conn is None:
+            from flask_mail import Connection
+            conn = Connection(self.mail)
+            conn.__enter__()
+            if conn.host is not None and conn.host.sock is not None:
+                conn.host.sock.settimeout(app.config['MAIL_TIMEOUT'])
+            self.conn = conn
+        return self.conn
+
+    def send(self, msg):
+        started = time.perf_counter()
+        try:
+            self.get().send(msg)
+        except Exception:
+            metrics_registry.inc('fixit_smtp_errors_total')
+            raise
+        finally:
+            metrics_registry.observe('fixit_smtp_send_seconds', time.perf_counter() - started)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.__exit__(None, None, None)
+            except Exception:
+                pass
+            self.conn = None
+
+
+def deliver_pending_notifications(pool, limit=None):
+    """Claim and send one batch of due outbox rows.
+
+    Rows are claimed by pushing `next_attempt_at` forward (a lease) and
+    tagging them with a claim token, so several workers/processes can drain
+    the same outbox without sending an email twice. Returns the number of
+    rows processed.
+    """
+    limit = limit or app.config['NOTIFICATION_BATCH_SIZE']
+    now = datetime.utcnow()
+    token = str(uuid.uuid4())
+
+    due_ids = db.session.execute(
+        db.select(NotificationOutbox.id)
+        .where(NotificationOutbox.status == 'PENDING', NotificationOutbox.next_attempt_at <= now)
+        .order_by(NotificationOutbox.id)
+        .limit(limit)
+    ).scalars().all()
+    if not due_ids:
+        return 0
+
+    db.session.execute(
+        db.update(NotificationOutbox)
+        .where(
+            NotificationOutbox.id.in_(due_ids),
+            NotificationOutbox.status == 'PENDING',
+            NotificationOutbox.next_attempt_at <= now
+        )
+        .values(
+            claim_token=token,
+            next_attempt_at=now + timedelta(minutes=10),
+            attempts=NotificationOutbox.attempts + 1
+        )
+    )
+    db.session.commit()
+
+    claimed = NotificationOutbox.query.filter_by(claim_token=token).order_by(NotificationOutbox.id).all()
+    from flask_mail import Message
+    for notification in claimed:
+        try:
+            pool.send(Message(subject=notification.subject, recipients=[notification.recipient], html=notification.html))
+            notification.status = 'SENT'
+            notification.sent_at = datetime.utcnow()
+            notification.last_error = None
+        except Exception as e:
+            pool.close()
+            notification.last_error = str(e)
+            if notification.attempts >= app.config['NOTIFICATION_MAX_ATTEMPTS']:
+                notification.status = 'FAILED'
+                app.logger.error('Email definitivamente non inviata per ticket #%s: %s', notification.ticket_id, e)
+            else:
+                backoff = app.config['NOTIFICATION_RETRY_BASE'] * 2 ** (notification.attempts - 1)
+                notification.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff)
+                app.logger.warning('Email non inviata per ticket #%s (tentativo %s, nuovo tentativo tra %ss): %s',
+                                   notification.ticket_id, notification.attempts, backoff, e)
+        notification.claim_token = None
+        db.session.commit()
+    return len(claimed)
+
+
+class NotificationWorker:
+    """Background thread draining the notification outbox.
+
+    One worker runs per process; it is (re)started lazily so it also works
+    after gunicorn forks. Bursts are delivered in batches over one pooled
+    SMTP connection.
+    """
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if not app.config['NOTIFICATION_WORKER_ENABLED']:
+            return
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='notification-worker', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self.ensure_started()
+        self._wakeup.set()
+
+    def _run(self):
+        pool = SMTPConnectionPool(get_mail())
+        while True:
+            self._wakeup.wait(timeout=app.config['NOTIFICATION_POLL_INTERVAL'])
+            self._wakeup.clear()
+            try:
+                with app.app_context(), write_transaction():
+                    while deliver_pending_notifications(pool):
+                        pass
+            except Exception:
+                app.logger.exception('Errore nel worker delle notifiche email')
+                pool.close()
+
+
+notification_worker = NotificationWorker()
+
+
+def fulltext_search_enabled():
+    """Return True if the FTS5 search index can be used (detected once per process)"""
+    if app.config['SEARCH_FTS_ENABLED'] is None:
+        app.config['SEARCH_FTS_ENABLED'] = search.search_index_exists(db.engine)
+    return app.config['SEARCH_FTS_ENABLED']
+
+
+def order_tickets(query, search_query=''):
+    """Order a filtered Ticket query: best full-text matches first when searching, then newest"""
+    match_query = search.build_match_query(search_query) if search_query and fulltext_search_enabled() else None
+    if match_query:
+        matches = search.ranked_matches(match_query)
+        # Outer join: a ticket found by its numeric id may not match the text (rank NULL sorts first)
+        return query.outerjoin(matches, matches.c.ticket_id == Ticket.id).order_by(matches.c.rank, Ticket.created_at.desc())
+    return query.order_by(Ticket.created_at.desc())
+
+
+def filter_tickets(query, search_query='', status_filter='', assigned_filter='', model=None):
+    """Apply the dashboard filters (search, status, assignee) to a Ticket (or ArchivedTicket) query"""
+    model = model or Ticket
+    if search_query:
+        # The archive database has its own full-text index
+        match_query = search.build_match_query(search_query) if fulltext_search_enabled() else None
+        if match_query:
+            schema = ARCHIVE_SCHEMA if model is ArchivedTicket else 'main'
+            text_filter = model.id.in_(search.matching_ticket_ids(match_query, schema))
+        else:
+            text_filter = db.or_(
+                model.requester_name.ilike(f'%{search_query}%'),
+                model.description.ilike(f'%{search_query}%')
+            )
+        if search_query.isdigit():
+            text_filter = db.or_(model.id == int(search_query), text_filter)
+        query = query.filter(text_filter)
+    
+    if status_filter:
+        query = query.filter(model.status == status_filter)
+    
+    if assigned_filter:
+        if assigned_filter == 'unassigned':
+            query = query.filter(model.assigned_to_id.is_(None))
+        else:
+            query = query.filter(model.assigned_to_id == int(assigned_filter))
+    
+    return query
+
+
+def include_archive(status_filter=''):
+    """True if the dashboard list should also search the archived tickets:
+    when filtering on RISOLTO, or on any status with the `archive=1` flag"""
+    if not app.config['ARCHIVE_ENABLED'] or status_filter not in ('', 'RISOLTO'):
         return False
+    return status_filter == 'RISOLTO' or request.args.get('archive') == '1'
+
+
+def dashboard_list_query(search_query='', status_filter='', assigned_filter='', archive=False):
+    """Filtered dashboard query; with `archive`, a UNION ALL of the live and the archived matches"""
+    query = filter_tickets(dashboard_ticket_query(), search_query, status_filter, assigned_filter)
+    if archive:
+        query = query.union_all(filter_tickets(
+            dashboard_ticket_query(ArchivedTicket), search_query, status_filter, assigned_filter, model=ArchivedTicket
+        ))
+    return query
+
+
+AdminChoice = namedtuple('AdminChoice', 'id username')
+
+
+def get_admin_choices():
+    """(id, username) of all operators for the dropdowns, cached until a user changes"""
+    key = f"admins:{cache_versions().get('users', 0)}"
+    admins = data_cache.get(key)
+    if admins is None:
+        admins = [AdminChoice(*row) for row in db.session.execute(db.select(User.id, User.username).order_by(User.username))]
+        data_cache.set(key, admins)
+    return admins
+
+
+def count_tickets(search_query='', status_filter='', assigned_filter='', archive=False):
+    """Number of tickets matching the dashboard filters, cached until a ticket changes"""
+    key = f"count:{cache_versions().get('tickets', 0)}:{status_filter}:{assigned_filter}:{int(archive)}:{search_query}"
+    total = data_cache.get(key)
+    if total is None:
+        total = count_tickets_query(search_query, status_filter, assigned_filter, archive).scalar()
+        data_cache.set(key, total)
+    return total
+
+
+def count_tickets_query(search_query='', status_filter='', assigned_filter='', archive=False):
+    """Query counting the tickets matching the dashboard filters"""
+    query = filter_tickets(db.session.query(db.func.count(Ticket.id)), search_query, status_filter, assigned_filter)
+    if archive:
+        # Both counts in one statement
+        archived = filter_tickets(db.session.query(db.func.count(ArchivedTicket.id)), search_query,
+                                  status_filter, assigned_filter, model=ArchivedTicket)
+        query = db.session.query(query.scalar_subquery() + archived.scalar_subquery())
+    return query
+
+
+def count_tickets_by_status():
+    """{status: number of tickets} plus 'ARCHIVIATO' for the archive, cached until a ticket changes"""
+    key = f"status_counts:{cache_versions().get('tickets', 0)}"
+    counts = data_cache.get(key)
+    if counts is None:
+        query = db.select(Ticket.status, db.func.count(Ticket.id)).group_by(Ticket.status)
+        if app.config['ARCHIVE_ENABLED']:
+            query = query.union_all(db.select(db.literal('ARCHIVIATO'), db.func.count(ArchivedTicket.id)))
+        counts = dict(db.session.execute(query).all())
+        data_cache.set(key, counts)
+    return counts
+
+
+def render_ticket_rows(tickets):
+    """Rendered <tr> fragments of the dashboard table, cached per ticket version"""
+    users_version = cache_versions().get('users', 0)
+    keys = [f"{'archived_row' if t.archived else 'row'}:{t.id}:{(t.updated_at or t.created_at).isoformat()}:{users_version}"
+            for t in tickets]
+    rows = data_cache.get_many(keys)
+    missing = {}
+    template = app.jinja_env.get_template('_ticket_row.html')
+    started = time.perf_counter()
+    for key, ticket in zip(keys, tickets):
+        if key not in rows:
+            missing[key] = rows[key] = Markup(template.render(ticket=ticket))
+    if missing:
+        record_fragment_time(template, time.perf_counter() - started)
+    data_cache.set_many(missing)
+    return [rows[key] for key in keys]
+
+
+def record_fragment_time(template, elapsed):
+    """Count a fragment rendered outside render_template in the request's template time"""
+    g.template_time = g.get('template_time', 0.0) + elapsed
+    metrics_registry.observe('fixit_template_render_seconds', elapsed, template=template.name)
+
+
+def render_fragment(key, template_name, get_context):
+    """Rendered fragment template, cached under `key` (which must change with its data).
+
+    `get_context()` returns the template variables and runs only on a miss,
+    so the queries behind a cached fragment are skipped too.
+    """
+    html = data_cache.get(key)
+    if html is None:
+        template = app.jinja_env.get_template(template_name)
+        context = get_context()
+        started = time.perf_counter()
+        html = Markup(template.render(**context))
+        record_fragment_time(template, time.perf_counter() - started)
+        data_cache.set(key, html)
+    return html
+
+
+def ticket_fragments(ticket, archived=False):
+    """Header card, comment thread and assignment options of the detail page.
+
+    Header and comments are cached until the ticket's updated_at moves (new
+    comments and processed photos move it too); the options until a user
+    changes or the ticket is reassigned.
+    """
+    prefix = 'archived_' if archived else ''
+    version = f'{ticket.id}:{(ticket.updated_at or ticket.created_at).isoformat()}'
+    comment_model = ArchivedComment if archived else Comment
+    fragments = {
+        'ticket_header': render_fragment(f'{prefix}ticket_header:{version}', '_ticket_header.html',
+                                         lambda: {'ticket': ticket}),
+        'comment_thread': render_fragment(f'{prefix}comments:{version}', '_ticket_comments.html', lambda: {
+            'comments': comment_model.query.filter_by(ticket_id=ticket.id)
+                                           .order_by(comment_model.created_at.desc()).all()
+        }),
+    }
+    if not archived:
+        key = f"assign_options:{cache_versions().get('users', 0)}:{ticket.assigned_to_id}"
+        fragments['assign_options'] = render_fragment(key, '_assign_options.html', lambda: {
+            'admins': get_admin_choices(), 'assigned_to_id': ticket.assigned_to_id
+        })
+    return fragments
+
+
+def dashboard_ticket_query(model=None):
+    """Query of only the columns shown in the dashboard table, with the assignee
+    username joined in the same statement (no per-row lazy loads)"""
+    model = model or Ticket
+    return db.session.query(
+        model.id,
+        model.ticket_type,
+        model.status,
+        model.created_at,
+        model.requester_name,
+        model.anomaly_category,
+        model.title,
+        model.priority,
+        model.image_filename,
+        model.updated_at,
+        User.username.label('assignee_username'),
+        db.literal(model is ArchivedTicket).label('archived')
+    ).outerjoin(User, model.assigned_to_id == User.id)
 
 
 def login_required(f):
@@ -233,8 +1352,164 @@ def superuser_required(f):
     return decorated_function
 
 
+# ==================== ARCHIVE ====================
+#
+# Resolved tickets older than ARCHIVE_AFTER_DAYS live in the attached `archive`
+# database, so the live tables, their indexes and the dashboard queries only
+# carry the active queue and recent history. With WAL a transaction spanning
+# two database files is atomic in each file but not across them, so tickets
+# are first copied (one commit in the archive), then deleted from the live
+# tables (one commit in the main file): a crash in between leaves a copy in
+# both places, which the next run cleans up, never a lost ticket.
+
+def _column_names(table, skip=()):
+    return [column.name for column in table.columns if column.name not in skip]
+
+
+def archivable_ticket_ids(cutoff, limit):
+    """Ids of up to `limit` tickets resolved before `cutoff`, oldest first.
+
+    The newest ticket is never archived: SQLite gives the next ticket the
+    largest id + 1, so deleting it would hand its id out again. Tickets
+    whose id is already taken by another archived ticket (only possible
+    after deleting the newest tickets by hand) stay live.
+    """
+    newest = db.select(db.func.max(Ticket.id)).scalar_subquery()
+    archived = ArchivedTicket.__table__.alias('archived')  # both tables are called `tickets`
+    id_taken = db.select(archived.c.id).where(
+        archived.c.id == Ticket.id, archived.c.created_at != Ticket.created_at
+    ).exists()
+    return db.session.execute(
+        db.select(Ticket.id)
+        .where(Ticket.status == 'RISOLTO', Ticket.closed_at < cutoff, Ticket.id != newest, ~id_taken)
+        .order_by(Ticket.closed_at)
+        .limit(limit)
+    ).scalars().all()
+
+
+def copy_to_archive(ids):
+    """Copy the tickets `ids` and their comments into the archive (replacing leftovers of an interrupted run)"""
+    tickets, archived_tickets = Ticket.__table__, ArchivedTicket.__table__
+    comments, archived_comments = Comment.__table__, ArchivedComment.__table__
+    db.session.execute(db.delete(archived_comments).where(archived_comments.c.ticket_id.in_(ids)))
+    db.session.execute(db.delete(archived_tickets).where(archived_tickets.c.id.in_(ids)))
+    columns = _column_names(tickets)
+    db.session.execute(db.insert(archived_tickets).from_select(
+        columns, db.select(*[tickets.c[name] for name in columns]).where(tickets.c.id.in_(ids))
+    ))
+    # Comments get new ids in the archive: live comment ids are reused once the newest is archived
+    columns = _column_names(comments, skip=('id',))
+    db.session.execute(db.insert(archived_comments).from_select(
+        columns, db.select(*[comments.c[name] for name in columns]).where(comments.c.ticket_id.in_(ids)).order_by(comments.c.id)
+    ))
+
+
+def delete_archived_from_live(ids):
+    """Delete the tickets `ids` whose archive copy is current; return the ids deleted.
+
+    A ticket changed since it was copied (comment, status change...) has a
+    newer updated_at than its copy and stays live.
+    """
+    tickets, archived_tickets = Ticket.__table__, ArchivedTicket.__table__.alias('archived')
+    current = db.select(archived_tickets.c.id).where(
+        archived_tickets.c.id == tickets.c.id, archived_tickets.c.updated_at == tickets.c.updated_at
+    ).exists()
+    moved = db.session.execute(db.select(tickets.c.id).where(tickets.c.id.in_(ids), current)).scalars().all()
+    if moved:
+        db.session.execute(db.delete(Comment.__table__).where(Comment.__table__.c.ticket_id.in_(moved)))
+        db.session.execute(db.delete(tickets).where(tickets.c.id.in_(moved)))
+        # The rollup triggers just subtracted these tickets: archived tickets keep counting
+        analytics.add_tickets(db.session.connection(), f'{ARCHIVE_SCHEMA}.tickets', moved)
+    return moved
+
+
+def archive_tickets(cutoff, batch_size=500):
+    """Move tickets resolved before `cutoff` (with comments and photos) to the archive; return how many"""
+    archived = 0
+    while True:
+        with write_transaction():
+            ids = archivable_ticket_ids(cutoff, batch_size)
+            if ids:
+                copy_to_archive(ids)
+            db.session.commit()
+        if not ids:
+            break
+        with write_transaction():
+            moved = delete_archived_from_live(ids)
+            db.session.commit()
+        stale = set(ids) - set(moved)
+        if stale:
+            with write_transaction():
+                archived_comments = ArchivedComment.__table__
+                db.session.execute(db.delete(archived_comments).where(archived_comments.c.ticket_id.in_(stale)))
+                db.session.execute(db.delete(ArchivedTicket.__table__).where(ArchivedTicket.__table__.c.id.in_(stale)))
+                db.session.commit()
+        filenames = set(db.session.execute(
+            db.select(ArchivedTicket.image_filename).where(ArchivedTicket.id.in_(moved), ArchivedTicket.image_filename.isnot(None))
+        ).scalars())
+        in_use = set(db.session.execute(
+            db.select(Ticket.image_filename).where(Ticket.image_filename.in_(filenames))
+        ).scalars())
+        db.session.commit()
+        release_images(filenames - in_use)
+        archived += len(moved)
+        if not moved or len(ids) < batch_size:
+            break
+    return archived
+
+
+def restore_ticket(ticket_id):
+    """Move an archived ticket and its comments back to the live tables (in the current transaction).
+
+    Both files are written in one transaction here: if the commit is cut
+    short the ticket ends up in both places, never in neither.
+    """
+    tickets, archived_tickets = Ticket.__table__, ArchivedTicket.__table__
+    comments, archived_comments = Comment.__table__, ArchivedComment.__table__
+    image_filename = db.session.execute(
+        db.select(archived_tickets.c.image_filename).where(archived_tickets.c.id == ticket_id)
+    ).scalar()
+    # The insert trigger adds the ticket to the rollups again
+    analytics.add_tickets(db.session.connection(), f'{ARCHIVE_SCHEMA}.tickets', [ticket_id], sign=-1)
+    columns = _column_names(tickets)
+    db.session.execute(db.insert(tickets).from_select(
+        columns, db.select(*[archived_tickets.c[name] for name in columns]).where(archived_tickets.c.id == ticket_id)
+    ))
+    columns = _column_names(comments, skip=('id',))
+    db.session.execute(db.insert(comments).from_select(
+        columns, db.select(*[archived_comments.c[name] for name in columns])
+        .where(archived_comments.c.ticket_id == ticket_id).order_by(archived_comments.c.id)
+    ))
+    db.session.execute(db.delete(archived_comments).where(archived_comments.c.ticket_id == ticket_id))
+    db.session.execute(db.delete(archived_tickets).where(archived_tickets.c.id == ticket_id))
+    if image_filename:
+        images.move_image(app.config['ARCHIVE_UPLOAD_FOLDER'], app.config['UPLOAD_FOLDER'], image_filename)
+
+
 # ==================== PUBLIC ROUTES ====================
 
+def submit_ticket(**fields):
+    """Store a new ticket and its notification (group-committed, see commit_write); return its id"""
+    def write(session):
+        ticket = Ticket(**fields)
+        session.add(ticket)
+        session.flush()
+        queue_new_ticket_notification(ticket, session)
+        return ticket.id
+
+    ticket_id = commit_write(write)
+    notification_worker.wake()
+    return ticket_id
+
+
+def ticket_created_response(ticket_id):
+    """Back to the homepage with a message, or `{"id": ...}` for a form submitted in the background"""
+    if wants_json():
+        return jsonify({'id': ticket_id}), 201
+    flash(f'Ticket #{ticket_id} creato con successo!', 'success')
+    return redirect(url_for('index'))
+
+
 @app.route('/')
 def index():
     """Homepage with ticket type selection"""
@@ -242,6 +1517,8 @@ def index():
 
 
 @app.route('/new/mezzi', methods=['GET', 'POST'])
+@limiter.limit(lambda: app.config['TICKET_FORM_RATE_LIMIT'], methods=['POST'])
+@group_committed_view
 def new_mezzi():
     """Form for Vehicle Intervention tickets"""
     if request.method == 'POST':
@@ -253,19 +1530,10 @@ def new_mezzi():
         description = request.form.get('description')
         
         # Handle file upload
-        image_filename = None
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Add timestamp to filename to avoid conflicts
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{timestamp}_{filename}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                image_filename = filename
+        image_filename = save_uploaded_image(request.files.get('image'))
         
         # Create new ticket
-        ticket = Ticket(
+        ticket_id = submit_ticket(
             ticket_type='MEZZO',
             requester_name=requester_name,
             vehicle_type=vehicle_type,
@@ -274,15 +1542,7 @@ def new_mezzi():
             description=description,
             image_filename=image_filename
         )
-        
-        db.session.add(ticket)
-        db.session.commit()
-
-        if not send_new_ticket_notification(ticket):
-            flash('Ticket creato, ma la notifica email non è stata inviata.', 'warning')
-        
-        flash(f'Ticket #{ticket.id} creato con successo!', 'success')
-        return redirect(url_for('index'))
+        return ticket_created_response(ticket_id)
     
     # Anomaly categories
     anomaly_categories = [
@@ -303,6 +1563,8 @@ def new_mezzi():
 
 
 @app.route('/new/tecnico', methods=['GET', 'POST'])
+@limiter.limit(lambda: app.config['TICKET_FORM_RATE_LIMIT'], methods=['POST'])
+@group_committed_view
 def new_tecnico():
     """Form for Technical Intervention tickets"""
     if request.method == 'POST':
@@ -313,19 +1575,10 @@ def new_tecnico():
         description = request.form.get('description')
         
         # Handle file upload
-        image_filename = None
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Add timestamp to filename to avoid conflicts
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{timestamp}_{filename}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                image_filename = filename
+        image_filename = save_uploaded_image(request.files.get('image'))
         
         # Create new ticket
-        ticket = Ticket(
+        ticket_id = submit_ticket(
             ticket_type='TECNICO',
             requester_name=requester_name,
             title=title,
@@ -333,32 +1586,47 @@ def new_tecnico():
             description=description,
             image_filename=image_filename
         )
-        
-        db.session.add(ticket)
-        db.session.commit()
-
-        if not send_new_ticket_notification(ticket):
-            flash('Ticket creato, ma la notifica email non è stata inviata.', 'warning')
-        
-        flash(f'Ticket #{ticket.id} creato con successo!', 'success')
-        return redirect(url_for('index'))
+        return ticket_created_response(ticket_id)
     
     return render_template('form_tecnico.html')
 
 
 # ==================== ADMIN ROUTES ====================
 
+def login_username_key():
+    """Rate limit key of a login attempt: the username, whatever the client IP"""
+    return 'login:' + request.form.get('username', '').strip().lower()
+
+
 @app.route('/admin/login', methods=['GET', 'POST'])
-@limiter.limit("10 per minute")
+@limiter.limit(lambda: app.config['LOGIN_RATE_LIMIT'])
+@limiter.limit(lambda: app.config['LOGIN_USER_RATE_LIMIT'], key_func=login_username_key, methods=['POST'])
+@read_only_view
 def login():
     """Admin login"""
     if request.method == 'POST':
         username = request.form.get('username')
-        password = request.form.get('password')
+        password = request.form.get('password') or ''
+        
+        user = db.session.execute(
+            db.select(User.id, User.username, User.password_hash, User.is_superuser).where(User.username == username)
+        ).first()
+        # Release the connection while the password is hashed on the pool
+        db.session.rollback()
         
-        user = User.query.filter_by(username=username).first()
+        try:
+            valid = password_hasher.verify(user.password_hash if user else None, password)
+        except passwords.HasherBusy:
+            flash('Troppi accessi in corso, riprova tra qualche secondo.', 'warning')
+            return render_template('login.html'), 503
         
-        if user and user.check_password(password):
+        if valid:
+            if password_hasher.needs_rehash(user.password_hash):
+                # Hash parameters changed: store the password with the current ones
+                new_hash = password_hasher.hash(password)
+                with write_transaction():
+                    db.session.execute(db.update(User).where(User.id == user.id).values(password_hash=new_hash))
+                    db.session.commit()
             session['user_id'] = user.id
             session['username'] = user.username
             session['is_superuser'] = user.is_superuser
@@ -381,6 +1649,7 @@ def logout():
 
 @app.route('/admin/dashboard')
 @login_required
+@query_budget(6)
 def dashboard():
     """Admin dashboard with ticket list and filters"""
     # Get filter parameters
@@ -389,37 +1658,408 @@ def dashboard():
     assigned_filter = request.args.get('assigned', '').strip()
     page = request.args.get('page', 1, type=int)
     per_page = 50
+    archive = include_archive(status_filter)
     
-    # Base query
-    query = Ticket.query
+    query = dashboard_list_query(search_query, status_filter, assigned_filter, archive)
+    total = count_tickets(search_query, status_filter, assigned_filter, archive)
+    paging_mode = request.args.get('paging') or app.config['DASHBOARD_PAGINATION']
     
-    # Apply filters
-    if search_query:
-        query = query.filter(
-            db.or_(
-                Ticket.id == int(search_query) if search_query.isdigit() else False,
-                Ticket.requester_name.ilike(f'%{search_query}%'),
-                Ticket.description.ilike(f'%{search_query}%')
-            )
+    if paging_mode == 'cursor':
+        # Keyset pagination on (created_at, id): no OFFSET, deep pages cost the same as page 1
+        pagination = paging.keyset_paginate(
+            query, Ticket.created_at, Ticket.id, per_page,
+            after=request.args.get('after'), before=request.args.get('before')
         )
-    
-    if status_filter:
-        query = query.filter(Ticket.status == status_filter)
-    
-    if assigned_filter:
-        if assigned_filter == 'unassigned':
-            query = query.filter(Ticket.assigned_to_id.is_(None))
-        else:
-            query = query.filter(Ticket.assigned_to_id == int(assigned_filter))
-    
-    # Sort by newest first with pagination
-    pagination = query.order_by(Ticket.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    else:
+        # Sort by newest first with pagination (the total comes from the count cache)
+        # Relevance ranking comes from the full-text index, which has no archived tickets
+        pagination = order_tickets(query, '' if archive else search_query).paginate(
+            page=page, per_page=per_page, error_out=False, count=False
+        )
+        pagination.total = total
     tickets = pagination.items
     
     # Get all admins for filter dropdown
-    admins = User.query.all()
+    admins = get_admin_choices()
+
+    # Position in the change log the page's live updates start from
+    live_seq = live.last_seq(db.session.connection()) if app.config['LIVE_UPDATES_ENABLED'] else None
     
-    return render_template('dashboard.html', tickets=tickets, admins=admins, pagination=pagination, per_page=per_page)
+    return render_template('dashboard.html', tickets=tickets, ticket_rows=render_ticket_rows(tickets),
+                           admins=admins, pagination=pagination, per_page=per_page, total=total,
+                           status_counts=count_tickets_by_status(), paging_mode=paging_mode, live_seq=live_seq,
+                           archive=archive)
+
+
+@app.route('/admin/api/tickets')
+@login_required
+@query_budget(4)
+def api_tickets():
+    """Cursor-paginated ticket list (JSON) with the same filters as the dashboard"""
+    search_query = request.args.get('search', '').strip()
+    status_filter = request.args.get('status', '').strip()
+    assigned_filter = request.args.get('assigned', '').strip()
+    per_page = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    archive = include_archive(status_filter)
+
+    query = dashboard_list_query(search_query, status_filter, assigned_filter, archive)
+    page = paging.keyset_paginate(
+        query, Ticket.created_at, Ticket.id, per_page,
+        after=request.args.get('after'), before=request.args.get('before')
+    )
+    payload = {
+        'items': [{
+            'id': t.id,
+            'ticket_type': t.ticket_type,
+            'status': t.status,
+            'created_at': t.created_at.isoformat(),
+            'requester_name': t.requester_name,
+            'title': t.title,
+            'anomaly_category': t.anomaly_category,
+            'priority': t.priority,
+            'has_image': bool(t.image_filename),
+            'assigned_to': t.assignee_username,
+            'archived': t.archived,
+        } for t in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    }
+    if request.args.get('count', '1') != '0':
+        payload['total'] = count_tickets(search_query, status_filter, assigned_filter, archive)
+    return jsonify(payload)
+
+
+@app.route('/admin/events')
+@login_required
+@query_budget(3)
+def poll_events():
+    """Ticket change events after `after` (JSON), polled by the open dashboards"""
+    if not app.config['LIVE_UPDATES_ENABLED']:
+        abort(404)
+    after = max(request.args.get('after', 0, type=int), 0)
+    connection = db.session.connection()
+    events, truncated = live.events_after(connection, after)
+    # After a gap the page reloads and continues from the current end of the log
+    last = live.last_seq(connection) if truncated else (events[-1]['seq'] if events else after)
+    return jsonify({'events': events, 'last_seq': last, 'truncated': truncated})
+
+
+@app.route('/admin/events/stream')
+@login_required
+@query_budget(0)
+def stream_events():
+    """Server-Sent Events stream of ticket changes (only with LIVE_UPDATES_STREAM).
+
+    The stream waits on the worker's shared broadcaster instead of querying
+    the database itself, and ends after LIVE_STREAM_TIMEOUT seconds; the
+    browser then reconnects with Last-Event-ID and misses nothing.
+    """
+    if not (app.config['LIVE_UPDATES_ENABLED'] and app.config['LIVE_UPDATES_STREAM']):
+        abort(404)
+    after = request.headers.get('Last-Event-ID', request.args.get('after', '0'))
+    after = max(int(after), 0) if after.isdigit() else 0
+    engine = db.engine
+    deadline = time.monotonic() + app.config['LIVE_STREAM_TIMEOUT']
+
+    def generate(after):
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            latest = live_broadcaster.wait(engine, after, timeout=min(15, max(deadline - time.monotonic(), 0)))
+            if latest is None or latest == after:
+                yield ': keepalive\n\n'
+                continue
+            with engine.connect() as conn:
+                events, truncated = live.events_after(conn, after)
+            if truncated:
+                yield 'event: reset\ndata: {}\n\n'
+                return
+            for item in events:
+                yield f"id: {item['seq']}\nevent: ticket\ndata: {json.dumps(item)}\n\n"
+            after = events[-1]['seq'] if events else latest
+
+    response = app.response_class(generate(after), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/admin/dashboard/rows')
+@login_required
+@query_budget(4)
+def dashboard_rows():
+    """Rendered dashboard rows of the changed tickets `ids` that match the page's filters.
+
+    Returns {'rows': [{'id', 'html'}, ...] newest first, 'removed': [ids]}: the
+    page replaces or inserts the rows and drops the removed ones (deleted or
+    no longer matching the filters).
+    """
+    ids = [int(value) for value in request.args.get('ids', '').split(',') if value.isdigit()][:100]
+    status_filter = request.args.get('status', '').strip()
+    # With the archive included, a ticket just moved there keeps its row
+    query = dashboard_list_query(
+        request.args.get('search', '').strip(),
+        status_filter,
+        request.args.get('assigned', '').strip(),
+        include_archive(status_filter),
+    ).filter(Ticket.id.in_(ids)).order_by(Ticket.created_at.desc(), Ticket.id.desc())
+    tickets = query.all() if ids else []
+    found = {t.id for t in tickets}
+    return jsonify({
+        'rows': [{'id': t.id, 'html': str(html)} for t, html in zip(tickets, render_ticket_rows(tickets))],
+        'removed': [ticket_id for ticket_id in ids if ticket_id not in found],
+    })
+
+
+@app.before_request
+def hide_legacy_uploads():
+    """Photos left in static/uploads (see move-uploads) are not public static files"""
+    if request.endpoint == 'static':
+        filename = posixpath.normpath(request.view_args.get('filename', '').lstrip('/'))
+        if filename.split('/')[0] == 'uploads':
+            abort(404)
+
+
+def login_or_token_required(f):
+    """login_required that also accepts the API's Bearer token (see api_login_required)"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.headers.get('Authorization', '').startswith('Bearer '):
+            return api_login_required(f)(*args, **kwargs)
+        return login_required(f)(*args, **kwargs)
+    return decorated_function
+
+
+@app.route('/media/<path:filename>')
+@login_or_token_required
+@query_budget(2)  # Bearer token check (version counters, then the token until cached); none with a session
+def media(filename):
+    """Serve an uploaded image to logged-in operators and API clients (image_url in API responses).
+
+    Conditional GETs are answered with 304 from the ETag alone. URLs carrying
+    the current fingerprint (`v`, see image_url) are cached for a year as
+    immutable. With MEDIA_ACCEL_REDIRECT/USE_X_SENDFILE only the headers are
+    produced here and the web server streams the file.
+    """
+    path = media_path(filename)
+    if path is None:
+        abort(404)
+    etag = media_fingerprint(path)
+
+    # The web server's internal location only maps the upload folder: archived photos are sent from here
+    accel_prefix = app.config['MEDIA_ACCEL_REDIRECT']
+    if accel_prefix and path == safe_join(app.config['UPLOAD_FOLDER'], filename):
+        response = app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename
+        response.set_etag(etag)
+        response.make_conditional(request)
+    else:
+        response = send_file(os.path.abspath(path), etag=etag, conditional=True, max_age=None)
+
+    if request.args.get('v') == etag:
+        response.headers['Cache-Control'] = f"private, max-age={app.config['MEDIA_MAX_AGE']}, immutable"
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Export datasets: column headers, query of the rows for a (ticket, comment) model pair
+# (live or archived) and the columns the merged rows are sorted on
+ExportDataset = namedtuple('ExportDataset', 'headers build_query order_by')
+
+EXPORT_DATASETS = {
+    'tickets': ExportDataset(
+        ['ID', 'Tipo', 'Status', 'Creato il', 'Preso in carico il', 'Chiuso il', 'Richiedente', 'Mezzo',
+         'Numero mezzo', 'Categoria anomalia', 'Reparto', 'Titolo', 'Priorità', 'Assegnato a', 'Descrizione'],
+        lambda ticket, comment: db.session.query(
+            ticket.id, ticket.ticket_type, ticket.status, ticket.created_at, ticket.started_at, ticket.closed_at,
+            ticket.requester_name, ticket.vehicle_type, ticket.vehicle_number, ticket.anomaly_category,
+            ticket.department, ticket.title, ticket.priority, User.username, ticket.description
+        ).outerjoin(User, ticket.assigned_to_id == User.id),
+        lambda: (Ticket.id,),
+    ),
+    'comments': ExportDataset(
+        ['ID commento', 'ID ticket', 'Tipo ticket', 'Autore', 'Data', 'Commento'],
+        lambda ticket, comment: db.session.query(
+            comment.id, ticket.id, ticket.ticket_type, comment.author_name, comment.created_at, comment.body
+        ).join(ticket, comment.ticket_id == ticket.id),
+        lambda: (Ticket.id, Comment.id),
+    ),
+}
+
+
+@app.route('/admin/export')
+@login_required
+def export_tickets():
+    """Stream the tickets (or their comments) matching the dashboard filters as CSV or XLSX,
+    archived ones included like in the dashboard list (see include_archive).
+
+    Rows are read with a server-side cursor in batches (yield_per) and written
+    out as they arrive, so memory use does not grow with the export size.
+    """
+    file_format = request.args.get('format', 'csv')
+    dataset = request.args.get('dataset', 'tickets')
+    if file_format not in ('csv', 'xlsx') or dataset not in EXPORT_DATASETS:
+        abort(400)
+    headers, build_query, order_by = EXPORT_DATASETS[dataset]
+    filters = (
+        request.args.get('search', '').strip(),
+        request.args.get('status', '').strip(),
+        request.args.get('assigned', '').strip(),
+    )
+    query = filter_tickets(build_query(Ticket, Comment), *filters)
+    # Same rows as the dashboard list: archived tickets too for RISOLTO or with archive=1
+    if include_archive(filters[1]):
+        query = query.union_all(
+            filter_tickets(build_query(ArchivedTicket, ArchivedComment), *filters, model=ArchivedTicket)
+        )
+    query = query.order_by(*order_by())
+    rows = query.execution_options(stream_results=True).yield_per(export.BATCH_ROWS)
+
+    filename = f"fixit-{dataset}-{datetime.now().strftime('%Y%m%d-%H%M')}.{file_format}"
+    if file_format == 'xlsx':
+        chunks = export.iter_xlsx(headers, rows, sheet_name='Commenti' if dataset == 'comments' else 'Ticket')
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        chunks = export.iter_csv(headers, rows)
+        mimetype = 'text/csv; charset=utf-8'
+        if request.args.get('compress') == 'gzip':
+            chunks = export.gzip_chunks(chunks)
+            mimetype = 'application/gzip'
+            filename += '.gz'
+
+    response = app.response_class(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: pass chunks through as they are produced
+    return response
+
+
+TICKET_STATUSES = ('NUOVO', 'IN_LAVORAZIONE', 'RISOLTO')
+BULK_DELETE_CHUNK = 5000
+
+
+@app.route('/admin/tickets/bulk', methods=['POST'])
+@login_required
+def bulk_update_tickets():
+    """Change status/assignee of, or delete, the selected tickets or the whole filter result.
+
+    Each action is a single set-based UPDATE (or DELETE in chunks), with the
+    same started_at/closed_at rules as the ticket detail page.
+    """
+    action = request.form.get('action', '')
+    scope = request.form.get('scope', 'selected')
+    search_query = request.form.get('search', '').strip()
+    status_filter = request.form.get('status', '').strip()
+    assigned_filter = request.form.get('assigned', '').strip()
+    back = redirect(url_for('dashboard', **{key: value for key, value in (
+        ('search', search_query), ('status', status_filter), ('assigned', assigned_filter)) if value}))
+
+    if scope == 'filter':
+        target = filter_tickets(db.session.query(Ticket.id), search_query, status_filter, assigned_filter).subquery()
+        condition = Ticket.id.in_(db.select(target.c.id))
+    else:
+        selected = {int(ticket_id) for ticket_id in request.form.getlist('ticket_ids') if ticket_id.isdigit()}
+        if not selected:
+            flash('Nessun ticket selezionato.', 'warning')
+            return back
+        condition = Ticket.id.in_(selected)
+
+    if action.startswith('status:'):
+        new_status = action.split(':', 1)[1]
+        if new_status not in TICKET_STATUSES:
+            flash('Status non valido.', 'danger')
+            return back
+        now = datetime.utcnow()
+        values = {'status': new_status}
+        if new_status == 'IN_LAVORAZIONE':
+            values['started_at'] = db.case((Ticket.status == 'NUOVO', now), else_=Ticket.started_at)
+        elif new_status == 'RISOLTO':
+            values['closed_at'] = now
+        result = db.session.execute(
+            db.update(Ticket).where(condition, Ticket.status != new_status).values(**values),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        flash(f'Status aggiornato per {result.rowcount} ticket.', 'success')
+
+    elif action == 'assign':
+        assigned_id = request.form.get('assigned_to_id', 'none')
+        new_assignee = None
+        if assigned_id != 'none':
+            new_assignee = db.session.get(User, int(assigned_id)) if assigned_id.isdigit() else None
+            if new_assignee is None:
+                flash('Operatore non trovato.', 'danger')
+                return back
+            new_assignee = new_assignee.id
+        result = db.session.execute(
+            db.update(Ticket).where(condition, Ticket.assigned_to_id.is_distinct_from(new_assignee))
+            .values(assigned_to_id=new_assignee),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        flash(f'Assegnazione aggiornata per {result.rowcount} ticket.', 'success')
+
+    elif action == 'delete':
+        if request.form.get('confirmed') != '1':
+            flash("Conferma l'eliminazione dei ticket selezionati.", 'warning')
+            return back
+        # Resolve the ids first: deleting comments changes what a full-text filter matches
+        ticket_ids = db.session.execute(db.select(Ticket.id).where(condition)).scalars().all()
+        filenames = set()
+        for start in range(0, len(ticket_ids), BULK_DELETE_CHUNK):
+            chunk = ticket_ids[start:start + BULK_DELETE_CHUNK]
+            filenames.update(db.session.execute(
+                db.select(Ticket.image_filename).where(Ticket.id.in_(chunk), Ticket.image_filename.isnot(None))
+            ).scalars())
+            db.session.execute(db.delete(Comment).where(Comment.ticket_id.in_(chunk)),
+                               execution_options={'synchronize_session': False})
+            db.session.execute(db.delete(Ticket).where(Ticket.id.in_(chunk)),
+                               execution_options={'synchronize_session': False})
+        db.session.commit()
+        if filenames:
+            image_processor.run_task(sweep_orphan_images, sorted(filenames))
+        flash(f'{len(ticket_ids)} ticket eliminati.', 'success')
+
+    else:
+        flash('Azione non valida.', 'danger')
+    return back
+
+
+@app.route('/admin/metrics')
+@login_required
+@superuser_required
+@query_budget(0)
+def export_metrics():
+    """Performance metrics of all workers in Prometheus text format (superuser only)"""
+    directory = app.config['METRICS_DIR']
+    metrics_registry.flush(directory)
+    return app.response_class(metrics_registry.render(directory), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/admin/analytics')
+@login_required
+@query_budget(5)
+def analytics_view():
+    """SLA times, open-ticket aging and daily flow, read from the rollup tables only"""
+    if db.engine.dialect.name != 'sqlite':
+        flash('Statistiche disponibili solo con database SQLite.', 'warning')
+        return redirect(url_for('dashboard'))
+    dimension = request.args.get('by', 'ticket_type')
+    if dimension not in analytics.DIMENSIONS:
+        dimension = 'ticket_type'
+    days = min(max(request.args.get('days', 30, type=int), 7), 365)
+    today = datetime.utcnow().date()
+    connection = db.session.connection()
+    return render_template(
+        'analytics.html',
+        dimension=dimension,
+        days=days,
+        sla=analytics.sla_stats(connection, dimension),
+        aging=analytics.open_ticket_aging(connection, today),
+        aging_bounds=analytics.AGING_BUCKETS,
+        flow=analytics.daily_flow(connection, today, days),
+        admin_names={str(admin.id): admin.username for admin in get_admin_choices()},
+    )
 
 
 @app.route('/admin/users', methods=['GET', 'POST'])
@@ -483,49 +2123,56 @@ def manage_users():
     return render_template('users.html', users=users)
 
 
+def commit_ticket_change(ticket_id, change):
+    """Apply `change(ticket)` to a live ticket through commit_write.
+
+    The ticket is loaded again in the write's session (from the identity map
+    when not batching). Returns False if it was deleted in the meantime.
+    """
+    def write(session):
+        ticket = session.get(Ticket, ticket_id)
+        if ticket is None:
+            return False
+        change(ticket)
+        return True
+
+    return commit_write(write)
+
+
 @app.route('/admin/ticket/<int:ticket_id>', methods=['GET', 'POST'])
 @login_required
+@query_budget(6)
+@group_committed_view
 def ticket_detail(ticket_id):
     """View and edit ticket details"""
-    ticket = Ticket.query.get_or_404(ticket_id)
-    comments = Comment.query.filter_by(ticket_id=ticket_id).order_by(Comment.created_at.desc()).all()
+    ticket = Ticket.query.options(db.joinedload(Ticket.assigned_to)).filter_by(id=ticket_id).first()
+    if ticket is None:
+        return archived_ticket_detail(ticket_id)
     
     if request.method == 'POST':
         action = request.form.get('action')
+        stored, message = True, None
         
         if action == 'update_status':
+            # Also updates started_at/closed_at
             new_status = request.form.get('status')
-            old_status = ticket.status
-            ticket.status = new_status
-            
-            # Update timestamps based on status change
-            if new_status == 'IN_LAVORAZIONE' and old_status == 'NUOVO':
-                ticket.started_at = datetime.utcnow()
-            elif new_status == 'RISOLTO' and old_status != 'RISOLTO':
-                ticket.closed_at = datetime.utcnow()
-            
-            db.session.commit()
-            flash('Status aggiornato con successo!', 'success')
+            stored = commit_ticket_change(ticket_id, lambda t: set_ticket_status(t, new_status))
+            message = 'Status aggiornato con successo!'
         
         elif action == 'assign':
             assigned_id = request.form.get('assigned_to_id')
             if assigned_id:
-                ticket.assigned_to_id = int(assigned_id) if assigned_id != 'none' else None
+                assigned_to_id = int(assigned_id) if assigned_id != 'none' else None
             else:
-                ticket.assigned_to_id = None
+                assigned_to_id = None
             
-            db.session.commit()
-            flash('Assegnazione aggiornata con successo!', 'success')
+            stored = commit_ticket_change(ticket_id, lambda t: setattr(t, 'assigned_to_id', assigned_to_id))
+            message = 'Assegnazione aggiornata con successo!'
         
         elif action == 'delete':
-            # Delete associated image if exists
-            if ticket.image_filename:
-                image_path = os.path.join(app.config['UPLOAD_FOLDER'], ticket.image_filename)
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-            
-            db.session.delete(ticket)
-            db.session.commit()
+            image_filename = ticket.image_filename
+            commit_ticket_change(ticket_id, lambda t: object_session(t).delete(t))
+            remove_ticket_image(image_filename)
             flash('Ticket eliminato con successo!', 'success')
             return redirect(url_for('dashboard'))
 
@@ -536,10 +2183,10 @@ def ticket_detail(ticket_id):
             if not author_name or not body:
                 flash('Nome e commento sono obbligatori.', 'danger')
             else:
-                comment = Comment(ticket_id=ticket.id, author_name=author_name, body=body)
-                db.session.add(comment)
-                db.session.commit()
-                flash('Commento aggiunto con successo.', 'success')
+                stored = commit_ticket_change(ticket_id, lambda t: object_session(t).add(
+                    Comment(ticket_id=ticket_id, author_name=author_name, body=body)
+                ))
+                message = 'Commento aggiunto con successo.'
 
         elif action == 'update_priority':
             if ticket.ticket_type != 'TECNICO':
@@ -549,24 +2196,636 @@ def ticket_detail(ticket_id):
                 if new_priority not in {'BASSA', 'MEDIA', 'ALTA'}:
                     flash('Priorità non valida.', 'danger')
                 else:
-                    ticket.priority = new_priority
-                    db.session.commit()
-                    flash('Priorità aggiornata con successo.', 'success')
-        
+                    stored = commit_ticket_change(ticket_id, lambda t: setattr(t, 'priority', new_priority))
+                    message = 'Priorità aggiornata con successo.'
+
+        if not stored:
+            flash('Il ticket è stato eliminato nel frattempo.', 'warning')
+            return redirect(url_for('dashboard'))
+        if message:
+            flash(message, 'success')
         return redirect(url_for('ticket_detail', ticket_id=ticket_id))
     
-    # Get all admins for assignment dropdown
-    admins = User.query.all()
-    
-    return render_template('ticket_detail.html', ticket=ticket, admins=admins, comments=comments)
+    return render_template('ticket_detail.html', ticket=ticket, **ticket_fragments(ticket))
+
+
+def archived_ticket_detail(ticket_id):
+    """Read-only detail page of an archived ticket (changes require restoring it first)"""
+    if not app.config['ARCHIVE_ENABLED']:
+        abort(404)
+    ticket = ArchivedTicket.query.options(db.joinedload(ArchivedTicket.assigned_to)).filter_by(id=ticket_id).first_or_404()
+    if request.method == 'POST':
+        flash('Il ticket è archiviato: ripristinalo per modificarlo.', 'warning')
+        return redirect(url_for('ticket_detail', ticket_id=ticket_id))
+    return render_template('ticket_detail.html', ticket=ticket, archived=True, **ticket_fragments(ticket, archived=True))
+
+
+@app.route('/admin/ticket/<int:ticket_id>/restore', methods=['POST'])
+@login_required
+@query_budget(16)
+def restore_archived_ticket(ticket_id):
+    """Move an archived ticket back to the live tickets"""
+    if not app.config['ARCHIVE_ENABLED'] or db.session.get(ArchivedTicket, ticket_id) is None:
+        abort(404)
+    if db.session.get(Ticket, ticket_id) is not None:
+        flash('Esiste già un ticket attivo con lo stesso numero: ripristino impossibile.', 'danger')
+        return redirect(url_for('ticket_detail', ticket_id=ticket_id))
+    restore_ticket(ticket_id)
+    db.session.commit()
+    flash("Ticket ripristinato dall'archivio.", 'success')
+    return redirect(url_for('ticket_detail', ticket_id=ticket_id))
+
+
+# ==================== REST API (v1) ====================
+#
+# JSON API for the yard tablets and other clients under /api/v1. Requests are
+# authenticated like the admin pages (session cookie; writes then need the
+# CSRF token) or with `Authorization: Bearer <token>` (tokens are created
+# with `flask create-api-token` and are exempt from CSRF).
+# Responses carry weak ETags and Last-Modified taken from the version
+# counters and updated_at, so a polling client gets a 304 before any list
+# query runs.
+
+API_MAX_PAGE = 200
+API_MAX_BATCH = 100
+
+API_TICKET_FIELDS = {
+    'id': Ticket.id,
+    'ticket_type': Ticket.ticket_type,
+    'status': Ticket.status,
+    'created_at': Ticket.created_at,
+    'started_at': Ticket.started_at,
+    'closed_at': Ticket.closed_at,
+    'updated_at': Ticket.updated_at,
+    'requester_name': Ticket.requester_name,
+    'description': Ticket.description,
+    'assigned_to_id': Ticket.assigned_to_id,
+    'assigned_to': User.username,
+    'vehicle_type': Ticket.vehicle_type,
+    'vehicle_number': Ticket.vehicle_number,
+    'anomaly_category': Ticket.anomaly_category,
+    'department': Ticket.department,
+    'title': Ticket.title,
+    'priority': Ticket.priority,
+    'image_url': Ticket.image_filename,
+}
+API_COMMENT_FIELDS = {
+    'id': Comment.id,
+    'ticket_id': Comment.ticket_id,
+    'author_name': Comment.author_name,
+    'body': Comment.body,
+    'created_at': Comment.created_at,
+}
+API_TICKET_CHANGES = ('status', 'assigned_to_id', 'priority')
+TICKET_PRIORITIES = ('BASSA', 'MEDIA', 'ALTA')
+API_STALE_TICKET = 'Il ticket è stato modificato nel frattempo.'
+
+
+class ApiError(Exception):
+    """Invalid API request, answered with a JSON error"""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+@app.errorhandler(ApiError)
+def handle_api_error(error):
+    response = jsonify({'error': str(error), **error.details})
+    response.status_code = error.status
+    if error.status == 401:
+        response.headers['WWW-Authenticate'] = 'Bearer'
+    return response
+
+
+def api_token_user_id(token):
+    """Id of the user owning an active API token, cached until users/tokens change"""
+    token_hash = ApiToken.hash_token(token)
+    key = f"api_token:{cache_versions().get('users', 0)}:{token_hash}"
+    user_id = data_cache.get(key)
+    if user_id is None:
+        user_id = db.session.execute(
+            db.select(ApiToken.user_id).where(ApiToken.token_hash == token_hash, ApiToken.revoked_at.is_(None))
+        ).scalar() or 0
+        data_cache.set(key, user_id)
+    return user_id or None
+
+
+def api_login_required(f):
+    """Like login_required for the JSON API, also accepting a Bearer token"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        authorization = request.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            g.api_user_id = api_token_user_id(authorization[7:].strip())
+            if g.api_user_id is None:
+                raise ApiError('Token non valido o revocato.', 401)
+        elif 'user_id' in session:
+            # A session cookie is sent by the browser on its own: writes need the CSRF token
+            if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+                csrf.protect()
+            g.api_user_id = session['user_id']
+        else:
+            raise ApiError('Autenticazione richiesta.', 401)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def api_fields(available, always=('id',)):
+    """(requested names, names to select) for the `fields` parameter (sparse fieldset)"""
+    names = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()] or list(available)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError(f"Campi non validi: {', '.join(unknown)}", allowed=list(available))
+    names = list(dict.fromkeys(['id'] + names))  # like JSON:API, objects always carry their id
+    return names, list(dict.fromkeys(list(always) + names))
+
+
+def api_select(available, selected):
+    """Query of only the selected columns, each labelled with its field name"""
+    return db.session.query(*[available[name].label(name) for name in selected])
+
+
+def api_item(row, names):
+    """JSON object of a result row limited to the requested fields"""
+    item = {}
+    for name in names:
+        value = getattr(row, name)
+        if name == 'image_url':
+            value = image_url(value) if value else None
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        item[name] = value
+    return item
+
+
+def api_json():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ApiError('Corpo JSON non valido.')
+    return data
+
+
+def api_limit():
+    return min(max(request.args.get('limit', 50, type=int), 1), API_MAX_PAGE)
+
+
+def api_datetime(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise ApiError(f'Data non valida in {name}: usare il formato ISO 8601.')
+
+
+def api_etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:20]
+
+
+def api_not_modified(etag, last_modified=None):
+    """True if the client's copy is current (If-None-Match takes precedence over If-Modified-Since)"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def api_response(payload, etag, last_modified=None, status=200):
+    """JSON (or 304) response with validators; clients must revalidate before reuse"""
+    if status == 200 and request.method == 'GET' and api_not_modified(etag, last_modified):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(payload)
+        response.status_code = status
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.update(('Authorization', 'Cookie'))
+    return response
+
+
+def api_ticket_query(selected):
+    return api_select(API_TICKET_FIELDS, selected).select_from(Ticket).outerjoin(User, Ticket.assigned_to_id == User.id)
+
+
+def api_validate_ticket_changes(ticket, changes, user_ids):
+    """Error message for a ticket update, or None. `user_ids` holds the existing user ids."""
+    unknown = [key for key in changes if key not in API_TICKET_CHANGES and key not in ('id', 'etag')]
+    if unknown:
+        return f"Campi non modificabili: {', '.join(unknown)}"
+    if 'status' in changes and changes['status'] not in TICKET_STATUSES:
+        return 'Status non valido.'
+    if 'assigned_to_id' in changes and changes['assigned_to_id'] is not None and changes['assigned_to_id'] not in user_ids:
+        return 'Operatore non trovato.'
+    if 'priority' in changes:
+        if ticket.ticket_type != 'TECNICO':
+            return 'La priorità è modificabile solo per i ticket tecnici.'
+        if changes['priority'] not in TICKET_PRIORITIES:
+            return 'Priorità non valida.'
+    if 'etag' in changes and changes['etag'] != api_etag('ticket', ticket.id, ticket.updated_at):
+        return API_STALE_TICKET
+    return None
+
+
+def api_apply_ticket_changes(ticket, changes):
+    if 'status' in changes and changes['status'] != ticket.status:
+        set_ticket_status(ticket, changes['status'])
+    if 'assigned_to_id' in changes:
+        ticket.assigned_to_id = changes['assigned_to_id']
+    if 'priority' in changes:
+        ticket.priority = changes['priority']
+
+
+def api_existing_user_ids(changes):
+    """Existing ids among the assigned_to_id values of a list of changes (one query)"""
+    wanted = {item.get('assigned_to_id') for item in changes if isinstance(item.get('assigned_to_id'), int)}
+    if not wanted:
+        return set()
+    return set(db.session.execute(db.select(User.id).where(User.id.in_(wanted))).scalars())
+
+
+@app.route('/api/v1/tickets')
+@csrf.exempt
+@api_login_required
+@query_budget(4)
+def api_list_tickets():
+    """Cursor-paginated tickets with the dashboard filters, `ticket_type` and `updated_since`"""
+    names, selected = api_fields(API_TICKET_FIELDS, always=('id', 'created_at'))
+    search_query = request.args.get('search', '').strip()
+    status_filter = request.args.get('status', '').strip()
+    assigned_filter = request.args.get('assigned', '').strip()
+    ticket_type = request.args.get('ticket_type', '').strip()
+    updated_since = api_datetime('updated_since')
+    if assigned_filter and assigned_filter != 'unassigned' and not assigned_filter.isdigit():
+        raise ApiError('Filtro assigned non valido: id operatore o "unassigned".')
+
+    # Any ticket, comment or user change bumps these counters: unchanged counters = same page
+    versions = cache_versions()
+    etag = api_etag('tickets', versions.get('tickets', 0), versions.get('users', 0), request.query_string)
+    last_modified = cache_last_modified('tickets', 'users')
+    if api_not_modified(etag, last_modified):
+        return api_response(None, etag, last_modified)
+
+    query = filter_tickets(api_ticket_query(selected), search_query, status_filter, assigned_filter)
+    if ticket_type:
+        query = query.filter(Ticket.ticket_type == ticket_type)
+    if updated_since is not None:
+        query = query.filter(Ticket.updated_at > updated_since)
+    page = paging.keyset_paginate(
+        query, Ticket.created_at, Ticket.id, api_limit(),
+        after=request.args.get('after'), before=request.args.get('before')
+    )
+    payload = {
+        'items': [api_item(row, names) for row in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    }
+    return api_response(payload, etag, last_modified)
+
+
+@app.route('/api/v1/tickets/<int:ticket_id>')
+@csrf.exempt
+@api_login_required
+@query_budget(2)
+def api_get_ticket(ticket_id):
+    """One ticket; the ETag changes with updated_at (also bumped by new comments)"""
+    names, selected = api_fields(API_TICKET_FIELDS, always=('id', 'updated_at'))
+    row = api_ticket_query(selected).filter(Ticket.id == ticket_id).first()
+    if row is None:
+        raise ApiError('Ticket non trovato.', 404)
+    return api_response(api_item(row, names), api_etag('ticket', row.id, row.updated_at), row.updated_at)
+
+
+@app.route('/api/v1/tickets/<int:ticket_id>', methods=['PATCH'])
+@csrf.exempt
+@api_login_required
+@query_budget(8)
+def api_update_ticket(ticket_id):
+    """Change status, assignee and/or priority (same rules as the ticket page).
+
+    With `If-Match` the update is refused (412) if the ticket changed since
+    the client read it.
+    """
+    changes = api_json()
+    ticket = db.session.get(Ticket, ticket_id)
+    if ticket is None:
+        raise ApiError('Ticket non trovato.', 404)
+    if request.if_match and not request.if_match.contains_weak(api_etag('ticket', ticket.id, ticket.updated_at)):
+        raise ApiError(API_STALE_TICKET, 412)
+    error = api_validate_ticket_changes(ticket, changes, api_existing_user_ids([changes]))
+    if error:
+        raise ApiError(error)
+    api_apply_ticket_changes(ticket, changes)
+    db.session.commit()
+
+    names, selected = api_fields(API_TICKET_FIELDS, always=('id', 'updated_at'))
+    row = api_ticket_query(selected).filter(Ticket.id == ticket_id).one()
+    return api_response(api_item(row, names), api_etag('ticket', row.id, row.updated_at), row.updated_at)
+
+
+@app.route('/api/v1/tickets/batch', methods=['POST'])
+@csrf.exempt
+@api_login_required
+@query_budget(8)
+def api_batch_update_tickets():
+    """Apply several ticket updates in one transaction: `{"updates": [{"id": 1, "status": ...}, ...]}`.
+
+    All updates are validated first; if any is invalid nothing is applied and
+    the errors are returned by position. Each update may carry the `etag` of
+    the version it was based on.
+    """
+    updates = api_json().get('updates')
+    if not isinstance(updates, list) or not updates or not all(isinstance(item, dict) for item in updates):
+        raise ApiError('Atteso {"updates": [{"id": ..., ...}, ...]}.')
+    if len(updates) > API_MAX_BATCH:
+        raise ApiError(f'Al massimo {API_MAX_BATCH} modifiche per richiesta.')
+
+    ids = [item.get('id') for item in updates if isinstance(item.get('id'), int)]
+    tickets = {ticket.id: ticket for ticket in db.session.execute(db.select(Ticket).where(Ticket.id.in_(ids))).scalars()}
+    user_ids = api_existing_user_ids(updates)
+    errors = []
+    for index, item in enumerate(updates):
+        ticket = tickets.get(item.get('id'))
+        error = 'Ticket non trovato.' if ticket is None else api_validate_ticket_changes(ticket, item, user_ids)
+        if error:
+            errors.append({'index': index, 'id': item.get('id'), 'error': error})
+    if errors:
+        stale = any(error['error'] == API_STALE_TICKET for error in errors)
+        raise ApiError('Nessuna modifica applicata.', 409 if stale else 400, errors=errors)
+
+    for item in updates:
+        api_apply_ticket_changes(tickets[item['id']], item)
+    db.session.commit()
+
+    names, selected = api_fields(API_TICKET_FIELDS, always=('id', 'updated_at'))
+    rows = api_ticket_query(selected).filter(Ticket.id.in_(tickets)).order_by(Ticket.id).all()
+    payload = {'items': [dict(api_item(row, names), etag=api_etag('ticket', row.id, row.updated_at)) for row in rows]}
+    return jsonify(payload)
+
+
+def api_comment_query(selected):
+    # The ticket's updated_at moves on every comment change: it versions the comments too
+    return (api_select(API_COMMENT_FIELDS, selected)
+            .add_columns(Ticket.updated_at.label('ticket_updated_at'))
+            .join(Ticket, Comment.ticket_id == Ticket.id))
+
+
+@app.route('/api/v1/comments')
+@csrf.exempt
+@api_login_required
+@query_budget(4)
+def api_list_comments():
+    """Cursor-paginated comments, newest first, optionally of one ticket (`ticket_id`) or after `since`"""
+    names, selected = api_fields(API_COMMENT_FIELDS, always=('id', 'created_at'))
+    ticket_id = request.args.get('ticket_id', type=int)
+    since = api_datetime('since')
+
+    versions = cache_versions()
+    etag = api_etag('comments', versions.get('tickets', 0), request.query_string)
+    last_modified = cache_last_modified('tickets')
+    if api_not_modified(etag, last_modified):
+        return api_response(None, etag, last_modified)
+
+    query = api_comment_query(selected)
+    if ticket_id is not None:
+        query = query.filter(Comment.ticket_id == ticket_id)
+    if since is not None:
+        query = query.filter(Comment.created_at > since)
+    page = paging.keyset_paginate(
+        query, Comment.created_at, Comment.id, api_limit(),
+        after=request.args.get('after'), before=request.args.get('before')
+    )
+    payload = {
+        'items': [api_item(row, names) for row in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    }
+    return api_response(payload, etag, last_modified)
+
+
+@app.route('/api/v1/comments/<int:comment_id>')
+@csrf.exempt
+@api_login_required
+@query_budget(2)
+def api_get_comment(comment_id):
+    """One comment"""
+    names, selected = api_fields(API_COMMENT_FIELDS)
+    row = api_comment_query(selected).filter(Comment.id == comment_id).first()
+    if row is None:
+        raise ApiError('Commento non trovato.', 404)
+    return api_response(api_item(row, names), api_etag('comment', row.id, row.ticket_updated_at), row.ticket_updated_at)
+
+
+def api_comment_values(item, ticket_ids):
+    """Validated (ticket_id, author_name, body) of a new comment, or an error message"""
+    author_name = str(item.get('author_name') or '').strip() or g.api_username
+    body = str(item.get('body') or '').strip()
+    if item.get('ticket_id') not in ticket_ids:
+        return 'Ticket non trovato.'
+    if not body:
+        return 'Il commento è obbligatorio.'
+    if len(author_name) > 100:
+        return 'Nome autore troppo lungo.'
+    return item['ticket_id'], author_name, body
+
+
+def api_load_username():
+    g.api_username = db.session.execute(db.select(User.username).where(User.id == g.api_user_id)).scalar() or 'api'
+
+
+@app.route('/api/v1/comments', methods=['POST'])
+@app.route('/api/v1/comments/batch', methods=['POST'])
+@csrf.exempt
+@api_login_required
+@query_budget(8)
+def api_create_comments():
+    """Add one comment (`{"ticket_id", "body", "author_name"?}`) or several (`{"comments": [...]}`).
+
+    The author defaults to the authenticated user. A batch is validated as a
+    whole and stored in one transaction.
+    """
+    data = api_json()
+    batch = 'comments' in data
+    items = data['comments'] if batch else [data]
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        raise ApiError('Atteso {"comments": [{"ticket_id": ..., "body": ...}, ...]}.')
+    if len(items) > API_MAX_BATCH:
+        raise ApiError(f'Al massimo {API_MAX_BATCH} commenti per richiesta.')
+
+    api_load_username()
+    wanted = {item.get('ticket_id') for item in items if isinstance(item.get('ticket_id'), int)}
+    ticket_ids = set(db.session.execute(db.select(Ticket.id).where(Ticket.id.in_(wanted))).scalars()) if wanted else set()
+    values, errors = [], []
+    for index, item in enumerate(items):
+        result = api_comment_values(item, ticket_ids)
+        if isinstance(result, str):
+            errors.append({'index': index, 'ticket_id': item.get('ticket_id'), 'error': result})
+        else:
+            values.append(result)
+    if errors:
+        raise ApiError('Nessun commento salvato.', errors=errors)
+
+    comments = [Comment(ticket_id=ticket_id, author_name=author_name, body=body) for ticket_id, author_name, body in values]
+    db.session.add_all(comments)
+    db.session.flush()
+    created = [api_item(comment, list(API_COMMENT_FIELDS)) for comment in comments]  # before commit expires them
+    db.session.commit()
+    response = jsonify({'items': created} if batch else created[0])
+    response.status_code = 201
+    if not batch:
+        response.headers['Location'] = url_for('api_get_comment', comment_id=comments[0].id)
+    return response
+
+
+@app.route('/api/v1/comments/<int:comment_id>', methods=['PATCH'])
+@csrf.exempt
+@api_login_required
+@query_budget(6)
+def api_update_comment(comment_id):
+    """Edit the text (and/or author) of a comment"""
+    changes = api_json()
+    comment = db.session.get(Comment, comment_id)
+    if comment is None:
+        raise ApiError('Commento non trovato.', 404)
+    unknown = [key for key in changes if key not in ('body', 'author_name')]
+    if unknown:
+        raise ApiError(f"Campi non modificabili: {', '.join(unknown)}")
+    if 'body' in changes:
+        body = str(changes['body'] or '').strip()
+        if not body:
+            raise ApiError('Il commento è obbligatorio.')
+        comment.body = body
+    if 'author_name' in changes:
+        author_name = str(changes['author_name'] or '').strip()
+        if not author_name or len(author_name) > 100:
+            raise ApiError('Nome autore non valido.')
+        comment.author_name = author_name
+    item = api_item(comment, list(API_COMMENT_FIELDS))
+    db.session.commit()
+    return jsonify(item)
 
 
 # ==================== DATABASE INITIALIZATION ====================
 
+def migrate_db():
+    """Bring an existing database up to date with the models.
+
+    `db.create_all()` only creates missing tables, so indexes added to
+    tables that already exist in an older `tickets.db` are created here.
+    Safe to run on every startup.
+    """
+    # The archive tables live in the attached SQLite file, created only when the archive is enabled
+    tables = [table for table in db.metadata.sorted_tables
+              if table.schema != ARCHIVE_SCHEMA or app.config['ARCHIVE_ENABLED']]
+    db.metadata.create_all(db.engine, tables=tables)
+    inspector = db.inspect(db.engine)
+    for table in tables:
+        # New nullable columns on existing tables
+        existing = {column['name'] for column in inspector.get_columns(table.name, schema=table.schema)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(db.engine.dialect)
+                db.session.execute(db.text(f'ALTER TABLE {table.fullname} ADD COLUMN {column.name} {column_type}'))
+        for index in table.indexes:
+            index.create(bind=db.session.connection(), checkfirst=True)
+    db.session.execute(db.update(Ticket).where(Ticket.updated_at.is_(None)).values(updated_at=Ticket.created_at))
+    db.session.commit()
+    if app.config['SEARCH_FTS_ENABLED'] is not False:
+        app.config['SEARCH_FTS_ENABLED'] = search.ensure_search_index(db.engine)
+        if app.config['SEARCH_FTS_ENABLED'] and app.config['ARCHIVE_ENABLED']:
+            search.ensure_search_index(db.engine, ARCHIVE_SCHEMA)
+    analytics.ensure_rollups(db.engine)
+    if app.config['LIVE_UPDATES_ENABLED']:
+        app.config['LIVE_UPDATES_ENABLED'] = live.ensure_change_log(db.engine)
+
+
+# Optional parts of the schema created by migrate_db, as configured at startup
+# (migrate_db may still turn search or live updates off, e.g. without FTS5)
+SCHEMA_FEATURES = {
+    'archive': app.config['ARCHIVE_ENABLED'],
+    'search': app.config['SEARCH_FTS_ENABLED'] is not False,
+    'live': app.config['LIVE_UPDATES_ENABLED'],
+}
+
+
+def schema_fingerprint():
+    """Number identifying the models' tables, columns and indexes, the trigger-maintained
+    tables (search, live updates, analytics) and the enabled features (changes with them)"""
+    ddl = []
+    for table in db.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(db.engine)))
+        ddl += [str(CreateIndex(index).compile(db.engine)) for index in sorted(table.indexes, key=lambda i: i.name)]
+    ddl += search.SCHEMA_DDL + live.SCHEMA_DDL + analytics.SCHEMA_DDL
+    ddl += [f'{feature}={enabled}' for feature, enabled in sorted(SCHEMA_FEATURES.items())]
+    return zlib.crc32('\n'.join(ddl).encode()) & 0x7fffffff
+
+
+def database_is_current():
+    """True if init_db already ran on this database for the current models.
+
+    SQLite keeps the fingerprint in `PRAGMA user_version`, so this costs one
+    read; other databases are always initialised.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    schemas = ['main', ARCHIVE_SCHEMA] if app.config['ARCHIVE_ENABLED'] else ['main']
+    with db.engine.connect() as conn:
+        # Checked in the archive file too, in case it was moved away or replaced
+        return all(conn.exec_driver_sql(f'PRAGMA {schema}.user_version').scalar() == schema_fingerprint()
+                   for schema in schemas)
+
+
+@contextmanager
+def init_db_lock():
+    """Serialise init_db between workers booting together (no lock where fcntl is missing, e.g. Windows)"""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    os.makedirs(app.instance_path, exist_ok=True)
+    with open(os.path.join(app.instance_path, 'init_db.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def ensure_database():
+    """Startup guard of the WSGI entry point: run init_db only on first run or after a model change.
+
+    A worker boot then costs a single PRAGMA read instead of create_all, the
+    migrations and the admin lookup. The engine is disposed afterwards so no
+    connection is inherited by workers forked from a `--preload` master.
+    """
+    with app.app_context():
+        if not database_is_current():
+            with init_db_lock():
+                if not database_is_current():
+                    init_db()
+        db.engine.dispose()
+
+
+def precompile_templates():
+    """Load every template, compiling (and writing to TEMPLATE_CACHE_DIR) those not cached yet.
+
+    Called by wsgi.py: with --preload the workers are forked with all
+    templates already loaded, otherwise each one reads the bytecode from disk.
+    Returns the number of templates.
+    """
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
 def init_db():
     """Initialize database and create default admin user"""
     with app.app_context():
-        db.create_all()
+        migrate_db()
         
         # Check if admin user exists
         admin = User.query.filter_by(username='admin').first()
@@ -590,6 +2849,330 @@ def init_db():
                 db.session.commit()
             print('Admin user already exists.')
 
+        if db.engine.dialect.name == 'sqlite':
+            # Lets ensure_database skip all of this on the next worker boots
+            db.session.execute(db.text(f'PRAGMA user_version = {schema_fingerprint()}'))
+            if app.config['ARCHIVE_ENABLED']:
+                db.session.execute(db.text(f'PRAGMA {ARCHIVE_SCHEMA}.user_version = {schema_fingerprint()}'))
+            db.session.commit()
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create/migrate the schema and the default admin user (run once after install or update)"""
+    init_db()
+
+
+@app.cli.command('precompile-templates')
+def precompile_templates_command():
+    """Compile all templates into TEMPLATE_CACHE_DIR (run after every deploy)"""
+    if not app.config['TEMPLATE_CACHE_DIR']:
+        raise SystemExit('TEMPLATE_CACHE_DIR non impostata: nessuna cache dei template su disco.')
+    app.jinja_env.bytecode_cache.clear()  # drops the bytecode of templates removed by the update
+    started = time.perf_counter()
+    count = precompile_templates()
+    print(f'{count} template compilati in {app.config["TEMPLATE_CACHE_DIR"]} '
+          f'({time.perf_counter() - started:.2f}s).')
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Recreate the full-text search indexes from the tickets and comments tables (live and archived)"""
+    if not search.ensure_search_index(db.engine):
+        raise SystemExit('FTS5 non disponibile: la ricerca usa il fallback LIKE.')
+    search.rebuild_search_index(db.engine)
+    if app.config['ARCHIVE_ENABLED'] and search.ensure_search_index(db.engine, ARCHIVE_SCHEMA):
+        search.rebuild_search_index(db.engine, ARCHIVE_SCHEMA)
+    print('Indice di ricerca ricostruito.')
+
+
+def rollup_sources():
+    """Ticket tables the analytics rollups are computed from (live and archived)"""
+    return ('tickets', f'{ARCHIVE_SCHEMA}.tickets') if app.config['ARCHIVE_ENABLED'] else ('tickets',)
+
+
+@app.cli.command('rebuild-analytics')
+def rebuild_analytics_command():
+    """Recompute the SLA and daily flow rollups from the live and archived tickets"""
+    if not analytics.ensure_rollups(db.engine):
+        raise SystemExit('Statistiche disponibili solo con database SQLite.')
+    analytics.rebuild_rollups(db.engine, rollup_sources())
+    print('Statistiche ricostruite.')
+
+
+@app.cli.command('archive-tickets')
+@click.option('--days', type=int, default=None, help='Archivia i ticket risolti da più di N giorni (default ARCHIVE_AFTER_DAYS)')
+def archive_tickets_command(days):
+    """Move tickets resolved more than ARCHIVE_AFTER_DAYS days ago to the archive (run daily, e.g. from cron)"""
+    if not app.config['ARCHIVE_ENABLED']:
+        raise SystemExit('Archivio disponibile solo con database SQLite (ARCHIVE_ENABLED).')
+    days = app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    print(f'Ticket archiviati: {archive_tickets(cutoff, app.config["ARCHIVE_BATCH_SIZE"])}')
+
+
+def get_backup_manager():
+    """BackupManager for the configured databases and upload folders (SQLite only)"""
+    if db.engine.dialect.name != 'sqlite' or not db.engine.url.database:
+        raise SystemExit('Backup disponibile solo con database SQLite su file.')
+    databases = [('main', db.engine.url.database)]
+    folders = {'uploads': app.config['UPLOAD_FOLDER']}
+    if app.config['ARCHIVE_ENABLED']:
+        databases.append((ARCHIVE_SCHEMA, app.config['ARCHIVE_DATABASE']))
+        folders['archive_uploads'] = app.config['ARCHIVE_UPLOAD_FOLDER']
+    return backup_manager.BackupManager(
+        app.config['BACKUP_DIR'], databases, folders,
+        method=app.config['BACKUP_METHOD'], step_pages=app.config['BACKUP_STEP_PAGES'],
+    )
+
+
+def describe_snapshot(manifest):
+    rows = sum(info['tables'].get('tickets', 0) for info in manifest['databases'].values())
+    files = sum(len(files) for files in manifest['folders'].values())
+    size = sum(info['size'] for info in manifest['databases'].values()) / 1024 / 1024
+    return f"{manifest['id']}  {rows} ticket  {size:.1f} MB di database  {files} file"
+
+
+@app.cli.command('backup')
+@click.option('--no-prune', is_flag=True, help='Non eliminare i backup oltre BACKUP_KEEP/BACKUP_RETENTION_DAYS')
+def backup_command(no_prune):
+    """Take an online snapshot of the databases and uploads, then prune old ones (run nightly, e.g. from cron)"""
+    manager = get_backup_manager()
+    try:
+        manifest = manager.create_snapshot()
+    except (backup_manager.BackupError, sqlite3.Error) as e:
+        raise SystemExit(f'Backup fallito: {e}')
+    stats = manifest['stats']
+    print(f"Backup creato: {describe_snapshot(manifest)} in {manifest['duration']:.1f}s "
+          f"({stats['new_blobs']} file nuovi, {stats['copied_bytes'] / 1024 / 1024:.1f} MB copiati)")
+    if not no_prune:
+        removed = manager.prune(app.config['BACKUP_KEEP'], app.config['BACKUP_RETENTION_DAYS'])
+        print(f'Backup eliminati: {len(removed)}')
+
+
+@app.cli.command('list-backups')
+def list_backups_command():
+    """List the snapshots in BACKUP_DIR, newest first"""
+    for manifest in get_backup_manager().list_snapshots():
+        print(describe_snapshot(manifest))
+
+
+@app.cli.command('prune-backups')
+@click.option('--keep', type=int, default=None, help='Backup più recenti da tenere comunque (default BACKUP_KEEP)')
+@click.option('--days', type=int, default=None, help='Elimina i backup più vecchi di N giorni (default BACKUP_RETENTION_DAYS)')
+def prune_backups_command(keep, days):
+    """Delete old snapshots and the photos no remaining snapshot refers to"""
+    keep = app.config['BACKUP_KEEP'] if keep is None else keep
+    days = app.config['BACKUP_RETENTION_DAYS'] if days is None else days
+    removed = get_backup_manager().prune(keep, days)
+    print(f"Backup eliminati: {len(removed)}{' (' + ', '.join(removed) + ')' if removed else ''}")
+
+
+@app.cli.command('verify-backup')
+@click.argument('snapshot_id')
+def verify_backup_command(snapshot_id):
+    """Check the checksums and database integrity of a snapshot"""
+    try:
+        problems = get_backup_manager().verify_snapshot(snapshot_id)
+    except backup_manager.BackupError as e:
+        raise SystemExit(str(e))
+    for problem in problems:
+        print(f' - {problem}')
+    if problems:
+        raise SystemExit(f'Backup {snapshot_id} non valido.')
+    print(f'Backup {snapshot_id} integro.')
+
+
+@app.cli.command('restore-backup')
+@click.argument('snapshot_id')
+@click.option('--yes', is_flag=True, help='Non chiedere conferma')
+@click.option('--force', is_flag=True, help='Ripristina anche se il backup dello stato attuale non riesce')
+def restore_backup_command(snapshot_id, yes, force):
+    """Replace the databases and photos with a verified snapshot (stop the service first)"""
+    manager = get_backup_manager()
+    if not yes:
+        click.confirm(f'Ripristinare il backup {snapshot_id}? Il servizio deve essere fermo', abort=True)
+    try:
+        # The current state stays recoverable if the wrong snapshot was picked
+        print(f"Backup dello stato attuale: {manager.create_snapshot()['id']}")
+    except (backup_manager.BackupError, sqlite3.Error, OSError) as e:
+        if not force:
+            raise SystemExit(f'Backup dello stato attuale non riuscito ({e}): ripristino annullato. '
+                             f'Usa --force per ripristinare comunque, perdendo lo stato attuale.')
+        print(f'Backup dello stato attuale non riuscito ({e}), proseguo (--force).')
+    db.engine.dispose()
+    try:
+        report = manager.restore(snapshot_id)
+    except (backup_manager.BackupError, sqlite3.Error) as e:
+        raise SystemExit(f'Ripristino fallito: {e}')
+    # Version counters went back in time: cached pages must not be reused under the old numbers
+    data_cache.clear()
+    print(f"Backup {report['id']} ripristinato e verificato: {report['restored_files']} file riscritti, "
+          f"{report['extra_files']} file più recenti lasciati al loro posto.")
+
+
+@app.cli.command('process-images')
+def process_images_command():
+    """Generate missing thumbnails (e.g. uploads from before image processing existed)"""
+    if not images.is_available():
+        raise SystemExit('Pillow non installato: pip install Pillow')
+    upload_folder = app.config['UPLOAD_FOLDER']
+    filenames = db.session.execute(
+        db.select(Ticket.image_filename).where(Ticket.image_filename.isnot(None))
+    ).scalars().all()
+    processed = 0
+    for filename in filenames:
+        thumb = os.path.join(upload_folder, images.derived_relpath(filename, 'thumb'))
+        if os.path.exists(os.path.join(upload_folder, filename)) and not os.path.exists(thumb):
+            images.process_image(upload_folder, filename, app.config['IMAGE_MAX_SIZE'])
+            processed += 1
+    print(f'Immagini elaborate: {processed}')
+
+
+@app.cli.command('move-uploads')
+def move_uploads_command():
+    """Move the photos of the old default folder static/uploads into UPLOAD_FOLDER (once, after the update)"""
+    upload_folder = app.config['UPLOAD_FOLDER']
+    if not os.path.isdir(LEGACY_UPLOAD_FOLDER):
+        raise SystemExit(f'Nessuna cartella {LEGACY_UPLOAD_FOLDER}: niente da spostare.')
+    if os.path.abspath(upload_folder) == os.path.abspath(LEGACY_UPLOAD_FOLDER):
+        raise SystemExit('UPLOAD_FOLDER punta ancora a static/uploads: impostala fuori da static/.')
+    moved = images.move_folder(LEGACY_UPLOAD_FOLDER, upload_folder, skip={'.gitkeep', uploads.INCOMING_DIR})
+    print(f'Foto spostate in {upload_folder}: {moved}')
+
+
+@app.cli.command('send-notifications')
+def send_notifications_command():
+    """Deliver all due notifications from the outbox and exit"""
+    pool = SMTPConnectionPool(get_mail())
+    total = 0
+    try:
+        with write_transaction():
+            while True:
+                sent = deliver_pending_notifications(pool)
+                if not sent:
+                    break
+                total += sent
+    finally:
+        pool.close()
+    print(f'Notifiche elaborate: {total}')
+
+
+@app.cli.command('create-api-token')
+@click.argument('username')
+@click.option('--name', default='', help='Descrizione del token (es. "tablet piazzale")')
+def create_api_token_command(username, name):
+    """Create an API token acting as USERNAME; the token is shown only once"""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise SystemExit(f'Utente {username} non trovato.')
+    token = secrets.token_urlsafe(32)
+    api_token = ApiToken(name=name or username, token_hash=ApiToken.hash_token(token), user_id=user.id)
+    db.session.add(api_token)
+    db.session.commit()
+    print(f'Token #{api_token.id} per {username} (salvarlo ora, non verrà più mostrato):')
+    print(token)
+
+
+@app.cli.command('list-api-tokens')
+def list_api_tokens_command():
+    """List the API tokens (without their secret)"""
+    for api_token in ApiToken.query.order_by(ApiToken.id):
+        state = f"revocato il {api_token.revoked_at:%d/%m/%Y}" if api_token.revoked_at else 'attivo'
+        print(f'#{api_token.id}  {api_token.user.username}  {api_token.name}  '
+              f'creato il {api_token.created_at:%d/%m/%Y}  {state}')
+
+
+@app.cli.command('revoke-api-token')
+@click.argument('token_id', type=int)
+def revoke_api_token_command(token_id):
+    """Revoke an API token by id (see list-api-tokens)"""
+    api_token = db.session.get(ApiToken, token_id)
+    if api_token is None:
+        raise SystemExit(f'Token #{token_id} non trovato.')
+    if api_token.revoked_at is None:
+        api_token.revoked_at = datetime.utcnow()
+        db.session.commit()
+    print(f'Token #{token_id} revocato.')
+
+
+def explain_query_plan(query):
+    """Return the SQLite `EXPLAIN QUERY PLAN` detail lines for an ORM query"""
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')).all()
+    return [row[-1] for row in rows]
+
+
+def dashboard_filter_combinations():
+    """(search, status, assignee, archive) for every kind of filter the dashboard can combine"""
+    for search_query in ('', 'olio', '42'):  # no search, text, text or ticket id
+        for status_filter in ('', 'NUOVO', 'IN_LAVORAZIONE', 'RISOLTO'):
+            for assigned_filter in ('', 'unassigned', '1'):
+                archives = [False]
+                if app.config['ARCHIVE_ENABLED'] and status_filter in ('', 'RISOLTO'):
+                    archives = [True] if status_filter == 'RISOLTO' else [False, True]  # see include_archive
+                for archive in archives:
+                    yield search_query, status_filter, assigned_filter, archive
+
+
+def plan_problems(plan, searched=False):
+    """Lines of a query plan showing a full table scan or a sort in a temporary B-tree.
+
+    Full-text lookups (`VIRTUAL TABLE INDEX`) count as index accesses. With
+    `searched` (the query is filtered by a MATCH) a sort is allowed: it
+    orders only the matching rows, by relevance or across live and archive.
+    """
+    problems = []
+    for detail in plan:
+        full_scan = (detail.startswith('SCAN') and 'USING' not in detail and 'VIRTUAL TABLE INDEX' not in detail
+                     and detail != 'SCAN CONSTANT ROW')
+        if full_scan or ('USE TEMP B-TREE' in detail and not searched):
+            problems.append(detail)
+    return problems
+
+
+def audit_query_plans():
+    """Check that dashboard and comment queries are served by an index.
+
+    Runs EXPLAIN QUERY PLAN on the page and on the count of every filter
+    combination (dashboard_filter_combinations), and on the comments of a
+    ticket. Returns a list of (description, plan) tuples for every query
+    whose plan contains a full table scan or a temporary B-tree.
+    """
+    checks = []
+    for search_query, status_filter, assigned_filter, archive in dashboard_filter_combinations():
+        description = (f'dashboard search={search_query or "*"} status={status_filter or "*"} '
+                       f'assigned={assigned_filter or "*"}' + (' +archivio' if archive else ''))
+        searched = bool(search_query) and fulltext_search_enabled()
+        query = dashboard_list_query(search_query, status_filter, assigned_filter, archive)
+        # Ordered as in dashboard(): by relevance, except across the archive
+        query = order_tickets(query, '' if archive else search_query).limit(50).offset(50)
+        checks.append((description, query, searched))
+        checks.append((description + ' (count)',
+                       count_tickets_query(search_query, status_filter, assigned_filter, archive), searched))
+    checks.append(('ticket_detail comments',
+                   Comment.query.filter_by(ticket_id=1).order_by(Comment.created_at.desc()), False))
+
+    failures = []
+    for description, query, searched in checks:
+        plan = explain_query_plan(query)
+        if plan_problems(plan, searched):
+            failures.append((description, plan))
+    return failures
+
+
+@app.cli.command('audit-query-plans')
+def audit_query_plans_command():
+    """Fail if a dashboard filter combination falls back to a table scan"""
+    failures = audit_query_plans()
+    for description, plan in failures:
+        print(f'SCAN: {description}')
+        for detail in plan:
+            print(f'    {detail}')
+    if failures:
+        raise SystemExit(1)
+    print('Tutte le query della dashboard usano un indice.')
+
 
 # ==================== RUN APPLICATION ====================
 
@@ -0,0 +1,386 @@
+"""
+Online backups of the SQLite databases and of the uploaded photos.
+
+A snapshot is a directory `snapshots/<id>/` holding a copy of every
+database and a `manifest.json`. The databases are copied with SQLite's
+online backup API from one connection that attaches them all and holds a
+read transaction for the whole copy: every file comes from the same
+point in time (a ticket being moved to the archive is never in both or
+in neither), and in WAL mode the app keeps writing while pages are
+copied in steps of `step_pages`. Each copy is checked with
+`PRAGMA integrity_check` before the snapshot is published by renaming
+its directory. The `vacuum` method (`VACUUM INTO`) writes smaller,
+defragmented files but copies each database in its own transaction.
+
+Photos are stored once in a content-addressed `blobs/` store shared by
+all snapshots; the manifest maps each file to its SHA-256. Files whose
+size and modification time did not change since the previous snapshot
+are neither read nor copied again, so a nightly backup only copies the
+new photos.
+
+Restoring verifies the snapshot (checksums and integrity) before
+touching anything, writes the databases back through the backup API and
+checks the result against the row counts recorded in the manifest.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lock between concurrent runs
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOTS_DIR = 'snapshots'
+BLOBS_DIR = 'blobs'
+MANIFEST = 'manifest.json'
+PARTIAL_PREFIX = '.partial-'
+SKIPPED_DIRS = {'.incoming'}  # uploads still being received (see uploads.py)
+CHUNK_SIZE = 1024 * 1024
+
+
+class BackupError(Exception):
+    """A snapshot could not be created, or failed verification"""
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _table_counts(conn, schema='main'):
+    """{table: rows} of the ordinary tables of `schema` (virtual tables are skipped)"""
+    names = conn.execute(
+        f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite_%' AND sql NOT LIKE 'CREATE VIRTUAL%' ORDER BY name"
+    ).fetchall()
+    return {name: conn.execute(f'SELECT count(*) FROM {schema}."{name}"').fetchone()[0] for (name,) in names}
+
+
+def _integrity_errors(path):
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute('PRAGMA integrity_check').fetchall()
+    finally:
+        conn.close()
+    return [] if rows == [('ok',)] else [row[0] for row in rows]
+
+
+class BackupManager:
+    """Creates, lists, verifies, prunes and restores snapshots in `backup_dir`.
+
+    `databases` is a list of (name, path) with the main database first; the
+    others are attached to it under their name. `folders` maps a name to an
+    upload folder.
+    """
+
+    def __init__(self, backup_dir, databases, folders, method='backup', step_pages=1024, timeout=30.0):
+        if method not in ('backup', 'vacuum'):
+            raise ValueError(f'Metodo di backup sconosciuto: {method}')
+        self.backup_dir = backup_dir
+        self.databases = list(databases)
+        self.folders = dict(folders)
+        self.method = method
+        self.step_pages = step_pages
+        self.timeout = timeout
+        self.snapshots_dir = os.path.join(backup_dir, SNAPSHOTS_DIR)
+        self.blobs_dir = os.path.join(backup_dir, BLOBS_DIR)
+
+    @contextmanager
+    def _locked(self):
+        """Serialize backup, prune and restore runs (a prune must not collect the blobs of a running backup)"""
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.backup_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    # -------------------- snapshots --------------------
+
+    def list_snapshots(self):
+        """Manifests of the published snapshots, newest first"""
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        manifests = []
+        for snapshot_id in sorted(os.listdir(self.snapshots_dir), reverse=True):
+            path = os.path.join(self.snapshots_dir, snapshot_id, MANIFEST)
+            if snapshot_id.startswith(PARTIAL_PREFIX) or not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as f:
+                manifests.append(json.load(f))
+        return manifests
+
+    def get_snapshot(self, snapshot_id):
+        path = os.path.join(self.snapshots_dir, os.path.basename(snapshot_id), MANIFEST)
+        if not os.path.exists(path):
+            raise BackupError(f'Backup {snapshot_id} non trovato')
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def create_snapshot(self):
+        """Copy the databases and the new photos; return the manifest of the published snapshot"""
+        with self._locked():
+            started = time.monotonic()
+            snapshot_id = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+            suffix = 1
+            while os.path.exists(os.path.join(self.snapshots_dir, snapshot_id)):
+                suffix += 1
+                snapshot_id = f"{snapshot_id.split('.')[0]}.{suffix}"
+            partial = os.path.join(self.snapshots_dir, PARTIAL_PREFIX + snapshot_id)
+            os.makedirs(partial)
+            try:
+                databases = self._copy_databases(partial)
+                previous = self.list_snapshots()
+                previous_folders = previous[0]['folders'] if previous else {}
+                folders, stats = {}, {'files': 0, 'new_blobs': 0, 'copied_bytes': 0}
+                for name, folder in self.folders.items():
+                    folders[name] = self._store_folder(folder, previous_folders.get(name, {}), stats)
+                manifest = {
+                    'id': snapshot_id,
+                    'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+                    'method': self.method,
+                    'databases': databases,
+                    'folders': folders,
+                    'stats': stats,
+                    'duration': round(time.monotonic() - started, 3),
+                }
+                with open(os.path.join(partial, MANIFEST), 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, indent=1, sort_keys=True)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.rename(partial, os.path.join(self.snapshots_dir, snapshot_id))
+            except BaseException:
+                shutil.rmtree(partial, ignore_errors=True)
+                raise
+        logger.info('Backup %s creato in %.1fs', snapshot_id, manifest['duration'])
+        return manifest
+
+    def _copy_databases(self, target_dir):
+        """Copy every database to `target_dir`/<name>.db from one read transaction"""
+        main_name, main_path = self.databases[0]
+        source = sqlite3.connect(main_path, timeout=self.timeout, isolation_level=None)
+        try:
+            for name, path in self.databases[1:]:
+                source.execute(f'ATTACH DATABASE ? AS {name}', (path,))
+            if self.method == 'backup':
+                # Reading every schema pins the snapshot: later commits (WAL) are not seen by
+                # this connection, so the stepwise copy never restarts and all files agree
+                source.execute('BEGIN')
+                for name, _ in self.databases:
+                    source.execute(f'SELECT count(*) FROM {"main" if name == main_name else name}.sqlite_master')
+            copies = {}
+            for name, _ in self.databases:
+                schema = 'main' if name == main_name else name
+                path = os.path.join(target_dir, f'{name}.db')
+                if self.method == 'vacuum':
+                    source.execute(f'VACUUM {schema} INTO ?', (path,))
+                else:
+                    target = sqlite3.connect(path)
+                    try:
+                        source.backup(target, pages=self.step_pages, name=schema)
+                    finally:
+                        target.close()
+                copies[name] = path
+            if self.method == 'backup':
+                source.execute('COMMIT')
+        finally:
+            source.close()
+
+        databases = {}
+        for name, path in copies.items():
+            conn = sqlite3.connect(path, isolation_level=None)
+            try:
+                conn.execute('PRAGMA journal_mode = DELETE')  # a single self-contained file
+                tables = _table_counts(conn)
+            finally:
+                conn.close()
+            errors = _integrity_errors(path)
+            if errors:
+                raise BackupError(f'Copia di {name} danneggiata: {errors[0]}')
+            databases[name] = {'file': os.path.basename(path), 'size': os.path.getsize(path),
+                               'sha256': _sha256(path), 'tables': tables}
+        return databases
+
+    def _blob_path(self, sha256):
+        return os.path.join(self.blobs_dir, sha256[:2], sha256)
+
+    def _store_blob(self, path, stats):
+        """Copy `path` into the blob store while hashing it; return its SHA-256"""
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=self.blobs_dir, suffix='.part')
+        try:
+            with open(path, 'rb') as source, os.fdopen(fd, 'wb') as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    target.write(chunk)
+            sha256 = digest.hexdigest()
+            blob = self._blob_path(sha256)
+            if os.path.exists(blob):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                stats['new_blobs'] += 1
+                stats['copied_bytes'] += os.path.getsize(temp_path)
+                os.replace(temp_path, blob)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return sha256
+
+    def _store_folder(self, folder, previous, stats):
+        """{relpath: {'sha256', 'size', 'mtime_ns'}} of the files under `folder`"""
+        files = {}
+        if not os.path.isdir(folder):
+            return files
+        for root, dirs, filenames in os.walk(folder):
+            dirs[:] = sorted(d for d in dirs if d not in SKIPPED_DIRS)
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                relpath = os.path.relpath(path, folder).replace(os.sep, '/')
+                try:
+                    st = os.stat(path)
+                    known = previous.get(relpath)
+                    if (known and known['size'] == st.st_size and known['mtime_ns'] == st.st_mtime_ns
+                            and os.path.exists(self._blob_path(known['sha256']))):
+                        sha256 = known['sha256']
+                    else:
+                        sha256 = _sha256(path)
+                        if not os.path.exists(self._blob_path(sha256)):
+                            sha256 = self._store_blob(path, stats)
+                except FileNotFoundError:
+                    continue  # deleted or moved to the archive while scanning
+                files[relpath] = {'sha256': sha256, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+                stats['files'] += 1
+        return files
+
+    # -------------------- verification and retention --------------------
+
+    def verify_snapshot(self, snapshot_id, check_blobs=True):
+        """List of problems found in a snapshot (empty if it can be restored)"""
+        manifest = self.get_snapshot(snapshot_id)
+        directory = os.path.join(self.snapshots_dir, manifest['id'])
+        problems = []
+        for name, info in manifest['databases'].items():
+            path = os.path.join(directory, info['file'])
+            if not os.path.exists(path):
+                problems.append(f'{name}: file {info["file"]} mancante')
+            elif _sha256(path) != info['sha256']:
+                problems.append(f'{name}: checksum diverso da quello registrato')
+            else:
+                problems.extend(f'{name}: {error}' for error in _integrity_errors(path))
+        if check_blobs:
+            checked = set()
+            for name, files in manifest['folders'].items():
+                for relpath, info in files.items():
+                    if info['sha256'] in checked:
+                        continue
+                    checked.add(info['sha256'])
+                    blob = self._blob_path(info['sha256'])
+                    if not os.path.exists(blob):
+                        problems.append(f'{name}/{relpath}: contenuto mancante')
+                    elif _sha256(blob) != info['sha256']:
+                        problems.append(f'{name}/{relpath}: contenuto danneggiato')
+        return problems
+
+    def prune(self, keep=7, retention_days=30):
+        """Delete snapshots older than `retention_days` beyond the newest `keep`, then unused blobs.
+
+        Returns the ids of the deleted snapshots.
+        """
+        with self._locked():
+            cutoff = (datetime.utcnow() - timedelta(days=retention_days)).strftime('%Y%m%d-%H%M%S')
+            snapshots = self.list_snapshots()
+            removed = [m['id'] for m in snapshots[keep:] if m['id'] < cutoff]
+            for snapshot_id in removed:
+                shutil.rmtree(os.path.join(self.snapshots_dir, snapshot_id))
+            # Leftovers of interrupted runs (the lock guarantees none is in progress)
+            for entry in os.listdir(self.snapshots_dir):
+                if entry.startswith(PARTIAL_PREFIX):
+                    shutil.rmtree(os.path.join(self.snapshots_dir, entry), ignore_errors=True)
+
+            referenced = {info['sha256'] for m in snapshots if m['id'] not in removed
+                          for files in m['folders'].values() for info in files.values()}
+            for root, _, filenames in os.walk(self.blobs_dir):
+                for filename in filenames:
+                    if filename not in referenced:
+                        os.remove(os.path.join(root, filename))
+        return removed
+
+    # -------------------- restore --------------------
+
+    def restore(self, snapshot_id):
+        """Put a verified snapshot back in place of the configured databases and folders.
+
+        The app must be stopped. Photos missing or different are rewritten,
+        files added after the snapshot are left alone. Returns a report dict.
+        """
+        with self._locked():
+            manifest = self.get_snapshot(snapshot_id)
+            targets = dict(self.databases)
+            missing = [name for name in list(manifest['databases']) + list(manifest['folders'])
+                       if name not in targets and name not in self.folders]
+            if missing:
+                raise BackupError(f'Destinazione non configurata per: {", ".join(missing)}')
+            problems = self.verify_snapshot(manifest['id'])
+            if problems:
+                raise BackupError(f'Backup {manifest["id"]} non valido: {problems[0]}')
+
+            directory = os.path.join(self.snapshots_dir, manifest['id'])
+            for name, info in manifest['databases'].items():
+                source = sqlite3.connect(os.path.join(directory, info['file']))
+                target = sqlite3.connect(targets[name], timeout=self.timeout)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                    source.close()
+
+            report = {'id': manifest['id'], 'restored_files': 0, 'extra_files': 0}
+            for name, files in manifest['folders'].items():
+                folder = self.folders[name]
+                for relpath, info in files.items():
+                    path = os.path.join(folder, *relpath.split('/'))
+                    if os.path.exists(path) and os.path.getsize(path) == info['size'] and _sha256(path) == info['sha256']:
+                        continue
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    temp_path = path + '.restore'
+                    shutil.copyfile(self._blob_path(info['sha256']), temp_path)
+                    os.replace(temp_path, path)
+                    report['restored_files'] += 1
+                for root, dirs, filenames in os.walk(folder):
+                    dirs[:] = [d for d in dirs if d not in SKIPPED_DIRS]
+                    report['extra_files'] += sum(
+                        os.path.relpath(os.path.join(root, f), folder).replace(os.sep, '/') not in files
+                        for f in filenames
+                    )
+
+            # The restored files must match what was recorded at backup time
+            for name, info in manifest['databases'].items():
+                errors = _integrity_errors(targets[name])
+                if errors:
+                    raise BackupError(f'{name} ripristinato danneggiato: {errors[0]}')
+                conn = sqlite3.connect(targets[name])
+                try:
+                    tables = _table_counts(conn)
+                finally:
+                    conn.close()
+                if tables != info['tables']:
+                    raise BackupError(f'{name} ripristinato: righe diverse dal backup')
+        return report
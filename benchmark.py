@@ -0,0 +1,1137 @@
+"""
+Benchmark e test di carico per FIXIT
+Esegui: python benchmark.py <scenario> [opzioni]
+
+Ogni scenario lavora su un database temporaneo (mai su tickets.db) e
+guida l'app reale tramite il test client di Flask.
+
+Scenari:
+  concurrency   più processi e thread creano ticket, commentano e cambiano
+                status in parallelo; fallisce se compare "database is locked"
+  load          dashboard (filtri e pagine), ricerca, dettaglio e creazione
+                ticket su un database sintetico (seed_data.py); riporta
+                p50/p95/p99 e query SQL per richiesta
+  export        esportazione CSV/XLSX in streaming: tempo al primo byte,
+                velocità e memoria massima del processo
+  login         ondata di login concorrenti (cambio turno) per ciascun metodo
+                di hash; riporta p50/p95 dei login e delle pagine servite
+                nel frattempo
+  ratelimit     più processi tentano il login con lo stesso utente: verifica
+                che il limite valga per tutti i worker insieme (storage
+                SQLite condiviso) e misura il costo di un controllo
+  startup       avvio a freddo di un worker in un processo nuovo: import di
+                wsgi.py e prima richiesta, confrontato con init_db a ogni avvio
+  commits       le stesse scritture di concurrency con e senza group commit
+                (WRITE_BATCHING): scritture/s, transazioni/s, scritture per
+                transazione e latenza
+  submit        ondata di segnalazioni con foto da molti telefoni verso un vero
+                server gunicorn: worker sync, gthread e gthread con group
+                commit (WRITE_BATCHING); verifica che ogni ID restituito esista
+  backup        backup online mentre più processi creano ticket: durata,
+                latenza delle scritture durante la copia, coerenza dello
+                snapshot, backup incrementale delle foto e ripristino verificato
+  templates     tempo di rendering dei template per pagina (dashboard,
+                dettaglio, home, statistiche) con la cache dei frammenti vuota
+                e piena; compilazione di tutti i template dal sorgente e dal
+                bytecode su disco (TEMPLATE_CACHE_DIR)
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+
+ADMIN_PASSWORD = 'benchmark-password'
+
+
+# ==================== HELPERS ====================
+
+def bootstrap_app(db_path):
+    """Import the app configured on `db_path` with CSRF, rate limits and email worker disabled"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(db_path)}'
+    # Archive tier next to the benchmark database, not in instance/
+    os.environ['ARCHIVE_DATABASE'] = os.path.join(os.path.dirname(os.path.abspath(db_path)), 'archive.db')
+    os.environ['ARCHIVE_UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(db_path)), 'archive_uploads')
+    os.environ['ADMIN_PASSWORD'] = ADMIN_PASSWORD
+    os.environ['NOTIFICATION_WORKER_ENABLED'] = 'False'
+    os.environ.setdefault('METRICS_DIR', '')  # per-process metrics only, nothing written to instance/
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import app as fixit
+
+    fixit.app.config['WTF_CSRF_ENABLED'] = False
+    fixit.app.config['TESTING'] = True
+    fixit.limiter.enabled = False
+    return fixit
+
+
+def login(client):
+    response = client.post('/admin/login', data={'username': 'admin', 'password': ADMIN_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError('Login fallito')
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def print_latencies(label, latencies, queries=None):
+    line = (f"   {label:<28} n={len(latencies):<6} "
+            f"p50={percentile(latencies, 50) * 1000:7.1f}ms  "
+            f"p95={percentile(latencies, 95) * 1000:7.1f}ms  "
+            f"p99={percentile(latencies, 99) * 1000:7.1f}ms")
+    if queries:
+        line += f"  query={statistics.mean(queries):4.1f} (max {max(queries)})"
+    print(line)
+
+
+# ==================== SCENARIO: CONCURRENCY ====================
+
+def _init_database(db_path, seed_tickets):
+    fixit = bootstrap_app(db_path)
+    fixit.init_db()
+    with fixit.app.app_context():
+        for i in range(seed_tickets):
+            fixit.db.session.add(fixit.Ticket(
+                ticket_type='MEZZO', requester_name=f'Seed {i}', description='Ticket iniziale benchmark',
+                vehicle_type='Mafi', vehicle_number=f'MF-{i:03d}', anomaly_category='Pneumatici'
+            ))
+        fixit.db.session.commit()
+
+
+def _concurrency_worker(db_path, threads, requests_per_thread, seed_tickets, results):
+    fixit = bootstrap_app(db_path)
+    latencies = []
+    errors = []
+    span = []  # wall clock of the first write and of the end of the last one
+    lock = threading.Lock()
+
+    def run():
+        client = fixit.app.test_client()
+        login(client)
+        rng = random.Random()
+        with lock:
+            span.append(time.time())
+        for i in range(requests_per_thread):
+            ticket_id = rng.randint(1, seed_tickets)
+            step = i % 3
+            started = time.perf_counter()
+            try:
+                if step == 0:
+                    response = client.post('/new/mezzi', data={
+                        'requester_name': 'Benchmark', 'vehicle_type': 'Ralla', 'vehicle_number': f'RL-{i}',
+                        'anomaly_category': 'Carrozzeria', 'description': 'Creato dal test di concorrenza'
+                    })
+                elif step == 1:
+                    response = client.post(f'/admin/ticket/{ticket_id}', data={
+                        'action': 'add_comment', 'author_name': 'admin', 'comment_body': f'Commento {i}'
+                    })
+                else:
+                    response = client.post(f'/admin/ticket/{ticket_id}', data={
+                        'action': 'update_status', 'status': rng.choice(['NUOVO', 'IN_LAVORAZIONE', 'RISOLTO'])
+                    })
+                if response.status_code >= 500:
+                    raise RuntimeError(f'HTTP {response.status_code}')
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+        with lock:
+            span.append(time.time())
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # Transactions that stored the writes: one per write unless they were group-committed
+    commits = fixit.write_batcher.batches if fixit.app.config['WRITE_BATCHING'] else len(latencies)
+    results.put((latencies, errors, commits, (min(span), max(span))))
+
+
+def scenario_concurrency(args):
+    workdir = tempfile.mkdtemp(prefix='fixit-bench-')
+    db_path = os.path.join(workdir, 'tickets.db')
+    ctx = multiprocessing.get_context('spawn')
+    try:
+        init = ctx.Process(target=_init_database, args=(db_path, args.seed_tickets))
+        init.start()
+        init.join()
+
+        results = ctx.Queue()
+        started = time.perf_counter()
+        processes = [
+            ctx.Process(target=_concurrency_worker,
+                        args=(db_path, args.threads, args.requests, args.seed_tickets, results))
+            for _ in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        latencies, errors = [], []
+        for _ in processes:
+            worker_latencies, worker_errors, _, _ = results.get()
+            latencies.extend(worker_latencies)
+            errors.extend(worker_errors)
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    locked = [e for e in errors if 'database is locked' in e]
+    print("=" * 60)
+    print(f"CONCORRENZA: {args.workers} processi x {args.threads} thread x {args.requests} richieste")
+    print("=" * 60)
+    print_latencies('scritture', latencies)
+    print(f"   throughput                   {len(latencies) / elapsed:.1f} richieste/s")
+    print(f"   errori                       {len(errors)} (database is locked: {len(locked)})")
+    for error in sorted(set(errors))[:5]:
+        print(f"     - {error}")
+    return 1 if errors else 0
+
+
+# ==================== SCENARIO: COMMITS ====================
+
+def scenario_commits(args):
+    workdir = tempfile.mkdtemp(prefix='fixit-bench-')
+    db_path = os.path.join(workdir, 'tickets.db')
+    ctx = multiprocessing.get_context('spawn')
+    os.environ['SQLITE_SYNCHRONOUS'] = args.synchronous
+    os.environ['WRITE_BATCH_WINDOW_MS'] = str(args.window)
+    os.environ['WRITE_BATCH_MAX_SIZE'] = str(args.max_batch)
+    os.environ['DB_POOL_SIZE'] = str(args.threads + 1)
+    os.environ['DB_MAX_OVERFLOW'] = str(args.threads)
+    print("=" * 60)
+    print(f"GROUP COMMIT: {args.workers} processi x {args.threads} thread x {args.requests} scritture, "
+          f"synchronous={args.synchronous}")
+    print("=" * 60)
+    failed = False
+    try:
+        init = ctx.Process(target=_init_database, args=(db_path, args.seed_tickets))
+        init.start()
+        init.join()
+
+        for batching, label in (('False', 'una transazione per scrittura'),
+                                ('True', f'group commit {args.window:g}ms / {args.max_batch}')):
+            # Read by the spawned workers when they import the app
+            os.environ['WRITE_BATCHING'] = batching
+            results = ctx.Queue()
+            processes = [
+                ctx.Process(target=_concurrency_worker,
+                            args=(db_path, args.threads, args.requests, args.seed_tickets, results))
+                for _ in range(args.workers)
+            ]
+            for process in processes:
+                process.start()
+            latencies, errors, commits, spans = [], [], 0, []
+            for _ in processes:
+                worker_latencies, worker_errors, worker_commits, span = results.get()
+                latencies.extend(worker_latencies)
+                errors.extend(worker_errors)
+                commits += worker_commits
+                spans.append(span)
+            for process in processes:
+                process.join()
+            # Writing phase only (process start and logins excluded)
+            elapsed = max(end for _, end in spans) - min(start for start, _ in spans)
+            failed = failed or bool(errors)
+            print(f"   {label}")
+            print_latencies('scritture', latencies)
+            print(f"   {'scritture/s':<28} {len(latencies) / elapsed:.1f}")
+            print(f"   {'commit/s':<28} {commits / elapsed:.1f}  "
+                  f"({len(latencies) / max(commits, 1):.1f} scritture per transazione)")
+            print(f"   {'errori':<28} {len(errors)}")
+            for error in sorted(set(errors))[:5]:
+                print(f"     - {error}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+# ==================== SCENARIO: LOAD ====================
+
+def _load_requests(rng, seed_data, max_id, admin_ids, pages):
+    """Yield (workload, method, path, form data) forever, in a reproducible order"""
+    dashboard_filters = [
+        '', '?status=NUOVO', '?status=IN_LAVORAZIONE', '?status=RISOLTO&assigned=unassigned',
+        '?paging=cursor', '?paging=cursor&status=RISOLTO',
+    ] + [f'?assigned={admin_id}' for admin_id in admin_ids]
+    search_terms = ['stampante', 'pneumatici', 'olio', 'badge', 'ricambi', 'Ferrari', 'MA-012', 'turno notte', 'zzzz']
+    while True:
+        query = rng.choice(dashboard_filters + [f'?page={rng.randint(2, pages)}'])
+        yield 'dashboard', 'GET', f'/admin/dashboard{query}', None
+        term = rng.choice(search_terms)
+        yield 'ricerca', 'GET', f'/admin/dashboard?search={term}', None
+        yield 'dettaglio', 'GET', f'/admin/ticket/{rng.randint(1, max_id)}', None
+        if rng.random() < 0.5:
+            yield 'creazione', 'POST', '/new/mezzi', {
+                'requester_name': rng.choice(seed_data.REQUESTER_NAMES), 'vehicle_type': 'Ralla',
+                'vehicle_number': f'RL-{rng.randint(1, 400):03d}',
+                'anomaly_category': rng.choice(seed_data.ANOMALY_CATEGORIES), 'description': 'Creato dal benchmark'
+            }
+        else:
+            yield 'creazione', 'POST', '/new/tecnico', {
+                'requester_name': rng.choice(seed_data.REQUESTER_NAMES), 'department': 'IT',
+                'title': rng.choice(seed_data.TECH_TITLES), 'priority': 'MEDIA', 'description': 'Creato dal benchmark'
+            }
+
+
+def scenario_load(args):
+    workdir = None
+    db_path = args.database
+    if not db_path:
+        workdir = tempfile.mkdtemp(prefix='fixit-bench-')
+        db_path = os.path.join(workdir, 'tickets.db')
+    try:
+        fixit = bootstrap_app(db_path)
+        import seed_data
+
+        fixit.init_db()
+        with fixit.app.app_context():
+            existing = fixit.db.session.query(fixit.db.func.count(fixit.Ticket.id)).scalar()
+            if existing < args.tickets:
+                print(f"Generazione di {args.tickets - existing} ticket sintetici (seed {args.seed})...")
+                seed_data.generate_synthetic_data(
+                    tickets=args.tickets - existing, comments_per_ticket=args.comments,
+                    seed=args.seed, verbose=False
+                )
+            max_id = fixit.db.session.query(fixit.db.func.max(fixit.Ticket.id)).scalar()
+            admin_ids = [user.id for user in fixit.User.query.all()]
+
+        client = fixit.app.test_client()
+        login(client)
+        rng = random.Random(args.seed)
+        requests = _load_requests(rng, seed_data, max_id, admin_ids, pages=args.pages)
+        latencies, queries, errors = {}, {}, []
+        for i in range((args.warmup + args.requests) * 4):
+            workload, method, path, data = next(requests)
+            started = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                errors.append(f'{method} {path}: HTTP {response.status_code}')
+                continue
+            if i < args.warmup * 4:
+                continue
+            latencies.setdefault(workload, []).append(elapsed)
+            queries.setdefault(workload, []).append(int(response.headers.get('X-SQL-Queries', 0)))
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print("=" * 60)
+    print(f"CARICO: {max_id} ticket, {args.requests} richieste per tipo (test client)")
+    print("=" * 60)
+    for workload in ('dashboard', 'ricerca', 'dettaglio', 'creazione'):
+        print_latencies(workload, latencies.get(workload, []), queries.get(workload))
+    print(f"   errori                       {len(errors)}")
+    for error in sorted(set(errors))[:5]:
+        print(f"     - {error}")
+    return 1 if errors else 0
+
+
+# ==================== SCENARIO: EXPORT ====================
+
+def scenario_export(args):
+    workdir = None
+    db_path = args.database
+    if not db_path:
+        workdir = tempfile.mkdtemp(prefix='fixit-bench-')
+        db_path = os.path.join(workdir, 'tickets.db')
+    try:
+        fixit = bootstrap_app(db_path)
+        import seed_data
+
+        fixit.init_db()
+        with fixit.app.app_context():
+            existing = fixit.db.session.query(fixit.db.func.count(fixit.Ticket.id)).scalar()
+            if existing < args.tickets:
+                print(f"Generazione di {args.tickets - existing} ticket sintetici...")
+                seed_data.generate_synthetic_data(tickets=args.tickets - existing, verbose=False)
+
+        client = fixit.app.test_client()
+        login(client)
+        print("=" * 60)
+        print(f"EXPORT: {max(existing, args.tickets)} ticket")
+        print("=" * 60)
+        failed = False
+        # Python heap peak: RSS would also count the SQLite pages mapped by mmap_size
+        tracemalloc.start()
+        for label, query in (('CSV', 'format=csv'), ('CSV gzip', 'format=csv&compress=gzip'),
+                             ('XLSX', 'format=xlsx'), ('Commenti CSV', 'format=csv&dataset=comments')):
+            tracemalloc.reset_peak()
+            started = time.perf_counter()
+            response = client.get(f'/admin/export?{query}', buffered=False)
+            first_byte = None
+            size = 0
+            for chunk in response.response:
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                size += len(chunk)
+            response.close()
+            elapsed = time.perf_counter() - started
+            failed = failed or response.status_code != 200
+            print(f"   {label:<14} HTTP {response.status_code}  primo byte={(first_byte or 0) * 1000:6.1f}ms  "
+                  f"totale={elapsed:6.2f}s  {size / 1024 / 1024:7.1f} MB  "
+                  f"picco heap={tracemalloc.get_traced_memory()[1] / 1024 / 1024:5.1f} MB")
+        tracemalloc.stop()
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+# ==================== SCENARIO: LOGIN ====================
+
+def scenario_login(args):
+    workdir = tempfile.mkdtemp(prefix='fixit-bench-')
+    db_path = os.path.join(workdir, 'tickets.db')
+    try:
+        os.environ['PASSWORD_HASH_WORKERS'] = str(args.pool)
+        fixit = bootstrap_app(db_path)
+        fixit.init_db()
+        usernames = [f'turno{i}' for i in range(args.threads)]
+        with fixit.app.app_context():
+            for username in usernames:
+                fixit.db.session.add(fixit.User(username=username, password_hash='!'))
+            fixit.db.session.commit()
+
+        print("=" * 60)
+        print(f"LOGIN: {args.threads} utenti x {args.requests} login, pool di {args.pool} thread")
+        print("=" * 60)
+        failed = False
+        for method in args.methods.split(','):
+            fixit.password_hasher.method = method
+            with fixit.app.app_context():
+                for user in fixit.User.query.filter(fixit.User.username.in_(usernames)):
+                    user.set_password(ADMIN_PASSWORD)
+                fixit.db.session.commit()
+
+            logins, pages, errors = [], [], []
+            lock = threading.Lock()
+            done = threading.Event()
+
+            def log_in(username):
+                client = fixit.app.test_client()
+                for _ in range(args.requests):
+                    started = time.perf_counter()
+                    response = client.post('/admin/login', data={'username': username, 'password': ADMIN_PASSWORD})
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        if response.status_code != 302:
+                            errors.append(f'login HTTP {response.status_code}')
+                        else:
+                            logins.append(elapsed)
+
+            def browse():
+                # Another user working on the dashboard while the others log in
+                client = fixit.app.test_client()
+                login(client)
+                while not done.is_set():
+                    started = time.perf_counter()
+                    client.get('/admin/dashboard')
+                    pages.append(time.perf_counter() - started)
+
+            browser = threading.Thread(target=browse)
+            browser.start()
+            workers = [threading.Thread(target=log_in, args=(username,)) for username in usernames]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+            done.set()
+            browser.join()
+
+            print(f"   {method}")
+            print_latencies('login', logins)
+            print_latencies('dashboard durante i login', pages)
+            print(f"   throughput                   {len(logins) / elapsed:.1f} login/s   errori {len(errors)}")
+            failed = failed or bool(errors)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+# ==================== SCENARIO: RATE LIMIT ====================
+
+def _ratelimit_worker(db_path, storage_uri, limit, attempts, start, results):
+    os.environ['RATELIMIT_STORAGE_URI'] = storage_uri
+    os.environ['LOGIN_USER_RATE_LIMIT'] = f'{limit} per minute'
+    os.environ['LOGIN_RATE_LIMIT'] = '100000 per minute'
+    os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'  # the limiter is measured, not the hash
+    fixit = bootstrap_app(db_path)
+    fixit.limiter.enabled = True
+    client = fixit.app.test_client()
+    statuses = []
+    start.wait()
+    for _ in range(attempts):
+        response = client.post('/admin/login', data={'username': 'admin', 'password': 'sbagliata'})
+        statuses.append(response.status_code)
+    results.put(statuses)
+
+
+def scenario_ratelimit(args):
+    import ratelimit_storage
+    from limits import parse, strategies
+
+    workdir = tempfile.mkdtemp(prefix='fixit-bench-')
+    db_path = os.path.join(workdir, 'tickets.db')
+    ctx = multiprocessing.get_context('spawn')
+    failed = False
+    try:
+        init = ctx.Process(target=_init_database, args=(db_path, 0))
+        init.start()
+        init.join()
+
+        print("=" * 60)
+        print(f"RATE LIMIT: {args.workers} processi x {args.attempts} login, limite {args.limit}/minuto per utente")
+        print("=" * 60)
+        for label, storage_uri in (('sqlite (condiviso)', f"sqlite:///{os.path.join(workdir, 'ratelimit.db')}"),
+                                   ('memory (per worker)', 'memory://')):
+            start = ctx.Event()
+            results = ctx.Queue()
+            processes = [
+                ctx.Process(target=_ratelimit_worker,
+                            args=(db_path, storage_uri, args.limit, args.attempts, start, results))
+                for _ in range(args.workers)
+            ]
+            for process in processes:
+                process.start()
+            time.sleep(3)  # let every worker import the app before the burst
+            start.set()
+            statuses = []
+            for _ in processes:
+                statuses.extend(results.get())
+            for process in processes:
+                process.join()
+            allowed = sum(1 for status in statuses if status != 429)
+            print(f"   {label:<28} ammessi {allowed:>4} su {len(statuses)} (atteso {args.limit})")
+            if storage_uri.startswith('sqlite') and allowed != args.limit:
+                failed = True
+
+        # Cost of one check on the shared storage, without HTTP around it
+        storage = ratelimit_storage.SQLiteStorage(f"sqlite:///{os.path.join(workdir, 'ratelimit-cost.db')}")
+        limiter = strategies.SlidingWindowCounterRateLimiter(storage)
+        item = parse('1000000 per minute')
+        latencies = []
+        for i in range(args.checks):
+            started = time.perf_counter()
+            limiter.hit(item, 'login', f'utente{i % 100}')
+            latencies.append(time.perf_counter() - started)
+        print(f"   controllo (hit) sqlite       n={len(latencies):<6} "
+              f"p50={percentile(latencies, 50) * 1e6:6.0f}µs  p95={percentile(latencies, 95) * 1e6:6.0f}µs  "
+              f"p99={percentile(latencies, 99) * 1e6:6.0f}µs")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+# ==================== SCENARIO: STARTUP ====================
+
+# Run in a fresh interpreter, like a worker booted by gunicorn. In 'preload' mode the
+# app is imported once and each worker is forked from it, like `gunicorn --preload`.
+_STARTUP_PROBE = """
+import json, os, sys, time
+
+def first_request(application):
+    started = time.perf_counter()
+    application.config['TESTING'] = True
+    response = application.test_client().get('/admin/login')
+    assert response.status_code == 200, response.status_code
+    return time.perf_counter() - started
+
+started = time.perf_counter()
+if sys.argv[1] == 'init_db':
+    import app as fixit
+    fixit.init_db()  # what every worker did before ensure_database
+    application = fixit.app
+else:
+    from wsgi import app as application
+imported = time.perf_counter() - started
+
+if sys.argv[1] != 'preload':
+    print(json.dumps([{'import': imported, 'first_request': first_request(application)}]))
+    sys.exit(0)
+
+results = []
+for _ in range(int(sys.argv[2])):
+    read_end, write_end = os.pipe()
+    forked = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        elapsed = first_request(application)
+        os.write(write_end, json.dumps({'import': time.perf_counter() - forked - elapsed,
+                                        'first_request': elapsed}).encode())
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        results.append(json.loads(pipe.read()))
+    os.waitpid(pid, 0)
+print(json.dumps(results))
+"""
+
+
+def _run_startup_probe(mode, runs, here, env):
+    """[{'import': s, 'first_request': s}, ...] of `runs` worker boots in the given mode"""
+    command = [sys.executable, '-c', _STARTUP_PROBE, mode]
+    if mode == 'preload':
+        command.append(str(runs))
+        runs = 1
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(command, cwd=here, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr[-2000:])
+        timings.extend(json.loads(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def scenario_startup(args):
+    workdir = tempfile.mkdtemp(prefix='fixit-bench-')
+    db_path = os.path.join(workdir, 'tickets.db')
+    ctx = multiprocessing.get_context('spawn')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', ADMIN_PASSWORD=ADMIN_PASSWORD,
+               ARCHIVE_DATABASE=os.path.join(workdir, 'archive.db'),
+               NOTIFICATION_WORKER_ENABLED='False', METRICS_DIR='',
+               RATELIMIT_STORAGE_URI=f"sqlite:///{os.path.join(workdir, 'ratelimit.db')}")
+    here = os.path.dirname(os.path.abspath(__file__))
+    modes = [('init_db', 'init_db a ogni avvio'), ('wsgi', 'wsgi.py (ensure_database)')]
+    if hasattr(os, 'fork'):
+        modes.append(('preload', 'fork da master --preload'))
+    failed = False
+    try:
+        init = ctx.Process(target=_init_database, args=(db_path, args.seed_tickets))
+        init.start()
+        init.join()
+
+        print("=" * 60)
+        print(f"AVVIO A FREDDO: {args.runs} worker per modalità, {args.seed_tickets} ticket")
+        print("=" * 60)
+        for mode, label in modes:
+            try:
+                timings = _run_startup_probe(mode, args.runs, here, env)
+            except RuntimeError as e:
+                failed = True
+                print(f"   {label}: errore\n{e}")
+                continue
+            print(f"   {label}")
+            print_latencies('avvio (import/fork)', [t['import'] for t in timings])
+            print_latencies('prima richiesta', [t['first_request'] for t in timings])
+            print_latencies('pronto', [t['import'] + t['first_request'] for t in timings])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+# ==================== SCENARIO: SUBMIT ====================
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _photo_bytes(kb):
+    """A JPEG of about `kb` KB (noise does not compress)"""
+    try:
+        from io import BytesIO
+        from PIL import Image
+    except ImportError:
+        return b'\xff\xd8\xff\xe0' + os.urandom(kb * 1024)  # JPEG signature only: processing will skip it
+    side = int((kb * 1024 / 1.5) ** 0.5)
+    buffer = BytesIO()
+    Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(buffer, 'JPEG', quality=80)
+    return buffer.getvalue()
+
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+             for name, value in fields.items()]
+    for name, (filename, data) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def _submit_client(port, requests, photo, results, lock):
+    """One phone: open the form (CSRF token and session cookie), then send `requests` tickets"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    latencies, ids, errors = [], [], []
+    try:
+        conn.request('GET', '/new/mezzi')
+        response = conn.getresponse()
+        html = response.read().decode()
+        cookie = response.getheader('Set-Cookie', '').split(';')[0]
+        token = re.search(r'name="csrf_token" value="([^"]+)"', html).group(1)
+        for i in range(requests):
+            body, content_type = _multipart({
+                'csrf_token': token, 'requester_name': 'Benchmark', 'vehicle_type': 'Ralla',
+                'vehicle_number': f'RL-{i}', 'anomaly_category': 'Pneumatici', 'description': 'Segnalazione a inizio turno',
+            }, {'image': ('foto.jpg', photo)} if photo else {})
+            started = time.perf_counter()
+            conn.request('POST', '/new/mezzi', body=body,
+                         headers={'Content-Type': content_type, 'Cookie': cookie, 'Accept': 'application/json'})
+            response = conn.getresponse()
+            data = response.read()
+            if response.status != 201:
+                errors.append(f'HTTP {response.status}')
+                continue
+            latencies.append(time.perf_counter() - started)
+            ids.append(json.loads(data)['id'])
+    except Exception as e:
+        errors.append(str(e))
+    finally:
+        conn.close()
+    with lock:
+        results['latencies'].extend(latencies)
+        results['ids'].extend(ids)
+        results['errors'].extend(errors)
+
+
+def _start_gunicorn(here, env, port, worker_class, args, log_path):
+    command = [sys.executable, '-m', 'gunicorn', 'wsgi:app', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(args.workers), '--worker-class', worker_class, '--threads', str(args.threads),
+               '--timeout', '120', '--preload']
+    server = subprocess.Popen(command, cwd=here, env=env, stdout=subprocess.DEVNULL,
+                              stderr=open(log_path, 'ab'))
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            break
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/new/mezzi')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    with open(log_path, errors='replace') as f:
+        raise RuntimeError(f'gunicorn non è partito:\n{f.read()[-2000:]}')
+
+
+def scenario_submit(args):
+    import sqlite3
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print('gunicorn non installato: pip install gunicorn')
+        return 1
+    workdir = tempfile.mkdtemp(prefix='fixit-bench-')
+    db_path = os.path.join(workdir, 'tickets.db')
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', ADMIN_PASSWORD=ADMIN_PASSWORD,
+               ARCHIVE_DATABASE=os.path.join(workdir, 'archive.db'),
+               ARCHIVE_UPLOAD_FOLDER=os.path.join(workdir, 'archive_uploads'),
+               UPLOAD_FOLDER=os.path.join(workdir, 'uploads'), METRICS_DIR='',
+               NOTIFICATION_WORKER_ENABLED='False', TICKET_FORM_RATE_LIMIT='1000000 per minute',
+               RATELIMIT_STORAGE_URI=f"sqlite:///{os.path.join(workdir, 'ratelimit.db')}",
+               DB_POOL_SIZE=str(args.threads + 1), DB_MAX_OVERFLOW=str(args.threads))
+    photo = _photo_bytes(args.photo_kb) if args.photo_kb else None
+    modes = [('sync', 'False', 'worker sync'), ('gthread', 'False', 'gthread'),
+             ('gthread', 'True', f'gthread + group commit {args.window:g}ms')]
+    failed = False
+    print("=" * 60)
+    print(f"SEGNALAZIONI: {args.clients} telefoni x {args.requests} ticket, foto {args.photo_kb} KB, "
+          f"{args.workers} worker x {args.threads} thread")
+    print("=" * 60)
+    try:
+        for worker_class, batching, label in modes:
+            port = _free_port()
+            mode_env = dict(env, WRITE_BATCHING=batching, WRITE_BATCH_WINDOW_MS=str(args.window))
+            server = _start_gunicorn(here, mode_env, port, worker_class, args, os.path.join(workdir, 'gunicorn.log'))
+            results = {'latencies': [], 'ids': [], 'errors': []}
+            lock = threading.Lock()
+            clients = [threading.Thread(target=_submit_client, args=(port, args.requests, photo, results, lock))
+                       for _ in range(args.clients)]
+            started = time.perf_counter()
+            try:
+                for client in clients:
+                    client.start()
+                for client in clients:
+                    client.join()
+                elapsed = time.perf_counter() - started
+            finally:
+                server.terminate()
+                server.wait(30)
+
+            conn = sqlite3.connect(db_path)
+            stored = {row[0] for row in conn.execute('SELECT id FROM tickets')}
+            conn.close()
+            ids = results['ids']
+            missing = len(set(ids) - stored)
+            duplicates = len(ids) - len(set(ids))
+            errors = results['errors']
+            failed = failed or bool(errors or missing or duplicates)
+            print(f"   {label}")
+            print_latencies('invio (con foto)', results['latencies'])
+            print(f"   {'throughput':<28} {len(ids) / elapsed * 60:.0f} ticket/minuto")
+            print(f"   {'verifica':<28} {len(ids)} ID restituiti, {missing} non salvati, {duplicates} duplicati, "
+                  f"{len(errors)} errori")
+            for error in sorted(set(errors))[:5]:
+                print(f"     - {error}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+# ==================== SCENARIO: BACKUP ====================
+
+def _backup_writer(db_path, ready, stop, results):
+    fixit = bootstrap_app(db_path)
+    client = fixit.app.test_client()
+    client.get('/new/mezzi')
+    ready.wait()
+    samples, errors = [], []
+    i = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        at = time.time()
+        try:
+            response = client.post('/new/mezzi', data={
+                'requester_name': 'Benchmark', 'vehicle_type': 'Ralla', 'vehicle_number': f'RL-{i}',
+                'anomaly_category': 'Carrozzeria', 'description': 'Creato durante il backup'
+            })
+            if response.status_code >= 400:
+                raise RuntimeError(f'HTTP {response.status_code}')
+        except Exception as e:
+            errors.append(str(e))
+        else:
+            samples.append((at, time.perf_counter() - started))
+        i += 1
+    results.put((samples, errors))
+
+
+def _count_tickets(path):
+    import sqlite3
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT count(*) FROM tickets').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _write_photos(folder, count, size, prefix):
+    os.makedirs(folder, exist_ok=True)
+    for i in range(count):
+        with open(os.path.join(folder, f'{prefix}{i:05d}.jpg'), 'wb') as f:
+            f.write(os.urandom(size))
+
+
+def scenario_backup(args):
+    import sqlite3
+    import backup_manager
+
+    workdir = tempfile.mkdtemp(prefix='fixit-bench-')
+    db_path = os.path.join(workdir, 'tickets.db')
+    upload_folder = os.path.join(workdir, 'uploads')
+    ctx = multiprocessing.get_context('spawn')
+    problems = []
+    try:
+        fixit = bootstrap_app(db_path)
+        import seed_data
+
+        fixit.init_db()
+        with fixit.app.app_context():
+            print(f"Generazione di {args.tickets} ticket sintetici...")
+            seed_data.generate_synthetic_data(tickets=args.tickets, verbose=False)
+            fixit.db.engine.dispose()
+        _write_photos(upload_folder, args.photos, args.photo_size, 'foto')
+        manager = backup_manager.BackupManager(
+            os.path.join(workdir, 'backups'),
+            [('main', db_path), ('archive', os.environ['ARCHIVE_DATABASE'])],
+            {'uploads': upload_folder}, method=args.method, step_pages=args.step_pages,
+        )
+
+        ready = ctx.Barrier(args.writers + 1)
+        stop = ctx.Event()
+        results = ctx.Queue()
+        writers = [ctx.Process(target=_backup_writer, args=(db_path, ready, stop, results))
+                   for _ in range(args.writers)]
+        for writer in writers:
+            writer.start()
+        ready.wait()
+        time.sleep(args.warmup)  # writers at full speed before the copy starts
+
+        before = _count_tickets(db_path)
+        backup_started = time.time()
+        first = manager.create_snapshot()
+        backup_ended = time.time()
+        after = _count_tickets(db_path)
+        time.sleep(args.warmup / 2)
+        stop.set()
+        samples, errors = [], []
+        for _ in writers:
+            writer_samples, writer_errors = results.get()
+            samples.extend(writer_samples)
+            errors.extend(writer_errors)
+        for writer in writers:
+            writer.join()
+
+        snapshot_db = os.path.join(manager.snapshots_dir, first['id'], 'main.db')
+        copied = _count_tickets(snapshot_db)
+        conn = sqlite3.connect(snapshot_db)
+        orphans = conn.execute('PRAGMA foreign_key_check').fetchall()
+        conn.close()
+        if not before <= copied <= after:
+            problems.append(f'snapshot con {copied} ticket, attesi tra {before} e {after}')
+        if orphans:
+            problems.append(f'{len(orphans)} righe senza riferimento nello snapshot')
+        problems.extend(manager.verify_snapshot(first['id']))
+
+        _write_photos(upload_folder, args.new_photos, args.photo_size, 'nuova')
+        second = manager.create_snapshot()
+        problems.extend(manager.verify_snapshot(second['id']))
+
+        restored = os.path.join(workdir, 'restored')
+        os.makedirs(restored)
+        target = backup_manager.BackupManager(
+            manager.backup_dir,
+            [('main', os.path.join(restored, 'tickets.db')), ('archive', os.path.join(restored, 'archive.db'))],
+            {'uploads': os.path.join(restored, 'uploads')},
+        )
+        restore_started = time.perf_counter()
+        try:
+            report = target.restore(second['id'])
+        except backup_manager.BackupError as e:
+            problems.append(str(e))
+            report = {'restored_files': 0}
+        restore_elapsed = time.perf_counter() - restore_started
+        restored_tickets = _count_tickets(os.path.join(restored, 'tickets.db'))
+        live_tickets = _count_tickets(db_path)
+        if restored_tickets != live_tickets:
+            problems.append(f'ripristinati {restored_tickets} ticket, nel database {live_tickets}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    during = [latency for at, latency in samples if backup_started <= at <= backup_ended]
+    outside = [latency for at, latency in samples if not backup_started <= at <= backup_ended]
+    size = sum(info['size'] for info in first['databases'].values()) / 1024 / 1024
+    print("=" * 60)
+    print(f"BACKUP ONLINE ({args.method}): {args.writers} processi scrivono, {args.tickets} ticket, {args.photos} foto")
+    print("=" * 60)
+    print(f"   snapshot completo            {backup_ended - backup_started:.2f}s  {size:.1f} MB di database  "
+          f"{first['stats']['new_blobs']} foto copiate")
+    print(f"   ticket nello snapshot        {copied} (prima {before}, dopo {after})")
+    print_latencies('creazione senza backup', outside)
+    print_latencies('creazione durante il backup', during)
+    print(f"   snapshot incrementale        {second['duration']:.2f}s  {second['stats']['new_blobs']} foto copiate "
+          f"su {second['stats']['files']}")
+    print(f"   ripristino verificato        {restore_elapsed:.2f}s  {report['restored_files']} foto riscritte")
+    print(f"   errori                       {len(errors)} scritture, {len(problems)} problemi di backup")
+    for error in sorted(set(errors))[:5] + problems[:5]:
+        print(f"     - {error}")
+    return 1 if errors or problems else 0
+
+
+# ==================== SCENARIO: TEMPLATES ====================
+
+def _server_timing(response, name):
+    """Milliseconds of one Server-Timing metric (METRICS_SERVER_TIMING)"""
+    match = re.search(rf'{name};dur=([\d.]+)', response.headers.get('Server-Timing', ''))
+    return float(match.group(1)) / 1000 if match else 0.0
+
+
+def _template_pages(rng, max_id, pages):
+    """Yield (page, path) forever, in a reproducible order"""
+    while True:
+        yield 'dashboard', f'/admin/dashboard?page={rng.randint(1, pages)}'
+        yield 'dettaglio', f'/admin/ticket/{rng.randint(1, max_id)}'
+        yield 'home', '/'
+        yield 'statistiche', '/admin/analytics'
+
+
+def scenario_templates(args):
+    workdir = tempfile.mkdtemp(prefix='fixit-bench-')
+    db_path = os.path.join(workdir, 'tickets.db')
+    os.environ['TEMPLATE_CACHE_DIR'] = os.path.join(workdir, 'jinja_cache')
+    os.environ['METRICS_SERVER_TIMING'] = 'True'
+    errors = []
+    try:
+        fixit = bootstrap_app(db_path)
+        import seed_data
+
+        fixit.init_db()
+        with fixit.app.app_context():
+            print(f"Generazione di {args.tickets} ticket sintetici (seed {args.seed})...")
+            seed_data.generate_synthetic_data(tickets=args.tickets, comments_per_ticket=args.comments,
+                                              seed=args.seed, verbose=False)
+            max_id = fixit.db.session.query(fixit.db.func.max(fixit.Ticket.id)).scalar()
+
+        # Loading every template in a fresh environment, as a new worker does
+        count = fixit.precompile_templates()
+        compile_times = {'dal sorgente': [], 'dal bytecode su disco': []}
+        for _ in range(args.runs):
+            for label, bytecode_cache in (('dal sorgente', None),
+                                          ('dal bytecode su disco', fixit.app.jinja_env.bytecode_cache)):
+                env = fixit.app.create_jinja_environment()
+                env.filters.update(fixit.app.jinja_env.filters)  # the app's own filters, needed to compile
+                env.bytecode_cache = bytecode_cache
+                started = time.perf_counter()
+                for name in env.list_templates(extensions=['html']):
+                    env.get_template(name)
+                compile_times[label].append(time.perf_counter() - started)
+
+        # Every page twice: with the fragment cache just emptied, then served from it
+        client = fixit.app.test_client()
+        login(client)
+        pages = _template_pages(random.Random(args.seed), max_id, max(1, min(args.pages, max_id // 50)))
+        render, total, queries = {}, {}, {}
+        for i in range((args.warmup + args.requests) * 4):
+            page, path = next(pages)
+            for cache_state in ('vuota', 'piena'):
+                if cache_state == 'vuota':
+                    fixit.data_cache.clear()
+                response = client.get(path)
+                if response.status_code != 200:
+                    errors.append(f'GET {path}: HTTP {response.status_code}')
+                    continue
+                if i < args.warmup * 4:
+                    continue
+                key = (page, cache_state)
+                render.setdefault(key, []).append(_server_timing(response, 'tpl'))
+                total.setdefault(key, []).append(_server_timing(response, 'app'))
+                queries.setdefault(key, []).append(int(response.headers.get('X-SQL-Queries', 0)))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("=" * 60)
+    print(f"TEMPLATE: {max_id} ticket, {args.comments:g} commenti medi, {args.requests} richieste per pagina")
+    print("=" * 60)
+    print(f"   Caricamento di {count} template in un ambiente nuovo ({args.runs} volte)")
+    for label, timings in compile_times.items():
+        print_latencies(label, timings)
+    for cache_state in ('vuota', 'piena'):
+        print(f"   Rendering con cache dei frammenti {cache_state}")
+        for page in ('dashboard', 'dettaglio', 'home', 'statistiche'):
+            print_latencies(f'{page} (template)', render.get((page, cache_state), []))
+            print_latencies(f'{page} (richiesta)', total.get((page, cache_state), []),
+                            queries.get((page, cache_state)))
+    print(f"   errori                       {len(errors)}")
+    for error in sorted(set(errors))[:5]:
+        print(f"     - {error}")
+    return 1 if errors else 0
+
+
+# ==================== MAIN ====================
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark e test di carico FIXIT')
+    subparsers = parser.add_subparsers(dest='scenario', required=True)
+
+    concurrency = subparsers.add_parser('concurrency', help='scritture concorrenti da più processi/thread')
+    concurrency.add_argument('--workers', type=int, default=4, help='processi (come i worker gunicorn)')
+    concurrency.add_argument('--threads', type=int, default=4, help='thread per processo')
+    concurrency.add_argument('--requests', type=int, default=30, help='richieste per thread')
+    concurrency.add_argument('--seed-tickets', type=int, default=20, help='ticket iniziali da commentare')
+    concurrency.set_defaults(func=scenario_concurrency)
+
+    commits = subparsers.add_parser('commits', help='scritture/s e commit/s con e senza group commit')
+    commits.add_argument('--workers', type=int, default=2, help='processi (come i worker gunicorn gthread)')
+    commits.add_argument('--threads', type=int, default=16, help='thread per processo')
+    commits.add_argument('--requests', type=int, default=30, help='scritture per thread')
+    commits.add_argument('--seed-tickets', type=int, default=20, help='ticket iniziali da commentare')
+    commits.add_argument('--window', type=float, default=2.0, help='WRITE_BATCH_WINDOW_MS')
+    commits.add_argument('--max-batch', type=int, default=64, help='WRITE_BATCH_MAX_SIZE')
+    commits.add_argument('--synchronous', default='NORMAL', choices=['OFF', 'NORMAL', 'FULL'],
+                         help='SQLITE_SYNCHRONOUS (FULL: un fsync a ogni commit)')
+    commits.set_defaults(func=scenario_commits)
+
+    load = subparsers.add_parser('load', help='latenza e query per richiesta su dati sintetici')
+    load.add_argument('--tickets', type=int, default=20000, help='ticket sintetici nel database')
+    load.add_argument('--comments', type=float, default=3.0, help='commenti medi per ticket')
+    load.add_argument('--requests', type=int, default=200, help='richieste misurate per tipo')
+    load.add_argument('--warmup', type=int, default=10, help='richieste di riscaldamento per tipo')
+    load.add_argument('--pages', type=int, default=20, help='pagine della dashboard visitate')
+    load.add_argument('--seed', type=int, default=42, help='seed di dati e richieste')
+    load.add_argument('--database', help='file SQLite da riutilizzare tra esecuzioni (creato se assente)')
+    load.set_defaults(func=scenario_load)
+
+    export = subparsers.add_parser('export', help='esportazione in streaming di molti ticket')
+    export.add_argument('--tickets', type=int, default=100000, help='ticket sintetici nel database')
+    export.add_argument('--database', help='file SQLite da riutilizzare tra esecuzioni (creato se assente)')
+    export.set_defaults(func=scenario_export)
+
+    login_parser = subparsers.add_parser('login', help='login concorrenti con diversi metodi di hash')
+    login_parser.add_argument('--threads', type=int, default=16, help='utenti che accedono insieme')
+    login_parser.add_argument('--requests', type=int, default=5, help='login per utente')
+    login_parser.add_argument('--pool', type=int, default=2, help='thread del pool di hashing (PASSWORD_HASH_WORKERS)')
+    login_parser.add_argument('--methods', default='scrypt:32768:8:1,scrypt:16384:8:1,pbkdf2:sha256:600000',
+                              help='metodi di hash Werkzeug da confrontare, separati da virgola')
+    login_parser.set_defaults(func=scenario_login)
+
+    ratelimit = subparsers.add_parser('ratelimit', help='limite di login condiviso tra processi')
+    ratelimit.add_argument('--workers', type=int, default=4, help='processi (come i worker gunicorn)')
+    ratelimit.add_argument('--attempts', type=int, default=20, help='tentativi di login per processo')
+    ratelimit.add_argument('--limit', type=int, default=10, help='login consentiti per minuto e utente')
+    ratelimit.add_argument('--checks', type=int, default=5000, help='controlli misurati per il costo per richiesta')
+    ratelimit.set_defaults(func=scenario_ratelimit)
+
+    startup = subparsers.add_parser('startup', help='tempo di avvio di un worker e della prima richiesta')
+    startup.add_argument('--runs', type=int, default=10, help='processi avviati per modalità')
+    startup.add_argument('--seed-tickets', type=int, default=20000, help='ticket nel database')
+    startup.set_defaults(func=scenario_startup)
+
+    submit = subparsers.add_parser('submit', help='segnalazioni concorrenti con foto su gunicorn (sync/gthread/group commit)')
+    submit.add_argument('--clients', type=int, default=32, help='telefoni che inviano insieme')
+    submit.add_argument('--requests', type=int, default=10, help='ticket per telefono')
+    submit.add_argument('--workers', type=int, default=2, help='worker gunicorn')
+    submit.add_argument('--threads', type=int, default=8, help='thread per worker gthread')
+    submit.add_argument('--photo-kb', type=int, default=100, help='dimensione della foto allegata (0 = nessuna)')
+    submit.add_argument('--window', type=float, default=2.0, help='WRITE_BATCH_WINDOW_MS del group commit')
+    submit.set_defaults(func=scenario_submit)
+
+    backup = subparsers.add_parser('backup', help='backup online e ripristino con scritture in corso')
+    backup.add_argument('--writers', type=int, default=4, help='processi che creano ticket durante il backup')
+    backup.add_argument('--tickets', type=int, default=50000, help='ticket sintetici nel database')
+    backup.add_argument('--photos', type=int, default=200, help='foto nella cartella uploads')
+    backup.add_argument('--new-photos', type=int, default=10, help='foto aggiunte prima del secondo snapshot')
+    backup.add_argument('--photo-size', type=int, default=200 * 1024, help='dimensione di ogni foto (byte)')
+    backup.add_argument('--method', choices=['backup', 'vacuum'], default='backup', help='BACKUP_METHOD')
+    backup.add_argument('--step-pages', type=int, default=1024, help='BACKUP_STEP_PAGES')
+    backup.add_argument('--warmup', type=float, default=2.0, help='secondi di sole scritture prima del backup')
+    backup.set_defaults(func=scenario_backup)
+
+    templates = subparsers.add_parser('templates', help='tempo di rendering per pagina e compilazione dei template')
+    templates.add_argument('--tickets', type=int, default=5000, help='ticket sintetici nel database')
+    templates.add_argument('--comments', type=float, default=8.0, help='commenti medi per ticket')
+    templates.add_argument('--requests', type=int, default=100, help='richieste misurate per pagina')
+    templates.add_argument('--warmup', type=int, default=5, help='richieste di riscaldamento per pagina')
+    templates.add_argument('--pages', type=int, default=20, help='pagine della dashboard visitate')
+    templates.add_argument('--runs', type=int, default=20, help='caricamenti completi dei template misurati')
+    templates.add_argument('--seed', type=int, default=42, help='seed di dati e richieste')
+    templates.set_defaults(func=scenario_templates)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
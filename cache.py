@@ -0,0 +1,158 @@
+"""
+Small server-side cache with two interchangeable backends.
+
+    memory://                  in-process LRU (per gunicorn worker)
+    sqlite:///path/cache.db    shared by all workers on the same host
+
+Entries are never invalidated one by one: callers put a version number
+(see `app_counters` in app.py) into the key, so a write simply makes the
+old keys unreachable and they age out through LRU eviction / TTL.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, maxsize=2048, default_ttl=300):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_many(self, keys):
+        """Return a dict with the cached values of `keys` (missing keys are omitted)"""
+        found = {}
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def set_many(self, mapping, ttl=None):
+        for key, value in mapping.items():
+            self.set(key, value, ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache:
+    """Cache stored in a local SQLite file, shared across processes.
+
+    Values are pickled; each thread keeps its own connection. Expired rows
+    are purged opportunistically on writes.
+    """
+
+    def __init__(self, path, default_ttl=300, max_entries=50000):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')  # a lost cache entry is only a miss
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND expires >= ?', (key, time.time())
+        ).fetchone()
+        return pickle.loads(row[0]) if row else default
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        now = time.time()
+        conn = self._connection()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for key, value in conn.execute(
+                f'SELECT key, value FROM cache WHERE key IN ({placeholders}) AND expires >= ?', (*chunk, now)
+            ):
+                found[key] = pickle.loads(value)
+        return found
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, mapping, ttl=None):
+        if not mapping:
+            return
+        expires = time.time() + (ttl if ttl is not None else self.default_ttl)
+        rows = [(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires) for key, value in mapping.items()]
+        conn = self._connection()
+        try:
+            conn.executemany('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)', rows)
+            self._writes += 1
+            if self._writes % 200 == 0:
+                self._purge(conn)
+        except sqlite3.OperationalError:
+            pass  # cache busy: skip the write, the next request recomputes
+
+    def _purge(self, conn):
+        conn.execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+        conn.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires LIMIT '
+            'max(0, (SELECT count(*) FROM cache) - ?))', (self.max_entries,)
+        )
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+
+def make_cache(url, default_ttl=300):
+    """Build a cache from a URL ('memory://' or 'sqlite:///path')"""
+    if not url or url.startswith('memory://'):
+        return LRUCache(default_ttl=default_ttl)
+    if url.startswith('sqlite:///'):
+        return SQLiteCache(url[len('sqlite:///'):], default_ttl=default_ttl)
+    raise ValueError(f'Backend cache non supportato: {url}')
@@ -0,0 +1,105 @@
+"""
+Group commit: many concurrent writes, one SQLite transaction.
+
+With threaded workers (gunicorn `--worker-class gthread`) a burst of
+ticket submissions reaches a process as several requests at once. Instead
+of each taking the write lock and committing on its own, a request hands
+its write to `GroupCommitter.submit()` as a callable. The first request to
+arrive becomes the leader: it waits up to `window` seconds (or until
+`max_batch` writes are pending), then runs every pending write in one
+transaction and commits once. The others wait; each gets its own result
+back only after that commit, so a response is never sent for a write that
+is not stored yet.
+
+If one write fails the batch is rolled back and its writes are stored one
+by one, so only the failing request gets the exception. No thread is
+started: the leader is always a request thread, which also makes this
+safe with gunicorn forking workers.
+"""
+
+import threading
+import time
+
+
+class _Write:
+    __slots__ = ('function', 'result', 'error', 'done', 'wakeup')
+
+    def __init__(self, function):
+        self.function = function
+        self.result = None
+        self.error = None
+        self.done = False
+        self.wakeup = threading.Event()  # set when done, or when promoted to leader
+
+
+class GroupCommitter:
+    """Batches the writes submitted by concurrent threads into shared transactions.
+
+    `run_batch(writes)` is called by the leader thread with the pending
+    writes; it must run each `write.function` and set `write.result` or
+    `write.error`, commit, and raise if the commit itself fails.
+    """
+
+    def __init__(self, run_batch, window=0.002, max_batch=64):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_batch = max_batch
+        self._condition = threading.Condition()
+        self._pending = []
+        self._leader = False  # a batch is being collected or committed
+        # Counters for the benchmark: writes and transactions so far
+        self.writes = 0
+        self.batches = 0
+
+    def submit(self, function):
+        """Run `function` in the next batch; return its result once the batch has committed"""
+        write = _Write(function)
+        with self._condition:
+            self._pending.append(write)
+            leading = not self._leader
+            if leading:
+                self._leader = True
+            elif len(self._pending) >= self.max_batch:
+                self._condition.notify()  # the collecting leader need not wait for the window
+        if not leading:
+            write.wakeup.wait()
+        while not write.done:
+            with self._condition:
+                batch = self._collect()
+            self._run(batch)
+            with self._condition:
+                if write.done:
+                    if self._pending:
+                        self._pending[0].wakeup.set()  # hand over: the next batch is already waiting
+                    else:
+                        self._leader = False
+                # else the batch was full before our turn: lead the next one too
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def _collect(self):
+        """Wait (condition held) for the window to close or the batch to fill; take the batch"""
+        deadline = time.monotonic() + self.window
+        while len(self._pending) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._condition.wait(remaining)
+        batch = self._pending[:self.max_batch]
+        del self._pending[:self.max_batch]
+        return batch
+
+    def _run(self, batch):
+        try:
+            self.run_batch(batch)
+        except BaseException as e:
+            # The commit failed: none of the writes is stored
+            for write in batch:
+                write.result, write.error = None, e
+        with self._condition:
+            self.writes += len(batch)
+            self.batches += 1
+        for write in batch:
+            write.done = True
+            write.wakeup.set()
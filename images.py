@@ -0,0 +1,192 @@
+"""
+Image processing for uploaded ticket photos.
+
+After upload the original is re-encoded without EXIF metadata (GPS
+position, camera serial...) and downscaled to IMAGE_MAX_SIZE, and two
+JPEG derivatives are generated:
+
+    <upload folder>/_derived/detail/<name>.jpg   ticket detail page
+    <upload folder>/_derived/thumb/<name>.jpg    dashboard table
+
+Processing runs in a background thread pool so it never delays the upload
+response; until it has finished, pages fall back to the original file.
+Pillow is optional: without it uploads are stored as they are.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Pillow is imported on first use (in the background pool), not when the app starts
+Image = None
+ImageOps = None
+_pillow_missing = False
+
+logger = logging.getLogger(__name__)
+
+DERIVED_DIR = '_derived'
+VARIANTS = {
+    'detail': 1024,
+    'thumb': 160,
+}
+JPEG_QUALITY = 82
+
+
+def is_available():
+    """True if Pillow is installed"""
+    global Image, ImageOps, _pillow_missing
+    if Image is None and not _pillow_missing:
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:  # Pillow not installed: images are served unprocessed
+            _pillow_missing = True
+    return Image is not None
+
+
+def derived_relpath(filename, variant):
+    """Path of a derivative relative to the upload folder"""
+    stem = os.path.splitext(filename)[0]
+    return f'{DERIVED_DIR}/{variant}/{stem}.jpg'
+
+
+def _atomic_save(image, path, **save_kwargs):
+    """Save `image` to a temp file next to `path`, then rename it into place"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            image.save(tmp, **save_kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _to_rgb(image):
+    """Flatten transparency on white so the image can be stored as JPEG"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
+
+def process_image(upload_folder, filename, max_size=2048):
+    """Strip metadata, downscale/recompress the original and write the derivatives"""
+    if not is_available():
+        return False
+    path = os.path.join(upload_folder, filename)
+    with Image.open(path) as source:
+        image_format = source.format
+        # Let the JPEG decoder downscale while decoding (much faster for phone photos)
+        source.draft('RGB', (max_size, max_size))
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+    # The original is re-encoded in its own format; no exif/pnginfo is passed, so metadata is dropped
+    if image_format == 'PNG':
+        _atomic_save(image, path, format='PNG', optimize=True)
+    else:
+        _atomic_save(_to_rgb(image), path, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+    rgb = _to_rgb(image)
+    for variant, size in VARIANTS.items():
+        derivative = rgb.copy()
+        derivative.thumbnail((size, size), Image.LANCZOS)
+        _atomic_save(derivative, os.path.join(upload_folder, derived_relpath(filename, variant)),
+                     format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return True
+
+
+def remove_image(upload_folder, filename):
+    """Delete an uploaded image and all its derivatives"""
+    paths = [os.path.join(upload_folder, filename)]
+    paths += [os.path.join(upload_folder, derived_relpath(filename, variant)) for variant in VARIANTS]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def move_image(source_folder, target_folder, filename):
+    """Move an uploaded image and its derivatives to another folder (e.g. archive cold storage)"""
+    relpaths = [filename] + [derived_relpath(filename, variant) for variant in VARIANTS]
+    for relpath in relpaths:
+        source = os.path.join(source_folder, relpath)
+        if os.path.exists(source):
+            target = os.path.join(target_folder, relpath)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(source, target)  # copy + delete when the folders are on different disks
+
+
+def move_folder(source_folder, target_folder, skip=()):
+    """Move every file of an upload folder into another, keeping relative paths.
+
+    Files already present in the target are left in the source. Top-level
+    entries named in `skip` are ignored. Returns the number of files moved.
+    """
+    moved = 0
+    for dirpath, dirnames, filenames in os.walk(source_folder):
+        if dirpath == source_folder:
+            dirnames[:] = [name for name in dirnames if name not in skip]
+            filenames = [name for name in filenames if name not in skip]
+        for name in filenames:
+            relpath = os.path.relpath(os.path.join(dirpath, name), source_folder)
+            target = os.path.join(target_folder, relpath)
+            if os.path.exists(target):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(os.path.join(dirpath, name), target)
+            moved += 1
+    return moved
+
+
+class ImageProcessor:
+    """Background thread pool running `process_image` on new uploads.
+
+    The pool is created lazily in each process, so it is safe with gunicorn
+    forking workers. Failures are logged; the original stays usable.
+    """
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='image-processor')
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, upload_folder, filename, max_size=2048, on_done=None):
+        """Queue `filename` for processing; `on_done(filename)` runs after success"""
+        if not is_available():
+            return None
+        return self._get_executor().submit(self._run, upload_folder, filename, max_size, on_done)
+
+    def run_task(self, task, *args):
+        """Run a maintenance task (e.g. a file sweep) on the same background pool"""
+        return self._get_executor().submit(self._run_task, task, *args)
+
+    @staticmethod
+    def _run_task(task, *args):
+        try:
+            task(*args)
+        except Exception:
+            logger.exception('Operazione in background fallita: %s', getattr(task, '__name__', task))
+
+    @staticmethod
+    def _run(upload_folder, filename, max_size, on_done):
+        try:
+            process_image(upload_folder, filename, max_size)
+            if on_done is not None:
+                on_done(filename)
+        except Exception:
+            logger.exception('Elaborazione immagine fallita: %s', filename)
@@ -0,0 +1,186 @@
+"""
+Change log behind the live dashboard updates (SQLite).
+
+Every insert, update or delete of a ticket appends a compact row to
+`ticket_events` through SQLite triggers (like the search index, so every
+write path is covered). Its AUTOINCREMENT `seq` is a monotonic sequence
+shared by all gunicorn workers: a browser only has to remember the last
+`seq` it has seen and ask for what came after it, whichever worker answers.
+
+Browsers either poll (one indexed query per request, works with sync
+workers) or keep a Server-Sent Events stream open when the app runs on
+threaded workers. In each process a single `EventBroadcaster` thread reads
+the last `seq` and wakes up the waiting streams, so the database is polled
+once per interval whatever the number of connected clients.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+
+logger = logging.getLogger(__name__)
+
+EVENTS_TABLE = 'ticket_events'
+# Rows kept in the log; older events are pruned every 1000 inserts
+RETENTION = 10000
+
+_CREATE_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {EVENTS_TABLE} (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT
+)
+"""
+
+_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tickets_events_ai AFTER INSERT ON tickets BEGIN
+        INSERT INTO {EVENTS_TABLE} (ticket_id, kind, status) VALUES (new.id, 'created', new.status);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tickets_events_au AFTER UPDATE ON tickets BEGIN
+        INSERT INTO {EVENTS_TABLE} (ticket_id, kind, status) VALUES (new.id, 'updated', new.status);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tickets_events_ad AFTER DELETE ON tickets BEGIN
+        INSERT INTO {EVENTS_TABLE} (ticket_id, kind, status) VALUES (old.id, 'deleted', NULL);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ticket_events_prune AFTER INSERT ON {EVENTS_TABLE}
+    WHEN new.seq % 1000 = 0 BEGIN
+        DELETE FROM {EVENTS_TABLE} WHERE seq <= new.seq - {RETENTION};
+    END
+    """,
+]
+
+# Part of the app's schema fingerprint: a change here makes the next boot run migrate_db
+SCHEMA_DDL = [_CREATE_TABLE] + _TRIGGERS
+
+_TRIGGER_NAMES = [re.search(r'CREATE TRIGGER IF NOT EXISTS (\w+)', ddl).group(1) for ddl in _TRIGGERS]
+
+
+def ensure_change_log(engine):
+    """Create the change log table and its triggers if missing.
+
+    Returns False on non-SQLite databases, where live updates are disabled.
+    """
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.begin() as conn:
+        conn.execute(sa.text(_CREATE_TABLE))
+        for ddl in _TRIGGERS:
+            conn.execute(sa.text(ddl))
+    return True
+
+
+@contextmanager
+def suspended_change_log(engine):
+    """Drop the change log triggers during a bulk load (open dashboards are not patched)"""
+    if not ensure_change_log(engine):
+        yield
+        return
+    with engine.begin() as conn:
+        for name in _TRIGGER_NAMES:
+            conn.execute(sa.text(f'DROP TRIGGER IF EXISTS {name}'))
+    try:
+        yield
+    finally:
+        ensure_change_log(engine)
+
+
+def last_seq(conn):
+    """Sequence number of the most recent event (0 if the log is empty)"""
+    return conn.execute(sa.text(f'SELECT coalesce(max(seq), 0) FROM {EVENTS_TABLE}')).scalar()
+
+
+def events_after(conn, after, limit=500):
+    """(events, truncated) after `after`: [{'seq', 'ticket_id', 'kind', 'status'}, ...] oldest first.
+
+    `truncated` is True when the client missed events (pruned, more than
+    `limit`, or a sequence from a recreated database): it should reload
+    the page. When nothing happened this costs a single max(seq) lookup.
+    """
+    latest = last_seq(conn)
+    if latest <= after:
+        return [], latest < after
+    rows = conn.execute(
+        sa.text(f"""
+            SELECT seq, ticket_id, kind, status FROM {EVENTS_TABLE}
+            WHERE seq > :after ORDER BY seq LIMIT :limit
+        """),
+        {'after': after, 'limit': limit + 1}
+    ).all()
+    # Sequence numbers have no gaps except where old events were pruned
+    truncated = len(rows) > limit or bool(after and rows and rows[0].seq > after + 1)
+    events = [{'seq': row.seq, 'ticket_id': row.ticket_id, 'kind': row.kind, 'status': row.status}
+              for row in rows[:limit]]
+    return events, truncated
+
+
+class EventBroadcaster:
+    """Per-process fan-out: one thread polls `last_seq`, streams wait on a condition.
+
+    Like the image processor the thread is started lazily in each process,
+    so it is safe with gunicorn forking workers; it exits after `idle_timeout`
+    seconds without waiting streams.
+    """
+
+    def __init__(self, interval=1.0, idle_timeout=60.0):
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self._condition = threading.Condition()
+        self._latest = None
+        self._thread = None
+        self._pid = None
+        self._engine = None
+        self._waiters = 0
+        self._last_wait = 0.0
+
+    def _ensure_thread(self, engine):
+        with self._condition:
+            self._last_wait = time.monotonic()
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._engine = engine
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='live-events', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._waiters and time.monotonic() - self._last_wait > self.idle_timeout:
+                    self._thread = None
+                    self._latest = None
+                    return
+            try:
+                with self._engine.connect() as conn:
+                    latest = last_seq(conn)
+            except Exception:
+                logger.exception('Lettura del registro eventi fallita')
+            else:
+                with self._condition:
+                    if latest != self._latest:
+                        self._latest = latest
+                        self._condition.notify_all()
+            time.sleep(self.interval)
+
+    def wait(self, engine, after, timeout):
+        """Block until an event newer than `after` exists or `timeout` expires; return the last seq seen"""
+        self._ensure_thread(engine)
+        with self._condition:
+            self._waiters += 1
+            try:
+                self._condition.wait_for(lambda: self._latest is not None and self._latest != after, timeout)
+            finally:
+                self._waiters -= 1
+                self._last_wait = time.monotonic()
+            return self._latest
@@ -0,0 +1,152 @@
+"""
+In-process performance metrics exported in Prometheus text format.
+
+Each process (gunicorn worker) keeps its own counters and histograms in a
+`MetricsRegistry` and periodically writes a snapshot to
+`<METRICS_DIR>/metrics-<pid>.json`. The export merges the snapshots of all
+workers, so whichever worker answers the scrape reports the totals.
+
+Snapshots of exited workers are kept (their counters still count, as in
+the Prometheus client's multiprocess mode); clear the directory when the
+service is restarted.
+"""
+
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Latency buckets in seconds
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Statements per request
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55)
+# Upload sizes in bytes
+SIZE_BUCKETS = (64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 8 * 1024 * 1024, 16 * 1024 * 1024)
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms of one process (no-op when disabled)"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._meta = {}  # name -> (kind, help, buckets)
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self._last_flush = 0.0
+
+    def counter(self, name, help_text):
+        self._meta[name] = ('counter', help_text, None)
+
+    def histogram(self, name, help_text, buckets=TIME_BUCKETS):
+        self._meta[name] = ('histogram', help_text, tuple(buckets))
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        buckets = self._meta[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            series[bisect.bisect_left(buckets, value)] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        """JSON-serializable copy of the current values"""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(series)] for (name, labels), series in self._histograms.items()],
+            }
+
+    def flush(self, directory, min_interval=0.0):
+        """Write this process' snapshot to `directory` (at most every `min_interval` seconds)"""
+        now = time.monotonic()
+        if not directory or now - self._last_flush < min_interval:
+            return
+        self._last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump(self.snapshot(), tmp)
+        os.replace(tmp_path, os.path.join(directory, f'metrics-{os.getpid()}.json'))
+
+    def collect(self, directory):
+        """Merge the snapshots of all processes (this one read live)"""
+        snapshots = [self.snapshot()]
+        own = f'metrics-{os.getpid()}.json'
+        paths = glob.glob(os.path.join(directory, 'metrics-*.json')) if directory else []
+        for path in paths:
+            if os.path.basename(path) == own:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # being replaced or truncated: skip this round
+
+        counters, histograms = {}, {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, series in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merged = histograms.get(key)
+                if merged is None or len(merged) != len(series):
+                    histograms[key] = list(series)
+                else:
+                    histograms[key] = [a + b for a, b in zip(merged, series)]
+        return counters, histograms
+
+    def render(self, directory=None):
+        """Prometheus text exposition (format 0.0.4) of the merged metrics"""
+        counters, histograms = self.collect(directory)
+        lines = []
+        for name, (kind, help_text, buckets) in sorted(self._meta.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (series_name, labels), value in sorted(counters.items()):
+                    if series_name == name:
+                        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            for (series_name, labels), series in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), series[:-1]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _format_value(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(series[-1])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
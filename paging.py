@@ -0,0 +1,84 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Pages are addressed by an opaque token encoding the sort key of the last
+(or first) row seen, so fetching page N costs the same as page 1: no
+OFFSET and no COUNT(*). Ordering is always newest first on
+(created_at, id); `id` breaks ties between tickets created in the same
+microsecond.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+import sqlalchemy as sa
+
+
+class KeysetPage:
+    """One page of results with the tokens to reach its neighbours"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(created_at, row_id):
+    """Encode a (created_at, id) sort key as a URL-safe token"""
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a token from `encode_cursor`; returns None if it is missing or malformed"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_paginate(query, created_at_column, id_column, per_page, after=None, before=None):
+    """Return a KeysetPage of `query` ordered by (created_at, id) descending.
+
+    `after` is the token of the last row of the previous page (go to older
+    tickets), `before` the token of the first row of the next page (go back
+    to newer tickets). Rows must expose `created_at` and `id` attributes.
+    """
+    sort_key = sa.tuple_(created_at_column, id_column)
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before) if after_key is None else None
+
+    if before_key is not None:
+        rows = (
+            query.filter(sort_key > sa.tuple_(*before_key))
+            .order_by(created_at_column.asc(), id_column.asc())
+            .limit(per_page + 1)
+            .all()
+        )
+        has_more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        prev_cursor = encode_cursor(items[0].created_at, items[0].id) if has_more and items else None
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if items else None
+        return KeysetPage(items, next_cursor, prev_cursor)
+
+    if after_key is not None:
+        query = query.filter(sort_key < sa.tuple_(*after_key))
+    rows = query.order_by(created_at_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if has_more and items else None
+    prev_cursor = encode_cursor(items[0].created_at, items[0].id) if after_key is not None and items else None
+    return KeysetPage(items, next_cursor, prev_cursor)
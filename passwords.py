@@ -0,0 +1,107 @@
+"""
+Password hashing with configurable cost, run on a small thread pool.
+
+Werkzeug's default (scrypt, N=32768) costs tens of milliseconds of CPU and
+32 MB of memory per hash. The method is configurable (any Werkzeug method
+string, e.g. `scrypt:16384:8:1` or `pbkdf2:sha256:600000`); hashes made
+with another method keep working and are upgraded on the next successful
+login (`needs_rehash`).
+
+Hashing runs on a bounded pool: hashlib releases the GIL, so with threaded
+workers the other requests keep being served, and at most `max_workers`
+hashes (and their scrypt memory) are in flight per process however many
+people log in at shift change. Logins beyond the queue limit fail fast with
+`HasherBusy` instead of piling up.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class HasherBusy(Exception):
+    """Too many password checks queued, or one did not finish in time"""
+
+
+def hash_method(password_hash):
+    """Method part of a Werkzeug hash ('scrypt:32768:8:1$salt$hash' -> 'scrypt:32768:8:1')"""
+    return password_hash.split('$', 1)[0]
+
+
+class PasswordHasher:
+    """Thread pool hashing and verifying passwords with the configured method.
+
+    Like the image processor the pool is created lazily in each process, so
+    it is safe with gunicorn forking workers.
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, max_workers=2, max_queue=32, timeout=10.0):
+        self.method = method
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Hash of a random password, verified when the user does not exist so unknown
+        # usernames cost the same; its prefix is the canonical form of `method`
+        self._dummy_hash = (None, None)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password-hasher')
+                self._pid = os.getpid()
+                self._pending = 0
+            return self._executor
+
+    def _run(self, function, *args):
+        executor = self._get_executor()
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise HasherBusy('Coda di verifica password piena')
+            self._pending += 1
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            self._job_done()
+            raise
+        # Counted until the job ends, not until the caller stops waiting: a timed out
+        # hash still holds its pool thread (and memory)
+        future.add_done_callback(self._job_done)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HasherBusy('Verifica password scaduta')
+
+    def _job_done(self, future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def hash(self, password):
+        """Hash `password` with the configured method"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def _get_dummy_hash(self):
+        dummy_hash, method = self._dummy_hash
+        if dummy_hash is None or method != self.method:
+            dummy_hash = self.hash(os.urandom(16).hex())
+            self._dummy_hash = (dummy_hash, self.method)
+        return dummy_hash
+
+    def verify(self, password_hash, password):
+        """True if `password` matches; pass password_hash=None for an unknown user"""
+        if password_hash is None:
+            self._run(check_password_hash, self._get_dummy_hash(), password)
+            return False
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with a method or cost other than the configured one"""
+        # Compared with a hash made now, as Werkzeug expands e.g. 'scrypt' to 'scrypt:32768:8:1'
+        return hash_method(password_hash) != hash_method(self._get_dummy_hash())
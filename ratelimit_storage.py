@@ -0,0 +1,141 @@
+"""
+Rate limit storage in a local SQLite file, shared by all workers on a host.
+
+Registers the `sqlite:///path/ratelimit.db` scheme with the `limits`
+library used by Flask-Limiter, so counters hold across gunicorn workers
+without Redis:
+
+    RATELIMIT_STORAGE_URI=sqlite:////opt/fixit/FIXIT/instance/ratelimit.db
+
+Counters are rows (key, count, expires_at). Increments are single UPSERT
+statements, atomic across processes; the sliding window counter strategy
+reads both windows and increments in one BEGIN IMMEDIATE transaction, so
+concurrent hits in different workers cannot both take the last slot. Like
+the shared cache the file uses WAL with synchronous=OFF: losing the last
+counters in a power cut only resets a few limits. A check costs a fraction
+of a millisecond (see `python benchmark.py ratelimit`).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from math import floor
+
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport, TimestampedSlidingWindow
+
+_INCR_SQL = """
+    INSERT INTO rate_limits (key, count, expires_at) VALUES (:key, :amount, :now + :expiry)
+    ON CONFLICT (key) DO UPDATE SET
+        count = CASE WHEN expires_at <= :now THEN :amount ELSE count + :amount END,
+        expires_at = CASE WHEN expires_at <= :now THEN :now + :expiry ELSE expires_at END
+    RETURNING count
+"""
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """`limits` storage backed by SQLite (fixed window and sliding window counter strategies)"""
+
+    STORAGE_SCHEME = ['sqlite']
+    PURGE_EVERY = 1000  # increments between deletions of expired counters
+
+    def __init__(self, uri, wrap_exceptions=False, timeout=5.0, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri[len('sqlite:///'):]
+        self.timeout = float(timeout)
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+            # Created on the first check rather than at import, which also runs in a --preload master
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_limits ('
+                'key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _incr(self, conn, key, expiry, amount, now):
+        count = conn.execute(_INCR_SQL, {'key': key, 'amount': amount, 'now': now, 'expiry': expiry}).fetchone()[0]
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM rate_limits WHERE expires_at <= ?', (now,))
+        return count
+
+    def _get(self, conn, key, now):
+        row = conn.execute('SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?', (key, now)).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, key, expiry, amount=1):
+        return self._incr(self._connection(), key, expiry, amount, time.time())
+
+    def get(self, key):
+        return self._get(self._connection(), key, time.time())
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._connection().execute(
+            'SELECT expires_at FROM rate_limits WHERE key = ? AND expires_at > ?', (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    def check(self):
+        try:
+            self._connection().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._connection().execute('DELETE FROM rate_limits').rowcount
+
+    def clear(self, key):
+        self._connection().execute('DELETE FROM rate_limits WHERE key = ?', (key,))
+
+    # Sliding window counter: the previous window's count is weighted by the share
+    # of it still inside the sliding window (same arithmetic as limits' MemoryStorage)
+
+    def _sliding_window(self, conn, key, expiry, now):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count = self._get(conn, previous_key, now)
+        current_count = self._get(conn, current_key, now)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            previous_count, previous_ttl, current_count, _ = self._sliding_window(conn, key, expiry, now)
+            acquired = floor(previous_count * previous_ttl / expiry + current_count) + amount <= limit
+            if acquired:
+                # The current window's counter lives on as the next one's previous window
+                self._incr(conn, self.sliding_window_keys(key, expiry, now)[1], 2 * expiry, amount, now)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return acquired
+
+    def get_sliding_window(self, key, expiry):
+        return self._sliding_window(self._connection(), key, expiry, time.time())
+
+    def clear_sliding_window(self, key, expiry):
+        for window_key in self.sliding_window_keys(key, expiry, time.time()):
+            self.clear(window_key)
@@ -0,0 +1,199 @@
+"""
+Full-text search index for tickets (SQLite FTS5).
+
+The `tickets_fts` virtual table mirrors the searchable ticket fields plus
+the text of all comments of the ticket (rowid = ticket id). It is kept in
+sync by SQLite triggers, so every write path (ORM, bulk inserts, manual SQL)
+updates the index in the same transaction.
+
+The attached archive database has its own index of its tickets and
+comments (`schema='archive'`): SQLite triggers only see the tables of their
+own database.
+"""
+
+import re
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+
+FTS_TABLE = 'tickets_fts'
+
+_CREATE_TABLE = f"""
+CREATE VIRTUAL TABLE {{prefix}}{FTS_TABLE} USING fts5(
+    title, description, requester_name, vehicle_number, comments,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+_COMMENTS_OF = "(SELECT group_concat(body, ' ') FROM {comments} WHERE ticket_id = {ref})"
+
+_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {{prefix}}tickets_fts_ai AFTER INSERT ON tickets BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, title, description, requester_name, vehicle_number, comments)
+        VALUES (new.id, new.title, new.description, new.requester_name, new.vehicle_number, '');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {{prefix}}tickets_fts_au
+    AFTER UPDATE OF title, description, requester_name, vehicle_number ON tickets BEGIN
+        UPDATE {FTS_TABLE}
+        SET title = new.title, description = new.description,
+            requester_name = new.requester_name, vehicle_number = new.vehicle_number
+        WHERE rowid = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {{prefix}}tickets_fts_ad AFTER DELETE ON tickets BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {{prefix}}comments_fts_ai AFTER INSERT ON comments BEGIN
+        UPDATE {FTS_TABLE} SET comments = {_COMMENTS_OF.format(comments='comments', ref='new.ticket_id')}
+        WHERE rowid = new.ticket_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {{prefix}}comments_fts_au AFTER UPDATE OF body ON comments BEGIN
+        UPDATE {FTS_TABLE} SET comments = {_COMMENTS_OF.format(comments='comments', ref='new.ticket_id')}
+        WHERE rowid = new.ticket_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {{prefix}}comments_fts_ad AFTER DELETE ON comments BEGIN
+        UPDATE {FTS_TABLE} SET comments = {_COMMENTS_OF.format(comments='comments', ref='old.ticket_id')}
+        WHERE rowid = old.ticket_id;
+    END
+    """,
+]
+
+# Part of the app's schema fingerprint: a change here makes the next boot run migrate_db
+SCHEMA_DDL = [_CREATE_TABLE] + _TRIGGERS
+
+_TRIGGER_NAMES = [re.search(r'CREATE TRIGGER IF NOT EXISTS \{prefix\}(\w+)', ddl).group(1) for ddl in _TRIGGERS]
+
+_BACKFILL = f"""
+INSERT INTO {{prefix}}{FTS_TABLE} (rowid, title, description, requester_name, vehicle_number, comments)
+SELECT t.id, t.title, t.description, t.requester_name, t.vehicle_number,
+       coalesce({_COMMENTS_OF.format(comments='{prefix}comments', ref='t.id')}, '')
+FROM {{prefix}}tickets t
+"""
+
+# Lightweight table construct (not part of the models' metadata, so
+# db.create_all() never tries to create it as a regular table)
+tickets_fts = sa.table(FTS_TABLE, sa.column('rowid'), sa.column('rank'))
+
+
+def _prefix(schema):
+    return '' if schema == 'main' else f'{schema}.'
+
+
+def _ddl(sql, schema):
+    return sa.text(sql.format(prefix=_prefix(schema)))
+
+
+def search_index_exists(engine, schema='main'):
+    """Return True if the FTS table is present in the database (or the attached `schema`)"""
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.connect() as conn:
+        found = conn.execute(
+            sa.text(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE}
+        ).first()
+    return found is not None
+
+
+def ensure_search_index(engine, schema='main'):
+    """Create the FTS table and its triggers if missing, backfilling existing tickets.
+
+    Returns False when full-text search is not available (non-SQLite
+    database or SQLite built without FTS5); callers then fall back to LIKE.
+    """
+    if engine.dialect.name != 'sqlite':
+        return False
+    created = False
+    try:
+        with engine.begin() as conn:
+            if not conn.execute(
+                sa.text(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE}
+            ).first():
+                conn.execute(_ddl(_CREATE_TABLE, schema))
+                created = True
+            for ddl in _TRIGGERS:
+                conn.execute(_ddl(ddl, schema))
+            if created:
+                conn.execute(_ddl(_BACKFILL, schema))
+    except sa.exc.OperationalError:
+        # "no such module: fts5"
+        return False
+    return True
+
+
+def rebuild_search_index(engine, schema='main'):
+    """Repopulate the FTS table from scratch and optimize it"""
+    table = _prefix(schema) + FTS_TABLE
+    with engine.begin() as conn:
+        conn.execute(sa.text(f'DELETE FROM {table}'))
+        conn.execute(_ddl(_BACKFILL, schema))
+        conn.execute(sa.text(f"INSERT INTO {table} ({FTS_TABLE}) VALUES ('optimize')"))
+
+
+@contextmanager
+def suspended_search_index(engine):
+    """Drop the sync triggers during a bulk load, then recreate them and rebuild the index once.
+
+    Row-by-row trigger maintenance (especially the comments column) dominates
+    the cost of inserting hundreds of thousands of rows.
+    """
+    if not search_index_exists(engine):
+        yield
+        return
+    with engine.begin() as conn:
+        for name in _TRIGGER_NAMES:
+            conn.execute(sa.text(f'DROP TRIGGER IF EXISTS {name}'))
+    try:
+        yield
+    finally:
+        ensure_search_index(engine)
+        rebuild_search_index(engine)
+
+
+def build_match_query(text):
+    """Turn free text typed in the dashboard into an FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term and all terms must match, e.g.
+    `olio MF-1` -> `"olio"* "MF"* "1"*`. Returns None if there is nothing
+    searchable in the text.
+    """
+    terms = re.findall(r'\w+', text or '', re.UNICODE)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _match(match_query):
+    return sa.literal_column(FTS_TABLE).op('MATCH')(match_query)
+
+
+def matching_ticket_ids(match_query, schema='main'):
+    """SELECT of the ids of the tickets matching `match_query` (in the index of `schema`)"""
+    table = tickets_fts if schema == 'main' else sa.table(FTS_TABLE, sa.column('rowid'), schema=schema)
+    return sa.select(table.c.rowid).where(_match(match_query))
+
+
+def ranked_matches(match_query):
+    """Subquery (ticket_id, rank) of the tickets matching `match_query` (lower rank is better).
+
+    Join it to tickets to order by relevance: the MATCH runs once. A
+    correlated `rank` lookup per ticket re-expands the prefix terms for
+    every row and is quadratic on common words.
+    """
+    return (
+        sa.select(tickets_fts.c.rowid.label('ticket_id'), tickets_fts.c.rank.label('rank'))
+        .where(_match(match_query))
+        .subquery('fts_matches')
+    )
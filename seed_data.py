@@ -1,12 +1,69 @@
 """
 Script per popolare il database con dati di esempio
 Esegui: python seed_data.py
+
+Dati sintetici in blocco (test di carico, riproducibili dal seed):
+    python seed_data.py --tickets 500000 --comments 4 --mezzo-ratio 0.6 --days 730 --seed 42
 """
 
-from app import app, db, User, Ticket, Comment
+import argparse
+
+from app import app, db, migrate_db, rollup_sources, User, Ticket, Comment
 from datetime import datetime, timedelta
 import random
 
+import analytics
+import live
+import search
+
+# Nomi di esempio
+REQUESTER_NAMES = [
+    "Marco Ferrari", "Anna Russo", "Paolo Colombo",
+    "Silvia Romano", "Davide Marino", "Francesca Ricci",
+    "Alessandro Gallo", "Laura Conti", "Roberto Esposito"
+]
+
+# Dati per ticket MEZZO
+VEHICLE_TYPES = ["Mafi", "Ralla", "Forklift", "Carrello Elevatore", "Trattore"]
+ANOMALY_CATEGORIES = [
+    "Livello Olio/Liquidi", "Perdite Liquidi", "Pneumatici",
+    "Carrozzeria", "Spie/Allarmi", "Dispositivi Segnalazione",
+    "Freni/Sterzo/Cambio", "Braccio/Spreader", "Rumori Insoliti",
+    "Incidenti/Danni", "Altri Problemi"
+]
+
+# Dati per ticket TECNICO
+DEPARTMENTS = ["IT", "Manutenzione", "Amministrazione", "Logistica", "Produzione"]
+PRIORITIES = ["BASSA", "MEDIA", "ALTA"]
+STATUSES = ["NUOVO", "IN_LAVORAZIONE", "RISOLTO"]
+
+# Titoli e frasi per i dati sintetici
+TECH_TITLES = [
+    "Stampante non funziona", "PC non si avvia", "Rete WiFi instabile", "Badge non riconosciuto",
+    "Monitor sfarfalla", "Telefono fisso muto", "Condizionatore guasto", "Porta automatica bloccata",
+    "Software gestionale lento", "Scanner non acquisisce", "Luci ufficio spente", "Perdita acqua bagno"
+]
+DESCRIPTION_DETAILS = [
+    "Segnalato dal turno di notte.", "Il problema si ripresenta da alcuni giorni.",
+    "Operatività ridotta nella zona di carico.", "Necessario intervento urgente.",
+    "Già provato il riavvio senza successo.", "Rumore anomalo durante la manovra.",
+    "Spia accesa sul cruscotto.", "Rilevata perdita sotto il mezzo."
+]
+
+# Commenti di esempio
+SAMPLE_COMMENTS = [
+    "Verificato il sistema: tutto funziona correttamente",
+    "Intervento in corso. Parti già ordinate.",
+    "Problema risolto. Verifica finale completata.",
+    "In attesa di ricambi. Previsto arrivo domani.",
+    "Cliente informato. Procediamo con la riparazione.",
+    "Diagnostica completata. Rischio basso.",
+    "Sostituzione componente eseguita con successo.",
+    "Ritardo dovuto alla disponibilità ricambi.",
+    "Tutte le verifiche sono state superate."
+]
+
+
 def seed_users():
     """Crea 3 utenti di test"""
     print("Creazione utenti di test...")
@@ -39,45 +96,11 @@ def seed_tickets(users):
     """Crea 10 ticket di esempio"""
     print("\nCreazione ticket di esempio...")
     
-    # Nomi di esempio
-    requester_names = [
-        "Marco Ferrari", "Anna Russo", "Paolo Colombo", 
-        "Silvia Romano", "Davide Marino", "Francesca Ricci",
-        "Alessandro Gallo", "Laura Conti", "Roberto Esposito"
-    ]
-    
-    # Dati per ticket MEZZO
-    vehicle_types = ["Mafi", "Ralla", "Forklift", "Carrello Elevatore", "Trattore"]
-    anomaly_categories = [
-        "Livello Olio/Liquidi", "Perdite Liquidi", "Pneumatici", 
-        "Carrozzeria", "Spie/Allarmi", "Dispositivi Segnalazione",
-        "Freni/Sterzo/Cambio", "Braccio/Spreader", "Rumori Insoliti", 
-        "Incidenti/Danni", "Altri Problemi"
-    ]
-    
-    # Dati per ticket TECNICO
-    departments = ["IT", "Manutenzione", "Amministrazione", "Logistica", "Produzione"]
-    priorities = ["BASSA", "MEDIA", "ALTA"]
-    statuses = ["NUOVO", "IN_LAVORAZIONE", "RISOLTO"]
-    
-    # Commenti di esempio
-    sample_comments = [
-        "Verificato il sistema: tutto funziona correttamente",
-        "Intervento in corso. Parti già ordinate.",
-        "Problema risolto. Verifica finale completata.",
-        "In attesa di ricambi. Previsto arrivo domani.",
-        "Cliente informato. Procediamo con la riparazione.",
-        "Diagnostica completata. Rischio basso.",
-        "Sostituzione componente eseguita con successo.",
-        "Ritardo dovuto alla disponibilità ricambi.",
-        "Tutte le verifiche sono state superate."
-    ]
-    
     tickets_data = [
         # Ticket MEZZO
         {
             'type': 'MEZZO',
-            'requester': random.choice(requester_names),
+            'requester': random.choice(REQUESTER_NAMES),
             'vehicle_type': 'Forklift',
             'vehicle_number': 'FL-042',
             'anomaly_category': 'Spie/Allarmi',
@@ -86,7 +109,7 @@ def seed_tickets(users):
         },
         {
             'type': 'MEZZO',
-            'requester': random.choice(requester_names),
+            'requester': random.choice(REQUESTER_NAMES),
             'vehicle_type': 'Mafi',
             'vehicle_number': 'MF-108',
             'anomaly_category': 'Perdite Liquidi',
@@ -99,7 +122,7 @@ def seed_tickets(users):
         },
         {
             'type': 'MEZZO',
-            'requester': random.choice(requester_names),
+            'requester': random.choice(REQUESTER_NAMES),
             'vehicle_type': 'Ralla',
             'vehicle_number': 'RL-225',
             'anomaly_category': 'Pneumatici',
@@ -113,7 +136,7 @@ def seed_tickets(users):
         },
         {
             'type': 'MEZZO',
-            'requester': random.choice(requester_names),
+            'requester': random.choice(REQUESTER_NAMES),
             'vehicle_type': 'Carrello Elevatore',
             'vehicle_number': 'CE-017',
             'anomaly_category': 'Freni/Sterzo/Cambio',
@@ -122,7 +145,7 @@ def seed_tickets(users):
         },
         {
             'type': 'MEZZO',
-            'requester': random.choice(requester_names),
+            'requester': random.choice(REQUESTER_NAMES),
             'vehicle_type': 'Mafi',
             'vehicle_number': 'MF-095',
             'anomaly_category': 'Rumori Insoliti',
@@ -136,7 +159,7 @@ def seed_tickets(users):
         # Ticket TECNICO
         {
             'type': 'TECNICO',
-            'requester': random.choice(requester_names),
+            'requester': random.choice(REQUESTER_NAMES),
             'department': 'IT',
             'title': 'Stampante ufficio non risponde',
             'priority': 'MEDIA',
@@ -145,7 +168,7 @@ def seed_tickets(users):
         },
         {
             'type': 'TECNICO',
-            'requester': random.choice(requester_names),
+            'requester': random.choice(REQUESTER_NAMES),
             'department': 'Manutenzione',
             'title': 'Perdita acqua nel locale caldaia',
             'priority': 'ALTA',
@@ -158,7 +181,7 @@ def seed_tickets(users):
         },
         {
             'type': 'TECNICO',
-            'requester': random.choice(requester_names),
+            'requester': random.choice(REQUESTER_NAMES),
             'department': 'Amministrazione',
             'title': 'Installazione software contabilità',
             'priority': 'BASSA',
@@ -172,7 +195,7 @@ def seed_tickets(users):
         },
         {
             'type': 'TECNICO',
-            'requester': random.choice(requester_names),
+            'requester': random.choice(REQUESTER_NAMES),
             'department': 'Logistica',
             'title': 'Sistema RFID non legge badge',
             'priority': 'ALTA',
@@ -181,7 +204,7 @@ def seed_tickets(users):
         },
         {
             'type': 'TECNICO',
-            'requester': random.choice(requester_names),
+            'requester': random.choice(REQUESTER_NAMES),
             'department': 'Produzione',
             'title': 'Illuminazione area produzione insufficiente',
             'priority': 'MEDIA',
@@ -256,8 +279,143 @@ def seed_tickets(users):
     return created_tickets
 
 
+# ==================== DATI SINTETICI ====================
+
+def _synthetic_ticket(rng, ticket_id, created_at, now, mezzo_ratio, user_ids):
+    """Build the column values of one random ticket"""
+    age = now - created_at
+    if age > timedelta(days=14):
+        status = rng.choices(STATUSES, weights=[5, 10, 85])[0]
+    else:
+        status = rng.choices(STATUSES, weights=[40, 30, 30])[0]
+
+    row = {
+        'id': ticket_id,
+        'status': status,
+        'requester_name': rng.choice(REQUESTER_NAMES),
+        'created_at': created_at,
+        'started_at': None,
+        'closed_at': None,
+        'assigned_to_id': rng.choice(user_ids) if user_ids and (status != 'NUOVO' or rng.random() < 0.3) else None,
+        'vehicle_type': None, 'vehicle_number': None, 'anomaly_category': None,
+        'department': None, 'title': None, 'priority': None,
+    }
+    if rng.random() < mezzo_ratio:
+        vehicle_type = rng.choice(VEHICLE_TYPES)
+        category = rng.choice(ANOMALY_CATEGORIES)
+        row.update(ticket_type='MEZZO', vehicle_type=vehicle_type, anomaly_category=category,
+                   vehicle_number=f'{vehicle_type[:2].upper()}-{rng.randint(1, 400):03d}',
+                   description=f'{category} su {vehicle_type}. {rng.choice(DESCRIPTION_DETAILS)}')
+    else:
+        title = rng.choice(TECH_TITLES)
+        row.update(ticket_type='TECNICO', title=title, department=rng.choice(DEPARTMENTS),
+                   priority=rng.choice(PRIORITIES),
+                   description=f'{title}. {rng.choice(DESCRIPTION_DETAILS)}')
+
+    # Working/closing times never lie in the future
+    if status != 'NUOVO':
+        row['started_at'] = min(created_at + timedelta(minutes=rng.randint(10, 12 * 60)), now)
+    if status == 'RISOLTO':
+        row['closed_at'] = min(row['started_at'] + timedelta(minutes=rng.randint(30, 72 * 60)), now)
+    return row
+
+
+def generate_synthetic_data(tickets=10000, mezzo_ratio=0.6, comments_per_ticket=3.0, days=365,
+                            seed=42, end_date=None, batch_size=5000, verbose=True):
+    """Insert `tickets` random tickets and their comments with bulk inserts.
+
+    The same seed, parameters and end_date always produce the same rows.
+    Creation dates are spread over the `days` before end_date (default:
+    today at midnight) and grow with the ticket id, like real data. Each
+    ticket gets 0..2*comments_per_ticket comments. The FTS and analytics
+    triggers are suspended during the load and rebuilt once at the end.
+
+    Returns (tickets inserted, comments inserted).
+    """
+    rng = random.Random(seed)
+    now = end_date or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = now - timedelta(days=days)
+    step = (now - start) / max(tickets, 1)
+    user_ids = [user_id for (user_id,) in db.session.execute(db.select(User.id).order_by(User.id))]
+    authors = [username for (username,) in db.session.execute(db.select(User.username).order_by(User.id))] or ['admin']
+    first_id = (db.session.execute(db.select(db.func.max(Ticket.id))).scalar() or 0) + 1
+    max_comments = max(0, round(2 * comments_per_ticket))
+    # End the read transaction: the trigger DDL below runs on another connection
+    db.session.commit()
+
+    total_comments = 0
+    started = datetime.now()
+    with search.suspended_search_index(db.engine), analytics.suspended_rollups(db.engine, rollup_sources()), \
+            live.suspended_change_log(db.engine):
+        for batch_start in range(0, tickets, batch_size):
+            ticket_rows, comment_rows = [], []
+            for i in range(batch_start, min(batch_start + batch_size, tickets)):
+                created_at = start + step * (i + rng.random())
+                row = _synthetic_ticket(rng, first_id + i, created_at, now, mezzo_ratio, user_ids)
+                last_change = row['closed_at'] or row['started_at'] or created_at
+                end = row['closed_at'] or now
+                for _ in range(rng.randint(0, max_comments)):
+                    comment_at = created_at + (end - created_at) * rng.random()
+                    last_change = max(last_change, comment_at)
+                    comment_rows.append({
+                        'ticket_id': row['id'], 'author_name': rng.choice(authors),
+                        'body': rng.choice(SAMPLE_COMMENTS), 'created_at': comment_at,
+                    })
+                row['updated_at'] = last_change
+                ticket_rows.append(row)
+
+            db.session.execute(Ticket.__table__.insert(), ticket_rows)
+            if comment_rows:
+                db.session.execute(Comment.__table__.insert(), comment_rows)
+            db.session.commit()
+            total_comments += len(comment_rows)
+            if verbose:
+                done = batch_start + len(ticket_rows)
+                print(f"   {done}/{tickets} ticket, {total_comments} commenti "
+                      f"({(datetime.now() - started).total_seconds():.1f}s)")
+        if verbose:
+            print("   Ricostruzione indice di ricerca...")
+    return tickets, total_comments
+
+
+def seed_synthetic(args):
+    """Genera dati sintetici in blocco"""
+    print("=" * 60)
+    print(f"DATI SINTETICI: {args.tickets} ticket, seed {args.seed}")
+    print("=" * 60)
+    end_date = datetime.strptime(args.end_date, '%Y-%m-%d') if args.end_date else None
+
+    with app.app_context():
+        migrate_db()
+        seed_users()
+        started = datetime.now()
+        tickets, comments = generate_synthetic_data(
+            tickets=args.tickets, mezzo_ratio=args.mezzo_ratio, comments_per_ticket=args.comments,
+            days=args.days, seed=args.seed, end_date=end_date, batch_size=args.batch_size
+        )
+        elapsed = (datetime.now() - started).total_seconds()
+
+    print("\n" + "=" * 60)
+    print(f"✅ {tickets} ticket e {comments} commenti inseriti in {elapsed:.1f}s")
+    print("=" * 60)
+
+
 def main():
     """Funzione principale per popolare il database"""
+    parser = argparse.ArgumentParser(description='Popola il database FIXIT')
+    parser.add_argument('--tickets', type=int, default=0,
+                        help='numero di ticket sintetici (0 = solo i 10 ticket di esempio)')
+    parser.add_argument('--mezzo-ratio', type=float, default=0.6, help='quota di ticket MEZZO (0-1)')
+    parser.add_argument('--comments', type=float, default=3.0, help='commenti medi per ticket')
+    parser.add_argument('--days', type=int, default=365, help='giorni coperti dalle date di creazione')
+    parser.add_argument('--end-date', help='data più recente (AAAA-MM-GG, default oggi)')
+    parser.add_argument('--seed', type=int, default=42, help='seed del generatore casuale')
+    parser.add_argument('--batch-size', type=int, default=5000, help='ticket per transazione')
+    args = parser.parse_args()
+    if args.tickets:
+        seed_synthetic(args)
+        return
+
     print("=" * 60)
     print("POPOLAMENTO DATABASE CON DATI DI TEST")
     print("=" * 60)
@@ -0,0 +1,36 @@
+// Dashboard bulk actions: "select all" checkbox and confirmation before deleting
+document.addEventListener('DOMContentLoaded', function () {
+    var form = document.getElementById('bulk-form');
+    if (!form) {
+        return;
+    }
+    var selectAll = document.getElementById('select-all');
+
+    selectAll.addEventListener('change', function () {
+        // Queried on every change: live updates may have replaced or added rows
+        document.querySelectorAll('.ticket-select:not(:disabled)').forEach(function (checkbox) {
+            checkbox.checked = selectAll.checked;
+        });
+    });
+
+    form.addEventListener('submit', function (event) {
+        var action = document.getElementById('bulk-action').value;
+        var scopeFilter = document.getElementById('scope-filter').checked;
+        var selected = document.querySelectorAll('.ticket-select:checked').length;
+        var confirmed = document.getElementById('bulk-confirmed');
+
+        if (!scopeFilter && selected === 0) {
+            event.preventDefault();
+            alert('Seleziona almeno un ticket.');
+            return;
+        }
+        if (action === 'delete') {
+            var target = scopeFilter ? 'tutti i ticket filtrati' : selected + ' ticket';
+            if (!confirm('Eliminare definitivamente ' + target + '? L\'operazione non può essere annullata.')) {
+                event.preventDefault();
+                return;
+            }
+            confirmed.value = '1';
+        }
+    });
+});
@@ -0,0 +1,159 @@
+// Live dashboard updates: follow the ticket change log and patch the table rows in place
+document.addEventListener('DOMContentLoaded', function () {
+    var box = document.getElementById('live-updates');
+    if (!box) {
+        return;
+    }
+    var seq = parseInt(box.dataset.seq, 10) || 0;
+    var interval = (parseInt(box.dataset.interval, 10) || 5) * 1000;
+    var firstPage = box.dataset.firstPage === '1';
+    var tbody = document.querySelector('table tbody');
+    var pending = {};  // ticket id -> last event kind, flushed in one rows request
+    var flushTimer = null;
+    var pollTimer = null;
+    var MAX_PATCHED = 100;
+
+    function showBanner() {
+        box.classList.remove('d-none');
+    }
+
+    function findRow(ticketId) {
+        var checkbox = document.querySelector('.ticket-select[value="' + ticketId + '"]');
+        return checkbox ? checkbox.closest('tr') : null;
+    }
+
+    function parseRow(html) {
+        var template = document.createElement('template');
+        template.innerHTML = html.trim();
+        return template.content.firstElementChild;
+    }
+
+    function highlight(row) {
+        row.classList.add('table-info');
+        setTimeout(function () { row.classList.remove('table-info'); }, 3000);
+    }
+
+    function applyRows(data, created) {
+        data.removed.forEach(function (ticketId) {
+            var row = findRow(ticketId);
+            if (row) {
+                row.remove();
+            }
+        });
+        // Rows come newest first: insert new ones in reverse so the newest ends on top
+        data.rows.slice().reverse().forEach(function (item) {
+            var existing = findRow(item.id);
+            var row = parseRow(item.html);
+            if (existing) {
+                row.querySelector('.ticket-select').checked = existing.querySelector('.ticket-select').checked;
+                existing.replaceWith(row);
+            } else if (created[item.id] && firstPage && tbody) {
+                tbody.insertBefore(row, tbody.firstChild);
+            } else {
+                if (created[item.id]) {
+                    showBanner();  // new ticket that belongs to another page
+                }
+                return;
+            }
+            highlight(row);
+        });
+    }
+
+    function flush() {
+        flushTimer = null;
+        var ids = Object.keys(pending);
+        var created = {};
+        ids.forEach(function (ticketId) {
+            if (pending[ticketId] === 'created') {
+                created[ticketId] = true;
+            }
+        });
+        pending = {};
+        if (!ids.length) {
+            return;
+        }
+        if (ids.length > MAX_PATCHED || !tbody) {
+            showBanner();
+            return;
+        }
+        var url = box.dataset.rowsUrl + (box.dataset.rowsUrl.indexOf('?') === -1 ? '?' : '&') + 'ids=' + ids.join(',');
+        fetch(url, {credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.json();
+            })
+            .then(function (data) { applyRows(data, created); })
+            .catch(showBanner);
+    }
+
+    function receive(events) {
+        events.forEach(function (event) {
+            // Keep 'created' even if the ticket was updated again before the flush
+            if (pending[event.ticket_id] !== 'created' || event.kind === 'deleted') {
+                pending[event.ticket_id] = event.kind;
+            }
+            seq = Math.max(seq, event.seq);
+        });
+        if (events.length && !flushTimer) {
+            flushTimer = setTimeout(flush, 300);
+        }
+    }
+
+    function poll() {
+        pollTimer = null;
+        if (document.hidden) {
+            return;  // resumed by visibilitychange
+        }
+        fetch(box.dataset.eventsUrl + '?after=' + seq, {credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.json();
+            })
+            .then(function (data) {
+                if (data.truncated) {
+                    showBanner();
+                    seq = data.last_seq;
+                    return;
+                }
+                receive(data.events);
+                seq = Math.max(seq, data.last_seq);
+            })
+            .catch(function () { /* network hiccup or expired session: retry later */ })
+            .then(function () {
+                if (!pollTimer) {
+                    pollTimer = setTimeout(poll, interval);
+                }
+            });
+    }
+
+    function startPolling() {
+        document.addEventListener('visibilitychange', function () {
+            if (!document.hidden && !pollTimer) {
+                poll();
+            }
+        });
+        pollTimer = setTimeout(poll, interval);
+    }
+
+    if (box.dataset.streamUrl && window.EventSource) {
+        var source = new EventSource(box.dataset.streamUrl + '?after=' + seq);
+        source.addEventListener('ticket', function (message) {
+            receive([JSON.parse(message.data)]);
+        });
+        source.addEventListener('reset', function () {
+            source.close();
+            showBanner();
+        });
+        source.onerror = function () {
+            if (source.readyState === EventSource.CLOSED) {
+                startPolling();  // stream refused (e.g. disabled): fall back to polling
+            }
+        };
+    } else {
+        startPolling();
+    }
+});
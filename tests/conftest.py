@@ -0,0 +1,47 @@
+"""
+Shared fixtures. The app reads its configuration from the environment at
+import, so it is pointed at temporary SQLite files (database, archive,
+uploads, backups) before the first import; nothing touches instance/.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+from support import ROOT, app_environment, login
+
+_workdir = tempfile.mkdtemp(prefix='fixit-tests-')
+os.environ.update(app_environment(_workdir))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def fixit():
+    """The app module, initialised on the session's temporary database"""
+    import app as fixit
+
+    fixit.app.config['TESTING'] = True
+    fixit.app.config['WTF_CSRF_ENABLED'] = False
+    fixit.limiter.enabled = False
+    fixit.init_db()
+    yield fixit
+    with fixit.app.app_context():
+        fixit.db.engine.dispose()
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+@pytest.fixture
+def client(fixit):
+    """Test client logged in as the default admin"""
+    client = fixit.app.test_client()
+    login(client)
+    return client
+
+
+@pytest.fixture
+def app_context(fixit):
+    with fixit.app.app_context():
+        yield
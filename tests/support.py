@@ -0,0 +1,150 @@
+"""
+Helpers shared by the tests, including the code run in spawned processes.
+
+Kept apart from conftest.py, which configures the test session's app when
+imported: a spawned process imports this module instead and configures its
+own app from the environment it is given.
+"""
+
+import os
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_PASSWORD = 'test-password'
+
+
+def app_environment(workdir):
+    """Environment variables running the app on the files in `workdir`"""
+    return {
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'tickets.db')}",
+        'ARCHIVE_DATABASE': os.path.join(workdir, 'archive.db'),
+        'ARCHIVE_UPLOAD_FOLDER': os.path.join(workdir, 'archive_uploads'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'BACKUP_DIR': os.path.join(workdir, 'backups'),
+        'RATELIMIT_STORAGE_URI': f"sqlite:///{os.path.join(workdir, 'ratelimit.db')}",
+        'TEMPLATE_CACHE_DIR': '',
+        'METRICS_DIR': '',
+        'NOTIFICATION_WORKER_ENABLED': 'False',
+        'ADMIN_PASSWORD': ADMIN_PASSWORD,
+    }
+
+
+def import_app(env, **config):
+    """Import the app in a spawned process, on the files of `env` (see app_environment)"""
+    os.environ.update(env)
+    sys.path.insert(0, ROOT)
+    import app as fixit
+
+    fixit.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, **config)
+    fixit.limiter.enabled = False
+    return fixit
+
+
+def login(client):
+    response = client.post('/admin/login', data={'username': 'admin', 'password': ADMIN_PASSWORD})
+    assert response.status_code == 302
+
+
+# ==================== SPAWNED PROCESSES ====================
+
+def init_database(env, seed_tickets):
+    """Create the schema and `seed_tickets` tickets to comment on"""
+    fixit = import_app(env)
+    fixit.init_db()
+    with fixit.app.app_context():
+        for i in range(seed_tickets):
+            fixit.db.session.add(fixit.Ticket(
+                ticket_type='MEZZO', requester_name=f'Seed {i}', description='Ticket iniziale',
+                vehicle_type='Mafi', vehicle_number=f'MF-{i:03d}', anomaly_category='Pneumatici'
+            ))
+        fixit.db.session.commit()
+
+
+def concurrent_writer(env, name, threads, writes, seed_tickets, write_batching, results):
+    """Create tickets and comments from `threads` threads; put (errors, requesters, comment bodies) in `results`"""
+    fixit = import_app(env, WRITE_BATCHING=write_batching)
+    errors, requesters, bodies = [], [], []
+    lock = threading.Lock()
+
+    def run(thread):
+        client = fixit.app.test_client()
+        login(client)
+        for i in range(writes):
+            tag = f'{name}-{thread}-{i}'
+            try:
+                if i % 2 == 0:
+                    response = client.post('/new/mezzi', data={
+                        'requester_name': tag, 'vehicle_type': 'Ralla', 'vehicle_number': f'RL-{i}',
+                        'anomaly_category': 'Carrozzeria', 'description': 'Creato dal test di concorrenza'
+                    })
+                    written = requesters
+                else:
+                    response = client.post(f'/admin/ticket/{i % seed_tickets + 1}', data={
+                        'action': 'add_comment', 'author_name': 'admin', 'comment_body': tag
+                    })
+                    written = bodies
+                if response.status_code != 302:
+                    raise RuntimeError(f'HTTP {response.status_code}')
+            except Exception as e:  # with TESTING the app's exceptions reach the client
+                with lock:
+                    errors.append(f'{type(e).__name__}: {e}')
+                continue
+            with lock:
+                written.append(tag)
+
+    workers = [threading.Thread(target=run, args=(thread,)) for thread in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put((errors, requesters, bodies))
+
+
+def ratelimit_hits(storage_uri, strategy, limit, attempts, start, results):
+    """Hit one shared limit `attempts` times after `start.wait()`; put the number admitted in `results`"""
+    sys.path.insert(0, ROOT)
+    from limits import parse, strategies
+
+    import ratelimit_storage
+
+    limiter = strategies.STRATEGIES[strategy](ratelimit_storage.SQLiteStorage(storage_uri))
+    item = parse(f'{limit} per minute')
+    start.wait()
+    results.put(sum(1 for _ in range(attempts) if limiter.hit(item, 'shared-key')))
+
+
+def ticket_writer(env, ready, stop, results):
+    """Create tickets until `stop` is set; put the list of errors in `results`"""
+    fixit = import_app(env)
+    client = fixit.app.test_client()
+    ready.wait()
+    errors = []
+    i = 0
+    while not stop.is_set():
+        try:
+            response = client.post('/new/mezzi', data={
+                'requester_name': 'Backup test', 'vehicle_type': 'Ralla', 'vehicle_number': f'RL-{i}',
+                'anomaly_category': 'Carrozzeria', 'description': 'Creato durante il backup'
+            })
+            if response.status_code != 302:
+                raise RuntimeError(f'HTTP {response.status_code}')
+        except Exception as e:
+            errors.append(f'{type(e).__name__}: {e}')
+        i += 1
+    results.put(errors)
+
+
+def boot_and_open_dashboard(env, results):
+    """Boot like wsgi.py (ensure_database) and open the dashboard; put (status or error, init_db ran) in `results`"""
+    fixit = import_app(env)
+    ran = []
+    init_db = fixit.init_db
+    fixit.init_db = lambda: ran.append(True) or init_db()
+    try:
+        fixit.ensure_database()
+        client = fixit.app.test_client()
+        login(client)
+        results.put((client.get('/admin/dashboard').status_code, bool(ran)))
+    except Exception as e:
+        results.put((f'{type(e).__name__}: {e}', bool(ran)))
@@ -0,0 +1,163 @@
+"""Online backups: consistent copies under writes, incremental photos, verified restore."""
+
+import multiprocessing
+import os
+import sqlite3
+import time
+
+import pytest
+
+import backup_manager
+import support
+
+WRITERS = 2
+
+
+def count_tickets(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT count(*) FROM tickets').fetchone()[0]
+
+
+def write_photos(folder, names, size=2048):
+    os.makedirs(folder, exist_ok=True)
+    for name in names:
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(os.urandom(size))
+
+
+@pytest.fixture
+def simple_db(tmp_path):
+    """A small SQLite database with a tickets table"""
+    path = str(tmp_path / 'tickets.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('CREATE TABLE tickets (id INTEGER PRIMARY KEY, title TEXT)')
+        conn.executemany('INSERT INTO tickets (title) VALUES (?)', [(f'Ticket {i}',) for i in range(50)])
+    return path
+
+
+def make_manager(tmp_path, db_path, upload_folder):
+    return backup_manager.BackupManager(str(tmp_path / 'backups'), [('main', db_path)], {'uploads': upload_folder})
+
+
+def test_snapshot_is_consistent_while_processes_write(tmp_path):
+    env = support.app_environment(str(tmp_path))
+    ctx = multiprocessing.get_context('spawn')
+    init = ctx.Process(target=support.init_database, args=(env, 10))
+    init.start()
+    init.join()
+    assert init.exitcode == 0
+    db_path = str(tmp_path / 'tickets.db')
+    manager = backup_manager.BackupManager(
+        str(tmp_path / 'backups'),
+        [('main', db_path), ('archive', env['ARCHIVE_DATABASE'])],
+        {'uploads': env['UPLOAD_FOLDER']}, step_pages=4,  # many small steps, interleaved with the writes
+    )
+
+    ready = ctx.Barrier(WRITERS + 1)
+    stop = ctx.Event()
+    results = ctx.Queue()
+    writers = [ctx.Process(target=support.ticket_writer, args=(env, ready, stop, results)) for _ in range(WRITERS)]
+    for writer in writers:
+        writer.start()
+    ready.wait(timeout=60)
+    time.sleep(0.5)
+    before = count_tickets(db_path)
+    manifest = manager.create_snapshot()
+    after = count_tickets(db_path)
+    stop.set()
+    errors = [error for _ in writers for error in results.get(timeout=60)]
+    for writer in writers:
+        writer.join()
+
+    assert not errors
+    assert after > before  # the app kept writing during the copy
+    snapshot_db = os.path.join(manager.snapshots_dir, manifest['id'], 'main.db')
+    assert before <= count_tickets(snapshot_db) <= after
+    assert manifest['databases']['main']['tables']['tickets'] == count_tickets(snapshot_db)
+    with sqlite3.connect(snapshot_db) as conn:
+        assert conn.execute('PRAGMA foreign_key_check').fetchall() == []
+    assert manager.verify_snapshot(manifest['id']) == []
+
+
+def test_second_snapshot_copies_only_new_photos(tmp_path, simple_db):
+    upload_folder = str(tmp_path / 'uploads')
+    write_photos(upload_folder, ['a.jpg', 'b.jpg', 'c.jpg'])
+    manager = make_manager(tmp_path, simple_db, upload_folder)
+
+    first = manager.create_snapshot()
+    assert first['stats']['new_blobs'] == 3
+
+    write_photos(upload_folder, ['d.jpg'], size=4096)
+    second = manager.create_snapshot()
+    assert second['stats'] == {'files': 4, 'new_blobs': 1, 'copied_bytes': 4096}
+    assert set(second['folders']['uploads']) == {'a.jpg', 'b.jpg', 'c.jpg', 'd.jpg'}
+    # Unchanged files point at the blobs of the first snapshot
+    for name in ('a.jpg', 'b.jpg', 'c.jpg'):
+        assert second['folders']['uploads'][name] == first['folders']['uploads'][name]
+    assert manager.verify_snapshot(second['id']) == []
+
+
+def test_restore_is_verified(tmp_path, simple_db):
+    upload_folder = str(tmp_path / 'uploads')
+    write_photos(upload_folder, ['a.jpg', 'b.jpg'])
+    manifest = make_manager(tmp_path, simple_db, upload_folder).create_snapshot()
+
+    restored_db = str(tmp_path / 'restored.db')
+    restored_uploads = str(tmp_path / 'restored-uploads')
+    write_photos(restored_uploads, ['b.jpg', 'later.jpg'])  # b differs from the backup, later.jpg is newer
+    target = make_manager(tmp_path, restored_db, restored_uploads)
+    report = target.restore(manifest['id'])
+
+    assert report == {'id': manifest['id'], 'restored_files': 2, 'extra_files': 1}
+    assert count_tickets(restored_db) == 50
+    for name in ('a.jpg', 'b.jpg'):
+        with open(os.path.join(upload_folder, name), 'rb') as original, \
+                open(os.path.join(restored_uploads, name), 'rb') as restored:
+            assert original.read() == restored.read()
+    assert os.path.exists(os.path.join(restored_uploads, 'later.jpg'))
+
+
+def test_damaged_snapshot_is_not_restored(tmp_path, simple_db):
+    upload_folder = str(tmp_path / 'uploads')
+    write_photos(upload_folder, ['a.jpg'])
+    manager = make_manager(tmp_path, simple_db, upload_folder)
+    manifest = manager.create_snapshot()
+    blob = manager._blob_path(manifest['folders']['uploads']['a.jpg']['sha256'])
+    with open(blob, 'r+b') as f:
+        f.write(b'damaged')
+
+    restored_db = str(tmp_path / 'restored.db')
+    with pytest.raises(backup_manager.BackupError, match='danneggiato'):
+        make_manager(tmp_path, restored_db, str(tmp_path / 'restored-uploads')).restore(manifest['id'])
+    assert not os.path.exists(restored_db)  # nothing touched
+
+
+class FailingSnapshotManager:
+    """Stands in for BackupManager: the safety snapshot fails, restores are recorded"""
+
+    def __init__(self):
+        self.restored = []
+
+    def create_snapshot(self):
+        raise backup_manager.BackupError('disco pieno')
+
+    def restore(self, snapshot_id):
+        self.restored.append(snapshot_id)
+        return {'id': snapshot_id, 'restored_files': 0, 'extra_files': 0}
+
+
+@pytest.mark.parametrize('force', [False, True])
+def test_restore_command_needs_force_without_safety_snapshot(fixit, monkeypatch, force):
+    manager = FailingSnapshotManager()
+    monkeypatch.setattr(fixit, 'get_backup_manager', lambda: manager)
+    args = ['restore-backup', '20260101-033000', '--yes'] + (['--force'] if force else [])
+    result = fixit.app.test_cli_runner().invoke(args=args)
+
+    if force:
+        assert result.exit_code == 0, result.output
+        assert manager.restored == ['20260101-033000']
+    else:
+        assert result.exit_code != 0
+        assert 'ripristino annullato' in str(result.exception) + result.output
+        assert manager.restored == []
@@ -0,0 +1,52 @@
+"""Several processes and threads writing to one SQLite database at once."""
+
+import multiprocessing
+import sqlite3
+
+import pytest
+
+import support
+
+PROCESSES = 4
+THREADS = 4
+WRITES = 10  # per thread, half tickets and half comments
+SEED_TICKETS = 5
+
+
+@pytest.mark.parametrize('write_batching', [False, True], ids=['commit', 'group-commit'])
+def test_concurrent_writes_are_all_stored(tmp_path, write_batching):
+    env = support.app_environment(str(tmp_path))
+    ctx = multiprocessing.get_context('spawn')
+    init = ctx.Process(target=support.init_database, args=(env, SEED_TICKETS))
+    init.start()
+    init.join()
+    assert init.exitcode == 0
+
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=support.concurrent_writer,
+                    args=(env, f'p{n}', THREADS, WRITES, SEED_TICKETS, write_batching, results))
+        for n in range(PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    errors, requesters, bodies = [], [], []
+    for _ in processes:
+        worker_errors, worker_requesters, worker_bodies = results.get(timeout=120)
+        errors += worker_errors
+        requesters += worker_requesters
+        bodies += worker_bodies
+    for process in processes:
+        process.join()
+
+    assert not [e for e in errors if 'database is locked' in e]
+    assert not errors
+    assert len(requesters) == len(bodies) == PROCESSES * THREADS * WRITES // 2
+
+    with sqlite3.connect(tmp_path / 'tickets.db') as conn:
+        stored_requesters = [row[0] for row in conn.execute(
+            "SELECT requester_name FROM tickets WHERE requester_name NOT LIKE 'Seed %'")]
+        stored_bodies = [row[0] for row in conn.execute('SELECT body FROM comments')]
+    # Every acknowledged write is stored, exactly once
+    assert sorted(stored_requesters) == sorted(requesters)
+    assert sorted(stored_bodies) == sorted(bodies)
@@ -0,0 +1,55 @@
+"""Exports list the same tickets as the dashboard, archived ones included."""
+
+import csv
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def archived_ticket(fixit):
+    """A resolved ticket with a comment, moved to the archive database"""
+    with fixit.app.app_context():
+        closed_at = datetime.utcnow() - timedelta(days=400)
+        ticket = fixit.Ticket(ticket_type='MEZZO', requester_name='Export archiviato', description='Vecchio guasto',
+                              status='RISOLTO', created_at=closed_at, closed_at=closed_at)
+        fixit.db.session.add(ticket)
+        fixit.db.session.flush()
+        fixit.db.session.add(fixit.Comment(ticket_id=ticket.id, author_name='admin', body='Commento archiviato'))
+        # The newest ticket is never archived (see archivable_ticket_ids)
+        fixit.db.session.add(fixit.Ticket(ticket_type='MEZZO', requester_name='Export attivo', description='Nuovo'))
+        fixit.db.session.commit()
+        ticket_id = ticket.id
+        assert fixit.archive_tickets(datetime.utcnow() - timedelta(days=365)) >= 1
+        assert fixit.db.session.get(fixit.Ticket, ticket_id) is None
+        assert fixit.db.session.get(fixit.ArchivedTicket, ticket_id) is not None
+    return ticket_id
+
+
+def export_rows(client, **args):
+    response = client.get('/admin/export', query_string=args)
+    assert response.status_code == 200
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True).lstrip('\ufeff'), newline=''), delimiter=';'))
+
+
+@pytest.mark.parametrize('args', [{'status': 'RISOLTO'}, {'archive': '1'}, {'status': 'RISOLTO', 'search': 'archiviato'}])
+def test_export_includes_archived_tickets(client, archived_ticket, args):
+    rows = export_rows(client, **args)
+    assert [row for row in rows[1:] if row[0] == str(archived_ticket)]
+
+
+def test_export_includes_archived_comments(client, archived_ticket):
+    rows = export_rows(client, dataset='comments', status='RISOLTO')
+    assert [row for row in rows[1:] if row[1] == str(archived_ticket) and row[5] == 'Commento archiviato']
+
+
+def test_export_without_archive_flag_lists_live_tickets_only(client, archived_ticket):
+    rows = export_rows(client)
+    assert not [row for row in rows[1:] if row[0] == str(archived_ticket)]
+
+
+def test_xlsx_export_includes_archived_tickets(client, archived_ticket):
+    response = client.get('/admin/export', query_string={'format': 'xlsx', 'status': 'RISOLTO'})
+    assert response.status_code == 200
+    assert response.data.startswith(b'PK')
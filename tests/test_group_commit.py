@@ -0,0 +1,134 @@
+"""GroupCommitter, and ticket submissions with WRITE_BATCHING."""
+
+import threading
+
+from group_commit import GroupCommitter, _Write
+
+
+def run_each(writes):
+    """run_batch storing nothing: each write gets its own result or exception"""
+    for write in writes:
+        try:
+            write.result = write.function()
+        except Exception as e:
+            write.error = e
+
+
+def run_concurrently(functions, timeout=10):
+    """Call every function from its own thread at once; return (results, errors) by position"""
+    results, errors = [None] * len(functions), [None] * len(functions)
+    start = threading.Barrier(len(functions))
+
+    def run(i):
+        start.wait()
+        try:
+            results[i] = functions[i]()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(len(functions))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout)
+    assert not any(thread.is_alive() for thread in threads), 'a thread did not return'
+    return results, errors
+
+
+def submit_all(committer, functions):
+    return run_concurrently([lambda f=f: committer.submit(f) for f in functions])
+
+
+def test_concurrent_submits_get_their_own_result():
+    committer = GroupCommitter(run_each, window=0.01)
+    results, errors = submit_all(committer, [lambda i=i: i * 10 for i in range(40)])
+    assert results == [i * 10 for i in range(40)]
+    assert errors == [None] * 40
+    assert committer.writes == 40
+    assert committer.batches < 40  # writes were actually grouped
+
+
+def test_failing_write_only_fails_its_caller():
+    def fail():
+        raise ValueError('scrittura non valida')
+
+    committer = GroupCommitter(run_each, window=0.01)
+    functions = [lambda i=i: i for i in range(10)]
+    functions[3] = fail
+    results, errors = submit_all(committer, functions)
+    assert isinstance(errors[3], ValueError)
+    assert [e for i, e in enumerate(errors) if i != 3] == [None] * 9
+    assert [r for i, r in enumerate(results) if i != 3] == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+
+
+def test_failed_commit_fails_the_whole_batch():
+    def run_batch(writes):
+        run_each(writes)
+        raise OSError('commit fallito')
+
+    committer = GroupCommitter(run_batch, window=0.01)
+    results, errors = submit_all(committer, [lambda: 1, lambda: 2])
+    assert results == [None, None]
+    assert all(isinstance(e, OSError) for e in errors)
+
+
+def test_more_pending_writes_than_max_batch():
+    sizes = []
+
+    def run_batch(writes):
+        sizes.append(len(writes))
+        run_each(writes)
+
+    committer = GroupCommitter(run_batch, window=0.05, max_batch=4)
+    results, errors = submit_all(committer, [lambda i=i: i for i in range(50)])
+    assert results == list(range(50)) and errors == [None] * 50
+    assert max(sizes) <= 4 and sum(sizes) == 50
+
+
+# ==================== APP ====================
+
+def test_batched_submissions_return_stored_ids(fixit, monkeypatch):
+    monkeypatch.setitem(fixit.app.config, 'WRITE_BATCHING', True)
+    names = [f'Batch {i}' for i in range(24)]
+
+    def submit(name):
+        response = fixit.app.test_client().post('/new/mezzi', headers={'Accept': 'application/json'}, data={
+            'requester_name': name, 'vehicle_type': 'Ralla', 'vehicle_number': 'RL-1',
+            'anomaly_category': 'Carrozzeria', 'description': 'Inviato in gruppo'
+        })
+        assert response.status_code == 201
+        return response.get_json()['id']
+
+    batches = fixit.write_batcher.batches
+    ids, errors = run_concurrently([lambda name=name: submit(name) for name in names], timeout=30)
+    assert errors == [None] * len(names)
+    assert len(set(ids)) == len(names)
+    assert fixit.write_batcher.batches > batches  # went through the group commit
+
+    with fixit.app.app_context():
+        stored = fixit.db.session.execute(
+            fixit.db.select(fixit.Ticket.id, fixit.Ticket.requester_name)
+            .where(fixit.Ticket.requester_name.like('Batch %'))
+        ).all()
+    # Every id answered is stored exactly once, under the name that was sent with it
+    assert sorted(stored) == sorted(zip(ids, names))
+
+
+def test_failing_write_in_batch_is_isolated(fixit, app_context):
+    def add(name):
+        def write(session):
+            ticket = fixit.Ticket(ticket_type='MEZZO', requester_name=name, description='Isolata')
+            session.add(ticket)
+            session.flush()
+            return ticket.id
+        return write
+
+    def fail(session):
+        raise ValueError('scrittura non valida')
+
+    writes = [_Write(add('Isolata 1')), _Write(fail), _Write(add('Isolata 2'))]
+    fixit.run_write_batch(writes)
+    assert isinstance(writes[1].error, ValueError)
+    assert writes[0].error is None and writes[2].error is None
+    stored = {fixit.db.session.get(fixit.Ticket, write.result).requester_name for write in (writes[0], writes[2])}
+    assert stored == {'Isolata 1', 'Isolata 2'}
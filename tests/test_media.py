@@ -0,0 +1,81 @@
+"""Uploaded photos are only served by the login-protected `media` view."""
+
+import os
+
+import pytest
+
+LEGACY_PHOTO = '20260121_134051_voragine.jpg'  # committed sample in static/uploads
+
+
+@pytest.fixture
+def photo(fixit):
+    relpath = 'ab/abcdef.jpg'
+    path = os.path.join(fixit.app.config['UPLOAD_FOLDER'], relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'\xff\xd8\xff fake jpeg')
+    yield relpath
+    os.remove(path)
+
+
+def test_legacy_upload_folder_is_not_static(fixit):
+    client = fixit.app.test_client()
+    assert os.path.isfile(os.path.join(fixit.LEGACY_UPLOAD_FOLDER, LEGACY_PHOTO))
+    assert client.get(f'/static/uploads/{LEGACY_PHOTO}').status_code == 404
+    assert client.get(f'/static/js/../uploads/{LEGACY_PHOTO}').status_code == 404
+    assert client.get('/static/js/live.js').status_code == 200
+
+
+def test_media_requires_login(fixit, photo):
+    response = fixit.app.test_client().get(f'/media/{photo}')
+    assert response.status_code == 302
+
+
+def test_media_serves_logged_in_operators(client, photo):
+    response = client.get(f'/media/{photo}')
+    assert response.status_code == 200
+    assert response.data == b'\xff\xd8\xff fake jpeg'
+
+
+def test_move_uploads_command(fixit, monkeypatch, tmp_path):
+    legacy = tmp_path / 'static-uploads'
+    (legacy / 'cd').mkdir(parents=True)
+    (legacy / 'cd' / 'cdef.jpg').write_bytes(b'new')
+    (legacy / 'old.jpg').write_bytes(b'old')
+    (legacy / '.gitkeep').write_bytes(b'')
+    upload_folder = tmp_path / 'uploads'
+    (upload_folder / 'cd').mkdir(parents=True)
+    (upload_folder / 'old.jpg').write_bytes(b'already moved')
+    monkeypatch.setattr(fixit, 'LEGACY_UPLOAD_FOLDER', str(legacy))
+    monkeypatch.setitem(fixit.app.config, 'UPLOAD_FOLDER', str(upload_folder))
+
+    result = fixit.app.test_cli_runner().invoke(args=['move-uploads'])
+    assert result.exit_code == 0, result.output
+    assert 'Foto spostate' in result.output and ': 1' in result.output
+    assert (upload_folder / 'cd' / 'cdef.jpg').read_bytes() == b'new'
+    assert not (legacy / 'cd' / 'cdef.jpg').exists()
+    # Existing files are never overwritten
+    assert (upload_folder / 'old.jpg').read_bytes() == b'already moved'
+    assert (legacy / 'old.jpg').exists() and (legacy / '.gitkeep').exists()
+
+
+@pytest.fixture
+def api_token(fixit, app_context):
+    token = 'media-test-token'
+    admin = fixit.User.query.filter_by(username='admin').one()
+    fixit.db.session.add(fixit.ApiToken(name='media test', token_hash=fixit.ApiToken.hash_token(token), user_id=admin.id))
+    fixit.db.session.commit()
+    return token
+
+
+def test_media_accepts_api_token(fixit, photo, api_token):
+    client = fixit.app.test_client()
+    response = client.get(f'/media/{photo}', headers={'Authorization': f'Bearer {api_token}'})
+    assert response.status_code == 200
+    assert response.data == b'\xff\xd8\xff fake jpeg'
+
+
+def test_media_rejects_invalid_api_token(fixit, photo):
+    response = fixit.app.test_client().get(f'/media/{photo}', headers={'Authorization': 'Bearer wrong'})
+    assert response.status_code == 401
+    assert response.is_json
@@ -0,0 +1,32 @@
+"""PasswordHasher: bounded queue of hashing jobs."""
+
+import threading
+
+import pytest
+
+from passwords import HasherBusy, PasswordHasher
+
+
+def test_timed_out_job_stays_counted_until_it_ends():
+    hasher = PasswordHasher(max_workers=1, max_queue=1, timeout=0.05)
+    release = threading.Event()
+    with pytest.raises(HasherBusy, match='scaduta'):
+        hasher._run(release.wait)
+    # The job still occupies the pool thread: the queue is full
+    with pytest.raises(HasherBusy, match='piena'):
+        hasher._run(lambda: None)
+
+    release.set()
+    hasher._executor.submit(lambda: None).result()  # the blocked job has ended
+    assert hasher._pending == 0
+    assert hasher._run(lambda: 'ok') == 'ok'
+
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000')
+    password_hash = hasher.hash('segreta')
+    assert hasher.verify(password_hash, 'segreta')
+    assert not hasher.verify(password_hash, 'sbagliata')
+    assert not hasher.verify(None, 'segreta')
+    assert not hasher.needs_rehash(password_hash)
+    assert hasher._pending == 0
@@ -0,0 +1,23 @@
+"""Every dashboard filter combination is served by an index (EXPLAIN QUERY PLAN)."""
+
+
+def test_dashboard_filters_use_indexes(fixit, app_context):
+    failures = fixit.audit_query_plans()
+    assert not failures, '\n'.join(f'{description}: {plan}' for description, plan in failures)
+
+
+def test_audit_covers_every_filter(fixit, app_context):
+    combinations = list(fixit.dashboard_filter_combinations())
+    assert {c[0] for c in combinations} == {'', 'olio', '42'}
+    assert {c[1] for c in combinations} == {'', 'NUOVO', 'IN_LAVORAZIONE', 'RISOLTO'}
+    assert {c[2] for c in combinations} == {'', 'unassigned', '1'}
+    assert ('', '', '', True) in combinations  # archive=1 flag
+    assert ('olio', 'RISOLTO', '', True) in combinations
+
+
+def test_table_scan_is_reported(fixit, app_context):
+    # No index on description: the audit must flag it
+    query = fixit.Ticket.query.filter(fixit.Ticket.description == 'x').order_by(fixit.Ticket.priority)
+    problems = fixit.plan_problems(fixit.explain_query_plan(query))
+    assert any(p.startswith('SCAN tickets') for p in problems)
+    assert any('TEMP B-TREE' in p for p in problems)
@@ -0,0 +1,31 @@
+"""The SQLite rate limit storage keeps one count for all worker processes."""
+
+import multiprocessing
+
+import pytest
+
+import support
+
+PROCESSES = 4
+ATTEMPTS = 25  # per process
+LIMIT = 30
+
+
+@pytest.mark.parametrize('strategy', ['sliding-window-counter', 'fixed-window'])
+def test_limit_is_shared_by_processes(tmp_path, strategy):
+    storage_uri = f"sqlite:///{tmp_path / 'ratelimit.db'}"
+    ctx = multiprocessing.get_context('spawn')
+    start = ctx.Barrier(PROCESSES + 1)  # every process ready before the first hit
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=support.ratelimit_hits, args=(storage_uri, strategy, LIMIT, ATTEMPTS, start, results))
+        for _ in range(PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    start.wait(timeout=60)
+    admitted = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join()
+
+    assert sum(admitted) == LIMIT
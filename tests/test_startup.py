@@ -0,0 +1,30 @@
+"""Worker boots skip init_db only while the schema matches the configuration."""
+
+import multiprocessing
+
+import support
+
+
+def boot(env, **settings):
+    """Dashboard status and whether init_db ran, in a fresh process booted with `settings`"""
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    process = ctx.Process(target=support.boot_and_open_dashboard, args=({**env, **settings}, results))
+    process.start()
+    result = results.get(timeout=60)
+    process.join()
+    return result
+
+
+def test_enabling_live_updates_between_boots_creates_the_change_log(tmp_path):
+    env = support.app_environment(str(tmp_path))
+    assert boot(env, LIVE_UPDATES_ENABLED='False') == (200, True)
+    assert boot(env, LIVE_UPDATES_ENABLED='False') == (200, False)  # unchanged: init_db skipped
+    assert boot(env, LIVE_UPDATES_ENABLED='True') == (200, True)
+    assert boot(env, LIVE_UPDATES_ENABLED='True') == (200, False)
+
+
+def test_enabling_search_index_between_boots_creates_it(tmp_path):
+    env = support.app_environment(str(tmp_path))
+    assert boot(env, SEARCH_FTS_ENABLED='False') == (200, True)
+    assert boot(env, SEARCH_FTS_ENABLED='True') == (200, True)
@@ -0,0 +1,44 @@
+"""Rejected uploads: JSON errors for background/API requests, flash and redirect for forms."""
+
+import io
+
+import pytest
+
+TICKET = {
+    'requester_name': 'Test upload', 'vehicle_type': 'Ralla', 'vehicle_number': 'RL-1',
+    'anomaly_category': 'Carrozzeria', 'description': 'Foto allegata',
+}
+PNG_HEAD = b'\x89PNG\r\n\x1a\n'
+
+
+def post_ticket(client, image, **kwargs):
+    return client.post('/new/mezzi', data={**TICKET, 'image': (io.BytesIO(image), 'foto.png')}, **kwargs)
+
+
+@pytest.fixture
+def small_uploads(fixit, monkeypatch):
+    monkeypatch.setitem(fixit.app.config, 'MAX_CONTENT_LENGTH', 1024)
+
+
+def test_too_large_is_json_for_background_submit(client, small_uploads):
+    response = post_ticket(client, PNG_HEAD + b'\0' * 4096, headers={'Accept': 'application/json'})
+    assert response.status_code == 413
+    assert response.is_json and 'troppo grande' in response.get_json()['error']
+
+
+def test_too_large_is_json_under_api(client, small_uploads):
+    response = client.post('/api/v1/tickets/batch', data=b'x' * 4096, content_type='application/octet-stream')
+    assert response.status_code == 413
+    assert response.is_json
+
+
+def test_too_large_redirects_html_form(client, small_uploads):
+    response = post_ticket(client, PNG_HEAD + b'\0' * 4096, headers={'Accept': 'text/html'})
+    assert response.status_code == 302
+    assert response.location.endswith('/new/mezzi')
+
+
+def test_not_an_image_is_json_for_background_submit(client):
+    response = post_ticket(client, b'GIF89a not a png', headers={'Accept': 'application/json'})
+    assert response.status_code == 415
+    assert response.is_json
@@ -0,0 +1,146 @@
+"""
+Streaming validation and content-addressed storage of uploaded images.
+
+Werkzeug writes every multipart file part into the stream returned by
+`Request._get_file_stream`. `UploadRequest` returns an `UploadSink` there,
+so each chunk is checked while the body is being read:
+
+- the first bytes must be a known image signature (JPEG/PNG), whatever
+  extension the client claims;
+- the per-type size limit is enforced chunk by chunk;
+- the SHA-256 of the content is computed incrementally;
+- data goes straight to a temp file inside the upload folder.
+
+Bad or oversized files raise 415/413 after the first chunk that proves it,
+instead of after the whole body has been spooled. `store_upload` then
+renames the temp file atomically to `<sha[:2]>/<sha>.<ext>`, so identical
+photos are stored once.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+INCOMING_DIR = '.incoming'
+
+# (signature, type, stored extension)
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpeg', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png', 'png'),
+]
+_SNIFF_BYTES = max(len(signature) for signature, _, _ in SIGNATURES)
+
+
+def sniff_image_type(head):
+    """Return (type, extension) for the leading bytes of a file, or (None, None)"""
+    for signature, image_type, extension in SIGNATURES:
+        if head.startswith(signature):
+            return image_type, extension
+    return None, None
+
+
+class UploadSink:
+    """Writable/readable file object validating an upload while it streams in"""
+
+    def __init__(self, upload_folder, size_limits):
+        self.size_limits = size_limits
+        self.incoming_folder = os.path.join(upload_folder, INCOMING_DIR)
+        os.makedirs(self.incoming_folder, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=self.incoming_folder, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self._head = b''
+        self.size = 0
+        self.image_type = None
+        self.extension = None
+
+    def write(self, data):
+        if self.image_type is None and len(self._head) < _SNIFF_BYTES:
+            self._head += data[:_SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= _SNIFF_BYTES:
+                self.image_type, self.extension = sniff_image_type(self._head)
+                if self.image_type is None:
+                    self.discard()
+                    raise UnsupportedMediaType('Formato immagine non supportato (solo JPG e PNG).')
+        self.size += len(data)
+        if self.image_type is not None and self.size > self.size_limits.get(self.image_type, 0):
+            self.discard()
+            raise RequestEntityTooLarge('Immagine troppo grande.')
+        self._hash.update(data)
+        self._file.write(data)
+        return len(data)
+
+    @property
+    def is_valid(self):
+        return self.image_type is not None and self.size > 0
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    # File interface used by Werkzeug's FileStorage
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def readline(self, *args):
+        return self._file.readline(*args)
+
+    def flush(self):
+        self._file.flush()
+
+    def discard(self):
+        """Close and delete the temp file"""
+        if not self._file.closed:
+            self._file.close()
+        if self.temp_path and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        self.temp_path = None
+
+    def close(self):
+        self.discard()
+
+
+class UploadRequest(Request):
+    """Request class streaming file parts into an UploadSink"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        return UploadSink(config['UPLOAD_FOLDER'], config['UPLOAD_SIZE_LIMITS'])
+
+
+def store_upload(file_storage, upload_folder):
+    """Move a validated upload into its content-addressed location.
+
+    Returns (relative filename, created) or (None, False) when there is no
+    usable image. `created` is False when identical content was already
+    stored (deduplicated).
+    """
+    sink = getattr(file_storage, 'stream', None)
+    if not isinstance(sink, UploadSink) or sink.temp_path is None:
+        return None, False
+    if not sink.is_valid:
+        sink.discard()
+        return None, False
+
+    digest = sink.sha256
+    relative = f'{digest[:2]}/{digest}.{sink.extension}'
+    target = os.path.join(upload_folder, relative)
+    sink.flush()
+    os.fsync(sink._file.fileno())
+    if os.path.exists(target):
+        sink.discard()
+        return relative, False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    sink._file.close()
+    os.replace(sink.temp_path, target)
+    sink.temp_path = None
+    return relative, True
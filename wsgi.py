@@ -2,15 +2,24 @@
 WSGI entry point for production deployment.
 
 Usage with Gunicorn:
-    gunicorn wsgi:app -b 0.0.0.0:8000 -w 1
+    gunicorn wsgi:app -b 0.0.0.0:8000 -w 3 --preload
+
+The schema and the default admin are created by `flask --app app init-db`
+(or on the first boot, see `ensure_database`); later boots only check the
+schema fingerprint. Templates are loaded here too, from the bytecode written
+by `flask --app app precompile-templates`. With --preload the app is
+imported once in the master and the workers are forked from it.
 
 See DEPLOY.md for full deployment guide.
 """
 
-from app import app, init_db
+from app import app, ensure_database, precompile_templates
+
+# First run or model change: initialize tables and default admin user (once, not per worker)
+ensure_database()
 
-# Initialize database tables and default admin user on startup
-init_db()
+# Load all templates before serving (compiled only if missing from TEMPLATE_CACHE_DIR)
+precompile_templates()
 
 if __name__ == '__main__':
     app.run()